@@ -0,0 +1,33 @@
+"""files soft delete indexes and archive
+
+Revision ID: 3f1d2b7a9c4e
+Revises: c9a1ca69a509
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from utils.orm_utils.migrations import (
+    create_archive_table, drop_archive_table, create_deleted_index, drop_deleted_index
+)
+
+# revision identifiers, used by Alembic.
+revision = '3f1d2b7a9c4e'
+down_revision = 'c9a1ca69a509'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        create_deleted_index('files', concurrently=True)
+
+    create_archive_table('files')
+
+
+def downgrade():
+    drop_archive_table('files')
+
+    with op.get_context().autocommit_block():
+        drop_deleted_index('files', concurrently=True)
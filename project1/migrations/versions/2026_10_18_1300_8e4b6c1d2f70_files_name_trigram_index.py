@@ -0,0 +1,27 @@
+"""files name trigram index
+
+Revision ID: 8e4b6c1d2f70
+Revises: 3f1d2b7a9c4e
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from utils.orm_utils.migrations import create_trigram_indexes, drop_trigram_indexes
+
+# revision identifiers, used by Alembic.
+revision = '8e4b6c1d2f70'
+down_revision = '3f1d2b7a9c4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        create_trigram_indexes('files', ['name'], concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        drop_trigram_indexes('files', ['name'], concurrently=True)
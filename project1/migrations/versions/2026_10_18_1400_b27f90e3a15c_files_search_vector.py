@@ -0,0 +1,31 @@
+"""files search vector
+
+Revision ID: b27f90e3a15c
+Revises: 8e4b6c1d2f70
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from utils.orm_utils.migrations import add_search_vector, drop_search_vector, create_search_index, drop_search_index
+
+# revision identifiers, used by Alembic.
+revision = 'b27f90e3a15c'
+down_revision = '8e4b6c1d2f70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_search_vector('files', ['name'])
+
+    with op.get_context().autocommit_block():
+        create_search_index('files', concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        drop_search_index('files', concurrently=True)
+
+    drop_search_vector('files')
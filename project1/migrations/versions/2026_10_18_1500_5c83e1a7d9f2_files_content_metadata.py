@@ -0,0 +1,31 @@
+"""files content metadata
+
+Revision ID: 5c83e1a7d9f2
+Revises: b27f90e3a15c
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5c83e1a7d9f2'
+down_revision = 'b27f90e3a15c'
+branch_labels = None
+depends_on = None
+
+# архивная таблица создана через LIKE files, новые столбцы в неё нужно добавлять отдельно
+TABLES = ['files', 'files_archive']
+
+
+def upgrade():
+    # у существующих файлов метаданные пустые, валидаторы для них берутся из stat файла
+    for table_name in TABLES:
+        op.add_column(table_name, sa.Column('size', sa.BigInteger(), nullable=True))
+        op.add_column(table_name, sa.Column('digest', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    for table_name in TABLES:
+        op.drop_column(table_name, 'digest')
+        op.drop_column(table_name, 'size')
@@ -0,0 +1,37 @@
+"""file blobs
+
+Revision ID: d41f6b2e8a07
+Revises: 5c83e1a7d9f2
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd41f6b2e8a07'
+down_revision = '5c83e1a7d9f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'file_blobs',
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('path', sa.Text(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('digest', name=op.f('pk_file_blobs'))
+    )
+
+    for table_name in ['files', 'files_archive']:
+        op.add_column(table_name, sa.Column('extension', sa.Text(), nullable=True))
+
+
+def downgrade():
+    for table_name in ['files', 'files_archive']:
+        op.drop_column(table_name, 'extension')
+
+    op.drop_table('file_blobs')
@@ -0,0 +1,34 @@
+"""upload sessions
+
+Revision ID: 7a9e2c4f1b36
+Revises: d41f6b2e8a07
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '7a9e2c4f1b36'
+down_revision = 'd41f6b2e8a07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'upload_sessions',
+        sa.Column('id', postgresql.UUID(), server_default=sa.text('uuid_generate_v4()'), nullable=False),
+        sa.Column('filename', sa.Text(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('part_size', sa.Integer(), nullable=False),
+        sa.Column('received_parts', postgresql.ARRAY(sa.Integer()), server_default='{}', nullable=False),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_upload_sessions'))
+    )
+
+
+def downgrade():
+    op.drop_table('upload_sessions')
@@ -0,0 +1,32 @@
+"""storage roots
+
+Revision ID: e6c4a9d3b512
+Revises: 7a9e2c4f1b36
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e6c4a9d3b512'
+down_revision = '7a9e2c4f1b36'
+branch_labels = None
+depends_on = None
+
+# существующие файлы находятся в config.file_path (каталог 'default')
+TABLES = ['files', 'files_archive', 'file_blobs', 'upload_sessions']
+
+
+def upgrade():
+    # столбец с постоянным значением по умолчанию добавляется без перезаписи таблицы
+    for table_name in TABLES:
+        op.add_column(table_name, sa.Column('storage_root', sa.Text(), server_default='default', nullable=False))
+
+    # у архивных таблиц нет значений по умолчанию, строки копируются из основной таблицы
+    op.alter_column('files_archive', 'storage_root', server_default=None)
+
+
+def downgrade():
+    for table_name in TABLES:
+        op.drop_column(table_name, 'storage_root')
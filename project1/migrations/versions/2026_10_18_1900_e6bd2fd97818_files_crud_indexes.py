@@ -0,0 +1,39 @@
+"""files crud indexes
+
+Revision ID: e6bd2fd97818
+Revises: e6c4a9d3b512
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from utils.orm_utils.softdelete import NOT_DELETED_CONDITION
+
+# revision identifiers, used by Alembic.
+revision = 'e6bd2fd97818'
+down_revision = 'e6c4a9d3b512'
+branch_labels = None
+depends_on = None
+
+# сгенерировано ``python -m core.crud.index_advisor`` по сортировкам и фильтрам file_crud
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_files_name_id_not_deleted', 'files', ['name', 'id'],
+                        postgresql_where=sa.text(NOT_DELETED_CONDITION), postgresql_concurrently=True)
+        op.create_index('ix_files_created_at_id_not_deleted', 'files', ['created_at', 'id'],
+                        postgresql_where=sa.text(NOT_DELETED_CONDITION), postgresql_concurrently=True)
+        op.create_index('ix_files_created_by_id_not_deleted', 'files', ['created_by', 'id'],
+                        postgresql_where=sa.text(NOT_DELETED_CONDITION), postgresql_concurrently=True)
+        op.create_index('ix_files_size_id_not_deleted', 'files', ['size', 'id'],
+                        postgresql_where=sa.text(NOT_DELETED_CONDITION), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_files_name_id_not_deleted', table_name='files', postgresql_concurrently=True)
+        op.drop_index('ix_files_created_at_id_not_deleted', table_name='files', postgresql_concurrently=True)
+        op.drop_index('ix_files_created_by_id_not_deleted', table_name='files', postgresql_concurrently=True)
+        op.drop_index('ix_files_size_id_not_deleted', table_name='files', postgresql_concurrently=True)
@@ -0,0 +1,31 @@
+"""files composite sorting index
+
+Revision ID: 6617422541c7
+Revises: e6bd2fd97818
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from utils.orm_utils.softdelete import NOT_DELETED_CONDITION
+
+# revision identifiers, used by Alembic.
+revision = '6617422541c7'
+down_revision = 'e6bd2fd97818'
+branch_labels = None
+depends_on = None
+
+# сгенерировано ``python -m core.crud.index_advisor`` по ``indexed_sortings`` file_crud
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_files_created_by_created_at_id_not_deleted', 'files', ['created_by', 'created_at', 'id'],
+                        postgresql_where=sa.text(NOT_DELETED_CONDITION), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_files_created_by_created_at_id_not_deleted', table_name='files',
+                      postgresql_concurrently=True)
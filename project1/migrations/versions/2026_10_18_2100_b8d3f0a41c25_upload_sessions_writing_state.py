@@ -0,0 +1,25 @@
+"""upload sessions writing state
+
+Revision ID: b8d3f0a41c25
+Revises: 6617422541c7
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b8d3f0a41c25'
+down_revision = '6617422541c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('upload_sessions', sa.Column('writing_parts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('upload_sessions', sa.Column('completing', sa.Boolean(), server_default='false', nullable=False))
+
+
+def downgrade():
+    op.drop_column('upload_sessions', 'completing')
+    op.drop_column('upload_sessions', 'writing_parts')
@@ -0,0 +1,116 @@
+"""
+Сравнение приёма загрузок: ``UploadFile`` + ``FileHandler.save_file`` против потокового
+``internals.uploads.receive_file``. Запись в обоих случаях идёт через ``StreamingFileWriter``, разница – в
+промежуточном временном файле ``UploadFile``. Тело запроса подаётся напрямую через ASGI ``receive`` блоками
+по 64КБ (как у uvicorn), сеть и БД не участвуют.
+
+Запуск (из ``src``)::
+
+    python -m benchmarks.upload --size-mb 50 --runs 5
+"""
+import argparse
+import asyncio
+import os
+import pathlib
+import tempfile
+import time
+import uuid
+from typing import Awaitable, Callable
+
+from starlette.requests import Request
+
+from core.config import StorageRoot
+from internals.files import FileHandler
+from internals.uploads import receive_file, UPLOAD_FIELD_NAME
+from schemas.auth import UserJWTInfo
+
+ASGI_CHUNK_SIZE = 64 * 1024
+BOUNDARY = uuid.uuid4().hex
+
+
+def multipart_body(size: int) -> bytes:
+    return b''.join([
+        f'--{BOUNDARY}\r\n'.encode(),
+        f'Content-Disposition: form-data; name="{UPLOAD_FIELD_NAME}"; filename="benchmark.bin"\r\n'.encode(),
+        b'Content-Type: application/octet-stream\r\n\r\n',
+        os.urandom(size),
+        f'\r\n--{BOUNDARY}--\r\n'.encode(),
+    ])
+
+
+def make_request(body: bytes) -> Request:
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': '/files/upload',
+        'headers': [
+            (b'content-type', f'multipart/form-data; boundary={BOUNDARY}'.encode()),
+            (b'content-length', str(len(body)).encode()),
+        ],
+    }
+    chunks = iter(range(0, len(body), ASGI_CHUNK_SIZE))
+
+    async def receive():
+        offset = next(chunks, None)
+        if offset is None:
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        end = offset + ASGI_CHUNK_SIZE
+        return {'type': 'http.request', 'body': body[offset:end], 'more_body': end < len(body)}
+
+    return Request(scope, receive)
+
+
+async def upload_file_pipeline(request: Request, directory: pathlib.Path):
+    form = await request.form()
+    await FileHandler.save_file(
+        form[UPLOAD_FIELD_NAME], UserJWTInfo(id=-1), path=directory / uuid.uuid4().hex, orig_name='benchmark',
+        root=StorageRoot(name='benchmark', path=directory)
+    )
+    await form.close()
+
+
+async def streaming_pipeline(request: Request, directory: pathlib.Path):
+    await receive_file(request, lambda filename: directory / uuid.uuid4().hex)
+
+
+async def measure(
+        pipeline: Callable[[Request, pathlib.Path], Awaitable],
+        body: bytes,
+        directory: pathlib.Path,
+        runs: int
+) -> tuple[float, float]:
+    """
+    :return: время и процессорное время (всех потоков процесса) на одну загрузку
+    """
+    wall, cpu = 0., 0.
+    for _ in range(runs):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        await pipeline(make_request(body), directory)
+        wall += time.perf_counter() - wall_start
+        cpu += time.process_time() - cpu_start
+
+        for path in directory.iterdir():
+            path.unlink()
+
+    return wall / runs, cpu / runs
+
+
+async def main(args: argparse.Namespace):
+    body = multipart_body(args.size_mb * 1024 * 1024)
+    pipelines = {'UploadFile + save_file': upload_file_pipeline, 'streaming receive_file': streaming_pipeline}
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        print(f'{args.size_mb}MB upload, {args.runs} runs')
+        for name, pipeline in pipelines.items():
+            wall, cpu = await measure(pipeline, body, pathlib.Path(directory), args.runs)
+            print(f'{name:>24}: {args.size_mb / wall:8.1f} MB/s, CPU {cpu * 1000:8.1f} ms per upload '
+                  f'({cpu * 1000 / args.size_mb:.2f} ms/MB)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark file upload pipelines')
+    parser.add_argument('--size-mb', type=int, default=50, help='uploaded file size')
+    parser.add_argument('--runs', type=int, default=5, help='uploads per pipeline')
+    parser.add_argument('--dir', default=None, help='directory for written files (defaults to system temp)')
+
+    asyncio.run(main(parser.parse_args()))
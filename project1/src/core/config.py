@@ -1,4 +1,6 @@
+import enum
 import pathlib
+from typing import Optional
 from urllib import parse
 
 import pydantic
@@ -29,14 +31,87 @@ class DBConfig(BaseSettings):
         return f'postgresql+asyncpg://{db_user}:{parse.quote(db_password)}@{db_host}:{db_port}/{db_name}'
 
 
+class DownloadMode(str, enum.Enum):
+    """
+    Способ отдачи содержимого файлов
+    """
+    # чтение файла и отправка блоками через event loop
+    stream = 'stream'
+    # os.sendfile средствами ASGI сервера (расширение http.response.zerocopysend), иначе как stream
+    sendfile = 'sendfile'
+    # файл отдаёт фронтовой nginx по заголовку X-Accel-Redirect
+    x_accel_redirect = 'x_accel_redirect'
+    # файл отдаёт фронтовой веб-сервер (apache mod_xsendfile, lighttpd) по заголовку X-Sendfile
+    x_sendfile = 'x_sendfile'
+
+
+class FileStorageMode(str, enum.Enum):
+    """
+    Способ хранения загруженных файлов
+    """
+    # отдельный файл на каждую загрузку
+    unique = 'unique'
+    # один файл на каждое уникальное содержимое (по sha256), повторная загрузка только добавляет запись в БД
+    content_addressed = 'content_addressed'
+
+
+class FileLayout(str, enum.Enum):
+    """
+    Раскладка файлов по каталогам внутри каталога пользователя
+    """
+    # все файлы пользователя в одном каталоге
+    flat = 'flat'
+    # подкаталоги по префиксам хэша имени файла (file_shard_levels уровней по file_shard_width символов)
+    sharded = 'sharded'
+
+
+# каталог хранилища config.file_path (в нём все файлы, загруженные до появления нескольких каталогов)
+DEFAULT_STORAGE_ROOT = 'default'
+
+
+class StorageRoot(pydantic.BaseModel):
+    """
+    Каталог хранилища файлов (см. ``internals.storage``)
+    """
+    name: str
+    path: pathlib.Path
+    # доля новых файлов относительно других каталогов; 0 – новые файлы не пишутся (например, перед выводом диска)
+    weight: float = 1
+    # свободное место, при котором новые файлы в каталог больше не пишутся
+    reserved_bytes: int = 1024 ** 3
+    # internal location nginx, отдающий файлы каталога (для DownloadMode.x_accel_redirect)
+    accel_redirect_prefix: Optional[str] = None
+
+
 class Config(DBConfig):
     host: str = '127.0.0.1'
     port: int
 
     max_file_size: int = 50_000_000  # ~50mb with default
     file_path: pathlib.Path = pathlib.Path('../files')
+    # дополнительные каталоги хранилища, json: [{"name": "disk2", "path": "/mnt/disk2/files", "weight": 2}].
+    # file_path – каталог DEFAULT_STORAGE_ROOT, если он не описан здесь явно (например, чтобы задать ему вес)
+    file_roots: list[StorageRoot] = []
+    file_storage_mode: FileStorageMode = FileStorageMode.unique
+    # после смены раскладки существующие файлы переносятся через python -m internals.file_layout
+    file_layout: FileLayout = FileLayout.flat
+    file_shard_levels: int = 2
+    file_shard_width: int = 2
+    # загрузка частями (/files/uploads): размер части и время жизни незавершённой загрузки
+    upload_part_size: int = 8 * 1024 * 1024
+    upload_session_ttl_hours: int = 24
+    file_download_mode: DownloadMode = DownloadMode.stream
+    # internal location nginx, отдающий файлы из file_path (для DownloadMode.x_accel_redirect)
+    # (для остальных каталогов – StorageRoot.accel_redirect_prefix или <prefix>-<name>/)
+    file_accel_redirect_prefix: str = '/protected-files/'
 
     cors_policy_enabled: bool = 'True'
+    # канал postgres LISTEN/NOTIFY для инвалидации кэша сущностей между воркерами
+    cache_invalidation_channel: str = 'entity_invalidation'
+    entity_cache_ttl: float = 60
+    # мягко удалённые записи старше указанного срока переносятся в архивные таблицы (internals.archive)
+    archive_retention_days: int = 30
+    archive_batch_size: int = 1000
     is_testing: bool = False
 
     class Config:
@@ -1,8 +1,10 @@
 from typing import Type
 
+from sqlalchemy import insert, delete
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
-from core.crud.retrieve import retrieve_batch, refresh_collection
+from core.crud.retrieve import retrieve_batch, diff_collection
 from core.crud.types import Entity
 from models import Base, File
 from schemas.base import Model
@@ -20,22 +22,31 @@ class AttachedFilesMixin:
             entity_id_column_name: str,
             relation_name: str = 'files'
     ):
-        await retrieve_batch(session, File, {i.id for i in getattr(data, relation_name)})
-        await load_property(session, obj, {secondary_relation_name, relation_name})
-
-        def create_secondary(**params):
-            secondary_params = {'file_id': params['id'], entity_id_column_name: obj.id}
-            return relation(**secondary_params)
-
-        val = await refresh_collection(
-            session,
-            obj.files,
-            data.files,
-            relation,
-            secondary_relation_base_obj_name='file',
-            creation_func=create_secondary
-        )
-        setattr(obj, relation_name, val)
-
-        await session.flush()
-        session.expire(obj, {relation_name})
+        """
+        Актуализация прикреплённых к сущности файлов.
+
+        Разница между текущими и переданными файлами вычисляется за линейное время, после чего
+        удалённые связи удаляются одним ``DELETE``, а новые добавляются одним ``INSERT``.
+        Сами файлы загружаются одним запросом (он же проверяет их существование)
+        """
+        arrived = getattr(data, relation_name)
+        files = await retrieve_batch(session, File, {i.id for i in arrived})
+        await load_property(session, obj, {relation_name})
+
+        diff = diff_collection(getattr(obj, relation_name), arrived)
+
+        entity_id_column = getattr(relation, entity_id_column_name)
+        if diff.removed:
+            await session.execute(
+                delete(relation)
+                .where(entity_id_column == obj.id, relation.file_id.in_([i.id for i in diff.removed]))
+                .execution_options(synchronize_session=False)
+            )
+        if diff.added:
+            await session.execute(
+                insert(relation).values([{'file_id': i.id, entity_id_column_name: obj.id} for i in diff.added])
+            )
+
+        # связи уже записаны в БД, поэтому коллекция выставляется без отслеживания изменений ORM'ом
+        set_committed_value(obj, relation_name, [*diff.kept, *[files[i.id] for i in diff.added]])
+        session.expire(obj, {secondary_relation_name})
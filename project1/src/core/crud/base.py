@@ -1,25 +1,39 @@
+import json
 import logging
+import math
 import re
-from typing import Type, Any, Generic, Callable, Iterable, Optional
+from datetime import datetime
+from typing import Type, Any, Generic, Callable, Iterable, Optional, AsyncIterator, Collection, Sequence
 
 import sqlalchemy
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, bindparam
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import InstrumentedAttribute
-from sqlalchemy.sql import Select
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import Select, ColumnElement, Insert, Update
 
+from core.crud.cache import EntityCache, invalidate_written
 from core.crud.exceptions import LogicException
 from core.crud.filters import AbstractFilter
-from core.crud.retrieve import retrieve_object, pagination
-from core.crud.types import Entity, Count
+from core.crud.keyset import Keyset
+from core.crud.loader import get_loader
+from core.crud.retrieve import retrieve_object, pagination, stream, ESTIMATE_EXACT_THRESHOLD, DEFAULT_YIELD_PER
+from core.crud.types import Entity, Page, PaginationMode, CountStrategy, Count, Id
 
 from schemas.base import Model
+from utils.cache import TTLCache
+from utils.orm_utils.softdelete import SoftDeleteMixin
+from utils.utils import chunked
 
 # sorting params
 from utils.string_utils import to_snake
 
 SortingFunctionType = Callable[[Select, Entity], str]
 SortingElementsType = Iterable[str | tuple[str, SortingFunctionType]]
+# ключ сортировки (с необязательным префиксом направления ``-``/``+``) или пара (ключ, по убыванию)
+SortKey = str | tuple[str, bool]
+SortingParam = str | Sequence[SortKey]
 
 CollectingKey = str | tuple[str, ...]
 CollectingFunctionType = Callable[[Select, Entity, Optional[Any]], Any]
@@ -31,38 +45,116 @@ FilterFunctionType = Callable[[Select, Entity, FilterValue], Select]
 FilterElementsType = Iterable[CollectingKey | tuple[CollectingKey, FilterFunctionType]]
 
 
+# все созданные CRUD'ы (например, для подбора индексов под их сортировки и фильтры)
+crud_instances: list['BaseCrud'] = list()
+
+
+def _inserted_as_null(column: sqlalchemy.Column) -> bool:
+    """
+    Получает ли столбец NULL, если его значение не передано в INSERT
+    """
+    return (
+        column.nullable
+        and column.default is None
+        and column.server_default is None
+        and column.computed is None
+        and column.identity is None
+    )
+
+
 # noinspection PyMethodMayBeStatic
 class BaseCrud(Generic[Entity]):
+    # поля, которые ``upsert`` не перезаписывает у существующих записей
+    upsert_immutable_fields: set[str] = set()
+
     def __init__(
             self, entity: Type[Entity],
             get_options: list[Any] = None,
             get_multi_options: list[Any] = None,
             sorting_by: SortingElementsType = None,
             filtering_by: SortingElementsType = None,
+            count_strategy: CountStrategy = CountStrategy.window,
+            count_cache_ttl: float = 30,
+            count_estimate_threshold: int = ESTIMATE_EXACT_THRESHOLD,
+            batch_get: bool = True,
+            cache: EntityCache = None,
+            bulk_batch_size: int = 500,
+            upsert_conflict_target: Iterable[str] = ('id',),
+            query_cache_size: int = 256,
+            indexed_sortings: Iterable[SortingParam] = None,
 
     ):
+        """
+        :param count_strategy: способ подсчёта общего кол-ва элементов в ``get_multi`` по умолчанию
+        :param count_cache_ttl: время жизни закэшированного кол-ва элементов для ``CountStrategy.cached``
+        :param count_estimate_threshold: для ``CountStrategy.estimate`` – оценка кол-ва, ниже которой
+                                         всё же выполняется точный подсчёт
+        :param batch_get: объединять ли вызовы ``get`` в рамках одной итерации event loop'а в один запрос
+        :param cache: read-through кэш сущностей для ``get``. Связи, указанные в ``get_options``,
+                      для сущностей из кэша не загружаются заранее
+        :param bulk_batch_size: кол-во строк в одном запросе для ``create_many``/``update_many``/``delete_many``
+        :param upsert_conflict_target: столбцы уникального индекса, по которому ``upsert`` определяет
+                                       существующую запись (по умолчанию первичный ключ)
+        :param query_cache_size: кол-во запросов ``get_multi``, построенных для разных наборов фильтров
+                                 и сортировок, которые хранятся для повторного использования
+        :param indexed_sortings: сортировки по нескольким ключам (например, ``'created_by,-created_at'``),
+                                 для которых ``index_columns`` предлагает составной индекс по всем ключам
+        """
         self.get_options = get_options or []
         self.get_multi_options = get_multi_options or []
         self.entity = entity
 
         self.sort_fields = self._register_sorting(sorting_by) if sorting_by else dict()
         self.filter_fields = self._register_filtering(filtering_by) if filtering_by else dict()
+        self.indexed_sortings = [self._parse_sorting(sorting) for sorting in indexed_sortings or ()]
+
+        self.count_strategy = count_strategy
+        self.count_estimate_threshold = count_estimate_threshold
+        self.count_cache: TTLCache[str, Count] = TTLCache(ttl=count_cache_ttl)
+        self.batch_get = batch_get
+        self.cache = cache
+        self.bulk_batch_size = bulk_batch_size
+        self.upsert_conflict_target = tuple(upsert_conflict_target)
+        self.query_cache: TTLCache[tuple, tuple[Select, Keyset | None]] = TTLCache(
+            max_size=query_cache_size, ttl=math.inf
+        )
 
         self.logger = logging.getLogger(to_snake(self.__class__.__name__))
 
+        crud_instances.append(self)
+
     async def get(
             self,
             session: AsyncSession,
             id: int,
             execution_options: dict[str, Any] = None
     ) -> Entity | None:
-        obj = await retrieve_object(
-            session,
-            self.entity,
-            id,
-            options=self.get_options,
-            execution_options=execution_options
-        )
+        """
+        Получение сущности по идентификатору
+
+        При ``batch_get`` одновременные вызовы (например, через ``asyncio.gather``) в рамках одной сессии
+        выполняются одним ``IN (...)`` запросом. Вызовы с ``execution_options`` выполняются отдельно
+        и в обход кэша
+
+        :raise ObjectNotExists: если сущность не найдена
+        """
+        use_cache = self.cache is not None and not execution_options
+        if use_cache and (obj := self.cache.get(session, id)) is not None:
+            return obj
+
+        if self.batch_get and not execution_options:
+            obj = await get_loader(session, self, self.entity, self.get_options).load(id)
+        else:
+            obj = await retrieve_object(
+                session,
+                self.entity,
+                id,
+                options=self.get_options,
+                execution_options=execution_options
+            )
+
+        if use_cache:
+            self.cache.put(obj)
 
         return obj
 
@@ -73,36 +165,178 @@ class BaseCrud(Generic[Entity]):
             per_page: int,
             with_count: bool = True,
             with_deleted: bool = False,
-            sort_by: str = 'id',
+            sort_by: SortingParam = 'id',
             descending: bool = False,
             execution_options: dict[str, Any] = None,
+            pagination_mode: PaginationMode = PaginationMode.offset,
+            cursor: str = None,
+            count_strategy: CountStrategy = None,
             **filters
-    ) -> tuple[list[Entity], Count | None]:
-        query: Select = select(self.entity) \
-            .options(*self.get_multi_options) \
-            .execution_options(**(execution_options or {}))
+    ) -> Page:
+        """
+        Постраничное получение сущностей с фильтрацией и сортировкой
 
-        try:
-            query = self._apply_filtering(query, **filters)
-        except (ValueError, TypeError):
-            raise LogicException('Failed to apply filter')
+        ``sort_by`` – ключ или упорядоченный перечень ключей сортировки (см. ``_parse_sorting``),
+        ``descending`` – направление для ключей, у которых оно не указано явно.
 
-        try:
-            query = self._apply_sorting(query, sort_by, descending)
-        except (ValueError, TypeError):
-            raise LogicException('Failed to apply sorting')
+        В режиме ``PaginationMode.cursor`` номер страницы игнорируется: следующая страница запрашивается
+        по курсору ``next_cursor`` из результата предыдущей, а к ключам сортировки в качестве
+        разрешающего неоднозначность добавляется ``id``. Фильтры, сортирующие выборку по релевантности
+        (``LevenshteinFilter``, ``ranked`` ``TrigramFilter``/``FullTextFilter``), в этом режиме не поддерживаются.
 
-        objects, count = await pagination(
+        ``count_strategy`` переопределяет способ подсчёта общего кол-ва элементов, указанный для CRUD'a.
+        Если кол-во было оценено, а не посчитано, в результате будет ``total_is_exact=False``.
+        """
+        filter_params = self._process_filter_params(filters)
+        query, keyset, params = self._get_multi_query(
+            execution_options, sort_by, descending, pagination_mode, filter_params
+        )
+
+        cursor_values = None
+        if keyset is not None and cursor:
+            try:
+                cursor_values = keyset.decode(cursor)
+            except ValueError as e:
+                raise LogicException(f'Invalid cursor: {e}')
+
+        return await pagination(
             session,
             self.entity,
             page,
             per_page,
             with_count,
             with_deleted,
-            query
+            query,
+            keyset=keyset,
+            cursor=cursor_values,
+            count_strategy=count_strategy or self.count_strategy,
+            count_cache=self.count_cache,
+            count_cache_key=self._count_cache_key(with_deleted, filter_params),
+            estimate_threshold=self.count_estimate_threshold,
+            params=params
+        )
+
+    async def stream_multi(
+            self,
+            session: AsyncSession,
+            with_deleted: bool = False,
+            sort_by: SortingParam = 'id',
+            descending: bool = False,
+            yield_per: int = DEFAULT_YIELD_PER,
+            execution_options: dict[str, Any] = None,
+            **filters
+    ) -> AsyncIterator[Entity]:
+        """
+        Потоковое получение всех сущностей с фильтрацией и сортировкой (для выгрузок без пагинации)
+
+        Строки читаются через server-side курсор пачками по ``yield_per``, поэтому потребление памяти
+        не зависит от размера выборки. ``get_multi_options`` с ``joinedload`` коллекций несовместимы
+        с потоковым чтением – для них следует использовать ``selectinload``.
+        """
+        query, _, params = self._get_multi_query(
+            execution_options, sort_by, descending, PaginationMode.offset, self._process_filter_params(filters)
+        )
+
+        async for obj in stream(session, self.entity, query, with_deleted, yield_per, params):
+            yield obj
+
+    def _get_multi_query(
+            self,
+            execution_options: dict[str, Any] | None,
+            sort_by: SortingParam,
+            descending: bool,
+            pagination_mode: PaginationMode,
+            filter_params: dict[str, Any]
+    ) -> tuple[Select, Keyset | None, dict[str, Any]]:
+        """
+        Запрос выборки с применёнными фильтрами и сортировкой и значения его параметров.
+
+        Запрос строится с параметрами-заглушками (``bindparam``) один раз для каждой формы запроса:
+        набора переданных фильтров, ключей и направлений сортировки, режима пагинации. Затем он берётся
+        из ``query_cache``, и на каждый вызов остаётся только вычислить значения параметров.
+        Если среди применяемых фильтров есть функции, не поддерживающие заглушки (``AbstractFilter.bindable``),
+        запрос строится заново со значениями фильтров.
+
+        :param filter_params: параметры фильтрации, обработанные ``_process_filter_params``
+        :return: запрос, ключ курсорной пагинации (для ``PaginationMode.cursor``) и значения параметров запроса
+        """
+        try:
+            sorting = self._parse_sorting(sort_by, descending)
+        except (ValueError, TypeError):
+            raise LogicException('Failed to apply sorting')
+
+        applied = self._applied_filters(filter_params)
+        bindable = all(
+            type(crud_filter) == str or (isinstance(crud_filter, AbstractFilter) and crud_filter.bindable)
+            for _, _, crud_filter in applied
         )
+        shape = (
+            frozenset(filter_params), sorting, pagination_mode,
+            tuple(sorted((execution_options or {}).items()))
+        )
+        try:
+            hash(shape)
+        except TypeError:
+            bindable = False
+
+        if not bindable:
+            query = self._base_multi_query(execution_options)
+            try:
+                query = self._apply_filtering(query, **filter_params)
+            except (ValueError, TypeError):
+                raise LogicException('Failed to apply filter')
+
+            return (*self._apply_multi_sorting(query, sorting, pagination_mode), dict())
+
+        if (cached := self.query_cache.get(shape)) is None:
+            query = self._base_multi_query(execution_options)
+            try:
+                query = self._apply_filter_placeholders(query, applied)
+            except (ValueError, TypeError):
+                raise LogicException('Failed to apply filter')
+
+            cached = self._apply_multi_sorting(query, sorting, pagination_mode)
+            self.query_cache.set(shape, cached)
 
-        return objects, count
+        try:
+            params = self._filter_values(applied, filter_params)
+        except (ValueError, TypeError):
+            raise LogicException('Failed to apply filter')
+
+        return (*cached, params)
+
+    def _base_multi_query(self, execution_options: dict[str, Any] = None) -> Select:
+        return select(self.entity) \
+            .options(*self.get_multi_options) \
+            .execution_options(**(execution_options or {}))
+
+    def _apply_multi_sorting(
+            self,
+            query: Select,
+            sort_by: SortingParam,
+            pagination_mode: PaginationMode
+    ) -> tuple[Select, Keyset | None]:
+        if pagination_mode == PaginationMode.cursor and query._order_by_clauses:
+            # сортировка по релевантности от фильтра идёт перед ключом и не попадает в курсор,
+            # поэтому страницы пропускали бы или повторяли элементы
+            raise LogicException('Cursor pagination is not supported with ranking filters')
+
+        try:
+            if pagination_mode == PaginationMode.cursor:
+                return query, self._build_keyset(query, sort_by)
+
+            return self._apply_sorting(query, sort_by), None
+        except (ValueError, TypeError):
+            raise LogicException('Failed to apply sorting')
+
+    def _count_cache_key(self, with_deleted: bool, filter_params: dict[str, Any]) -> str:
+        """
+        Нормализованное представление набора фильтров. Сортировка и пагинация не влияют на общее кол-во
+        элементов, поэтому в ключ не входят
+
+        :param filter_params: параметры фильтрации, обработанные ``_process_filter_params``
+        """
+        return json.dumps([with_deleted, filter_params], sort_keys=True, default=str)
 
     async def _after_values_extracted(
             self,
@@ -125,8 +359,19 @@ class BaseCrud(Generic[Entity]):
         obj = self.entity(**values, **kwargs)
         session.add(obj)
         await session.flush()
+        self.count_cache.clear()
+
+        # при eager_defaults серверные значения уже получены через INSERT ... RETURNING,
+        # дозапрашивается только то, что не удалось получить (для моделей без eager_defaults)
+        column_attrs = [attr for attr in sqlalchemy.inspect(self.entity).column_attrs if not attr.deferred]
+        for attr in column_attrs:
+            # столбец без значений по умолчанию, не переданный в INSERT, получил NULL – запрашивать его не нужно
+            if attr.key in sqlalchemy.inspect(obj).unloaded and _inserted_as_null(attr.columns[0]):
+                set_committed_value(obj, attr.key, None)
+
+        if unloaded := sqlalchemy.inspect(obj).unloaded & {attr.key for attr in column_attrs}:
+            await session.refresh(obj, attribute_names=unloaded)
 
-        await session.refresh(obj)
         return obj
 
     async def update(
@@ -142,9 +387,270 @@ class BaseCrud(Generic[Entity]):
             setattr(obj, attr_name, value)
 
         await session.flush()
+        # изменённые значения могли вывести сущность из отфильтрованных наборов или добавить в них
+        self.count_cache.clear()
 
         return obj
 
+    async def delete(self, session: AsyncSession, obj: Entity) -> Entity:
+        """
+        Мягкое удаление (``SoftDeleteMixin``) сущности
+        """
+        if not isinstance(obj, SoftDeleteMixin):
+            raise TypeError(f'Entity {self.entity.__name__} does not support soft delete')
+
+        obj.delete()
+        await session.flush()
+        self.count_cache.clear()
+
+        return obj
+
+    async def create_many(
+            self,
+            session: AsyncSession,
+            data: Iterable[Model],
+            *,
+            exclude: set[str] = None,
+            batch_size: int = None,
+            **kwargs
+    ) -> list[Entity]:
+        """
+        Массовое создание сущностей: один ``INSERT ... VALUES (...), (...) RETURNING`` на каждые
+        ``batch_size`` строк вместо ``INSERT`` + ``SELECT`` на каждую
+
+        :param kwargs: значения, общие для всех создаваемых сущностей
+        :return: созданные сущности в порядке ``data``
+        """
+        rows = []
+        for item in data:
+            values = await self._after_values_extracted(session, item.dict(exclude=exclude))
+            rows.append({**values, **kwargs})
+
+        created = []
+        for batch in chunked(rows, batch_size or self.bulk_batch_size):
+            created.extend(await self._execute_returning(session, insert(self.entity).values(batch)))
+
+        if created:
+            self.count_cache.clear()
+        return created
+
+    async def update_many(
+            self,
+            session: AsyncSession,
+            ids: Collection[Id],
+            data: Model,
+            *,
+            exclude: set[str] = None,
+            batch_size: int = None
+    ) -> list[Entity]:
+        """
+        Массовое обновление сущностей одинаковыми значениями: один ``UPDATE ... WHERE id IN (...) RETURNING``
+        на каждые ``batch_size`` идентификаторов. Удалённые (soft delete) сущности не обновляются
+
+        :return: обновлённые сущности
+        """
+        values = await self._after_values_extracted(session, data.dict(exclude=exclude), is_create=False)
+
+        return await self._update_batches(session, ids, values, batch_size)
+
+    async def delete_many(
+            self,
+            session: AsyncSession,
+            ids: Collection[Id],
+            *,
+            batch_size: int = None
+    ) -> list[Entity]:
+        """
+        Массовое мягкое удаление (``SoftDeleteMixin``) сущностей батчами по ``batch_size``
+
+        :return: удалённые сущности (уже удалённые ранее в результат не попадают)
+        """
+        if not issubclass(self.entity, SoftDeleteMixin):
+            raise TypeError(f'Entity {self.entity.__name__} does not support soft delete')
+
+        return await self._update_batches(session, ids, {'deleted_at': datetime.now()}, batch_size)
+
+    async def upsert(
+            self,
+            session: AsyncSession,
+            data: Model,
+            *,
+            conflict_target: Iterable[str] = None,
+            conflict_constraint: str = None,
+            update_fields: Iterable[str] = None,
+            exclude: set[str] = None,
+            **kwargs
+    ) -> Entity:
+        """
+        Создание сущности или обновление существующей одним запросом (``INSERT ... ON CONFLICT DO UPDATE``).
+        Параметры аналогичны ``upsert_many``
+        """
+        upserted = await self._upsert(
+            session,
+            [data],
+            conflict_target=conflict_target,
+            conflict_constraint=conflict_constraint,
+            update_fields=update_fields,
+            exclude=exclude,
+            **kwargs
+        )
+        return upserted[0]
+
+    async def upsert_many(
+            self,
+            session: AsyncSession,
+            data: Iterable[Model],
+            *,
+            conflict_target: Iterable[str] = None,
+            conflict_constraint: str = None,
+            update_fields: Iterable[str] = None,
+            exclude: set[str] = None,
+            batch_size: int = None,
+            **kwargs
+    ) -> list[Entity]:
+        """
+        Массовое создание или обновление сущностей: один ``INSERT ... ON CONFLICT DO UPDATE ... RETURNING``
+        на каждые ``batch_size`` строк. Не требует предварительного чтения и не гоняется с параллельными
+        вставками тех же записей
+
+        :param conflict_target: столбцы уникального индекса для определения существующей записи
+                                (по умолчанию ``upsert_conflict_target`` CRUD'a)
+        :param conflict_constraint: название unique constraint'а вместо перечня столбцов
+        :param update_fields: поля, обновляемые у существующей записи. По умолчанию все переданные,
+                              кроме столбцов конфликта и ``upsert_immutable_fields``
+        :param kwargs: значения, общие для всех сущностей
+        :return: созданные и обновлённые сущности
+        """
+        return await self._upsert(
+            session,
+            data,
+            conflict_target=conflict_target,
+            conflict_constraint=conflict_constraint,
+            update_fields=update_fields,
+            exclude=exclude,
+            batch_size=batch_size,
+            **kwargs
+        )
+
+    async def _upsert(
+            self,
+            session: AsyncSession,
+            data: Iterable[Model],
+            *,
+            conflict_target: Iterable[str] = None,
+            conflict_constraint: str = None,
+            update_fields: Iterable[str] = None,
+            exclude: set[str] = None,
+            batch_size: int = None,
+            **kwargs
+    ) -> list[Entity]:
+        conflict_target = tuple(conflict_target or self.upsert_conflict_target)
+
+        rows = dict()
+        for item in data:
+            values = await self._after_values_extracted(session, item.dict(exclude=exclude))
+            values = {**values, **kwargs}
+            # одна и та же запись не может быть обновлена одним запросом дважды – остаётся последнее значение
+            if conflict_constraint is None and all(key in values for key in conflict_target):
+                rows[tuple(values[key] for key in conflict_target)] = values
+            else:
+                rows[len(rows)] = values
+
+        upserted = []
+        for batch in chunked(rows.values(), batch_size or self.bulk_batch_size):
+            query = postgresql.insert(self.entity).values(batch)
+
+            if update_fields is None:
+                fields = set(batch[0]) - set(conflict_target) - self.upsert_immutable_fields
+            else:
+                fields = set(update_fields)
+            # пустой SET недопустим, а DO NOTHING не вернёт существующую запись через RETURNING
+            set_ = {field: query.excluded[field] for field in (fields or conflict_target)}
+
+            if conflict_constraint is not None:
+                query = query.on_conflict_do_update(constraint=conflict_constraint, set_=set_)
+            else:
+                query = query.on_conflict_do_update(index_elements=conflict_target, set_=set_)
+
+            upserted.extend(await self._execute_returning(session, query))
+
+        if upserted:
+            self.count_cache.clear()
+            written = [(self.entity, obj.id) for obj in upserted]
+            await session.run_sync(lambda sync_session: invalidate_written(sync_session, written))
+
+        return upserted
+
+    async def _update_batches(
+            self,
+            session: AsyncSession,
+            ids: Collection[Id],
+            values: dict[str, Any],
+            batch_size: int = None
+    ) -> list[Entity]:
+        updated = []
+        for batch in chunked(ids, batch_size or self.bulk_batch_size):
+            query = update(self.entity).where(self.entity.id.in_(batch)).values(**values)
+            if issubclass(self.entity, SoftDeleteMixin):
+                query = query.where(self.entity.deleted_at.is_(None))
+            updated.extend(await self._execute_returning(session, query))
+
+        if updated:
+            self.count_cache.clear()
+        written = [(self.entity, obj.id) for obj in updated]
+        await session.run_sync(lambda sync_session: invalidate_written(sync_session, written))
+        return updated
+
+    async def _execute_returning(self, session: AsyncSession, statement: Insert | Update) -> list[Entity]:
+        """
+        Выполнение ``INSERT``/``UPDATE`` с получением затронутых сущностей через ``RETURNING``.
+        Объекты, уже загруженные в сессию, обновляются полученными значениями
+        """
+        query = select(self.entity) \
+            .from_statement(statement.returning(*sqlalchemy.inspect(self.entity).local_table.columns)) \
+            .execution_options(include_deleted=True, populate_existing=True)
+
+        return list((await session.execute(query)).scalars().all())
+
+    def index_columns(self) -> list[tuple[str, ...]]:
+        """
+        Наборы столбцов для индексов под зарегистрированные в CRUD'e сортировки и фильтры.
+
+        К ключу сортировки добавляется ``id`` – так индекс покрывает и порядок курсорной пагинации
+        (см. ``_build_keyset``). Для сортировок из ``indexed_sortings`` – составной индекс по всем ключам и ``id``
+        (направления ключей не учитываются: при разных направлениях индекс используется только по началу).
+        Функции сортировки и фильтрации без явно указанных полей модели не учитываются,
+        как и наборы, уже покрытые более длинным индексом с тем же началом
+        """
+        table_columns = self.entity.__table__.columns
+        candidates: list[tuple[str, ...]] = list()
+
+        for sorting_elem in self.sort_fields.values():
+            if type(sorting_elem) == str and sorting_elem in table_columns and sorting_elem != 'id':
+                candidates.append((sorting_elem, 'id'))
+
+        for sorting in self.indexed_sortings:
+            keys = tuple(key for key, _ in sorting if key != 'id')
+            if keys and all(key in table_columns for key in keys):
+                candidates.append((*keys, 'id'))
+
+        for crud_filter in self.filter_fields.values():
+            if type(crud_filter) == str:
+                fields = (crud_filter,)
+            elif isinstance(crud_filter, AbstractFilter):
+                fields = crud_filter.index_fields()
+            else:
+                continue
+            candidates.extend((field,) for field in fields if field in table_columns and field != 'id')
+
+        indexes = list()
+        for columns in candidates:
+            covered = any(other[:len(columns)] == columns for other in candidates if len(other) > len(columns))
+            if not covered and columns not in indexes:
+                indexes.append(columns)
+
+        return indexes
+
     def _register_filtering(self, filter_fields: FilterElementsType) -> dict[str, str | FilterFunctionType]:
         """
         Сохраняет перечень доступных фильтров для CRUD'a
@@ -312,6 +818,63 @@ class BaseCrud(Generic[Entity]):
 
         return query
 
+    def _applied_filters(
+            self,
+            filter_params: dict[str, Any]
+    ) -> list[tuple[str, tuple[str, ...], str | FilterFunctionType]]:
+        """
+        Фильтры, которые будут применены при переданных параметрах фильтрации
+
+        :param filter_params: параметры фильтрации, обработанные ``_process_filter_params``
+        :return: префикс названий параметров запроса фильтра, ключи фильтра и сам фильтр
+                 (название поля модели для сравнения на равенство или функция фильтрации)
+        """
+        if not self.filter_fields:
+            return [('filter_', (key,), key) for key in filter_params]
+
+        applied = list()
+        for i, (crud_filter_keys, crud_filter) in enumerate(self.filter_fields.items()):
+            crud_filter_keys = crud_filter_keys if type(crud_filter_keys) == tuple else (crud_filter_keys,)
+            if all(key in filter_params for key in crud_filter_keys):
+                applied.append((f'filter{i}_', crud_filter_keys, crud_filter))
+
+        return applied
+
+    def _apply_filter_placeholders(
+            self,
+            query: Select,
+            applied: list[tuple[str, tuple[str, ...], str | AbstractFilter]]
+    ) -> Select:
+        """
+        Применение фильтров к запросу с параметрами-заглушками вместо значений (см. ``_get_multi_query``)
+        """
+        for prefix, _, crud_filter in applied:
+            if type(crud_filter) == str:
+                if (attr := getattr(self.entity, crud_filter, None)) is None:
+                    raise ValueError("Filtering field does not exists")
+                query = query.where(attr == bindparam(f'{prefix}{crud_filter}'))
+            else:
+                query = crud_filter(query, self.entity, **crud_filter.placeholders(prefix))
+
+        return query
+
+    def _filter_values(
+            self,
+            applied: list[tuple[str, tuple[str, ...], str | AbstractFilter]],
+            filter_params: dict[str, Any]
+    ) -> dict[str, Any]:
+        """
+        Значения параметров-заглушек запроса, построенного ``_apply_filter_placeholders``
+        """
+        values = dict()
+        for prefix, keys, crud_filter in applied:
+            params = {key: filter_params[key] for key in keys}
+            if isinstance(crud_filter, AbstractFilter):
+                params = crud_filter.prepare(**params)
+            values.update({f'{prefix}{key}': value for key, value in params.items()})
+
+        return values
+
     def _register_sorting(
             self,
             allowed_sort_fields: SortingElementsType
@@ -323,9 +886,9 @@ class BaseCrud(Generic[Entity]):
         """
         return self.__collect_key_functions(allowed_sort_fields, 'sorting', allow_multiple_keys=False)
 
-    def _apply_sorting(self, query: Select, sort_name: str, descending: bool = False) -> Select:
+    def _get_sorting_expression(self, query: Select, sort_name: str) -> ColumnElement:
         """
-        Применение функции сортировки к запросу по сконфигурированным функциям сортировки.
+        Получение выражения, по которому выполняется сортировка, по сконфигурированным функциям сортировки.
 
         Поведение зависит от того, были ли указан допустимый перечень параметров сортировки
         при создании объекта CRUD'a. Если для параметра ``sorting_by`` были ключи сортировки,
@@ -334,16 +897,13 @@ class BaseCrud(Generic[Entity]):
 
         :param query: выполняемый multiple get запрос
         :param sort_name: название ключа для сортировки (будет приведён к snake_case)
-        :param descending: использовать ли обратный порядок сортировки
-        :return: запрос с применённой сортировкой
+        :return: выражение для ``ORDER BY``
         """
         sort_name = to_snake(sort_name)
 
-        order_direction = sqlalchemy.desc if descending else sqlalchemy.asc
-
         if not self.sort_fields:
             if attr := getattr(self.entity, sort_name, None):
-                return query.order_by(order_direction(attr))
+                return attr
             else:
                 raise ValueError("Sorting field does not exists")
 
@@ -351,11 +911,90 @@ class BaseCrud(Generic[Entity]):
         if sorting_elem is None:
             raise ValueError("Specified sorting param does not exists")
         elif type(sorting_elem) == str:
-            return query.order_by(order_direction(getattr(self.entity, sort_name, None)))
+            return getattr(self.entity, sort_name, None)
         elif callable(sorting_elem):
             try:
-                return query.order_by(order_direction(sorting_elem(query, self.entity)))
+                return sorting_elem(query, self.entity)
             except Exception as e:
                 raise Exception(
                     f'Unexpected exception from sorting function called "{sort_name}"; "{e}"'
                 ) from e
+
+    def _parse_sorting(self, sort_by: SortingParam, descending: bool = False) -> tuple[tuple[str, bool], ...]:
+        """
+        Приведение ключей сортировки к упорядоченному набору пар (ключ в snake_case, сортировать ли по убыванию)
+
+        Ключи можно передать строкой через запятую (``created_at,-name``) или перечнем. Направление ключа
+        указывается префиксом ``-`` (по убыванию) или ``+`` (по возрастанию), либо парой (ключ, по убыванию).
+        Для ключей без явного направления используется ``descending``
+
+        :raise ValueError: если ключи не указаны или повторяются
+        """
+        if isinstance(sort_by, str):
+            sort_by = sort_by.split(',')
+
+        sorting: list[tuple[str, bool]] = list()
+        for key in sort_by:
+            if type(key) == tuple:
+                sort_name, key_descending = key
+            else:
+                key = key.strip()
+                sort_name, key_descending = key.lstrip('-+'), descending
+                if key.startswith('-'):
+                    key_descending = True
+                elif key.startswith('+'):
+                    key_descending = False
+
+            sorting.append((to_snake(sort_name), key_descending))
+
+        names = [sort_name for sort_name, _ in sorting]
+        if not names or not all(names):
+            raise ValueError('Sorting keys are not specified')
+        if len(set(names)) != len(names):
+            raise ValueError('Sorting keys should not repeat')
+
+        return tuple(sorting)
+
+    def _apply_sorting(self, query: Select, sort_by: SortingParam, descending: bool = False) -> Select:
+        """
+        Применение функций сортировки к запросу по сконфигурированным функциям сортировки.
+
+        :param query: выполняемый multiple get запрос
+        :param sort_by: ключ или перечень ключей для сортировки (см. ``_parse_sorting``)
+        :param descending: направление сортировки для ключей без явно указанного направления
+        :return: запрос с применённой сортировкой
+        """
+        return query.order_by(*[
+            sqlalchemy.desc(expression) if key_descending else sqlalchemy.asc(expression)
+            for expression, key_descending in self._sorting_expressions(query, sort_by, descending)
+        ])
+
+    def _build_keyset(self, query: Select, sort_by: SortingParam, descending: bool = False) -> Keyset:
+        """
+        Формирование ключа курсорной пагинации из ключей сортировки и ``id`` для однозначности порядка
+
+        :param query: выполняемый multiple get запрос
+        :param sort_by: ключ или перечень ключей для сортировки (см. ``_parse_sorting``)
+        :param descending: направление сортировки для ключей без явно указанного направления
+        """
+        sorting = self._parse_sorting(sort_by, descending)
+        columns = self._sorting_expressions(query, sorting)
+        if 'id' not in (sort_name for sort_name, _ in sorting):
+            # направление последнего ключа: при сортировке в одном направлении ключ остаётся однородным
+            columns.append((self.entity.id, sorting[-1][1]))
+
+        signature = ','.join(
+            f'{sort_name}:{"desc" if key_descending else "asc"}' for sort_name, key_descending in sorting
+        )
+        return Keyset(columns, signature=signature)
+
+    def _sorting_expressions(
+            self,
+            query: Select,
+            sort_by: SortingParam,
+            descending: bool = False
+    ) -> list[tuple[ColumnElement, bool]]:
+        return [
+            (self._get_sorting_expression(query, sort_name), key_descending)
+            for sort_name, key_descending in self._parse_sorting(sort_by, descending)
+        ]
@@ -0,0 +1,191 @@
+"""
+Read-through кэш сущностей по первичному ключу для ``BaseCrud.get``.
+
+В кэше хранятся значения столбцов сущности, а не сами ORM объекты: при попадании в кэш объект
+восстанавливается и присоединяется к текущей сессии без запроса к БД. Связи (relationship) в кэш не попадают
+и подгружаются как обычно.
+
+Инвалидация происходит автоматически при любой записи сущности через ORM (``create``/``update`` CRUD'a,
+``SoftDeleteMixin.delete`` и т.д.): после flush'а и ещё раз после commit'а, чтобы параллельный запрос
+не успел положить в кэш значение, прочитанное до фиксации транзакции. Записанные в незавершённой транзакции
+сущности в кэш не кладутся, при её откате ещё раз инвалидируются.
+"""
+from collections import defaultdict
+from typing import Any, Generic, Type, Optional, Callable
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from core.crud.loader import identity_key, normalize_id
+from core.crud.types import Entity, Id
+from utils.cache import CacheBackend, TTLCache
+
+SESSION_INVALIDATED_KEY = 'invalidated_entities'
+
+_entity_caches: dict[type, list['EntityCache']] = defaultdict(list)
+
+# вызываются при каждом flush'е с перечнем изменённых сущностей (например, для оповещения других процессов)
+InvalidationPublisher = Callable[[Session, list[tuple[type, Id]]], None]
+invalidation_publishers: list[InvalidationPublisher] = []
+
+
+class EntityCache(Generic[Entity]):
+    """
+    Кэш сущностей одного типа
+    """
+
+    def __init__(
+            self,
+            entity: Type[Entity],
+            backend: CacheBackend = None,
+            ttl: float = 60,
+            max_size: int = 1024
+    ):
+        """
+        :param entity: ORM класс кэшируемых сущностей
+        :param backend: хранилище кэша. По умолчанию in-process LRU с TTL
+        :param ttl: время жизни записи (для хранилища по умолчанию)
+        :param max_size: максимальное кол-во записей (для хранилища по умолчанию)
+        """
+        self.entity = entity
+        self.backend = backend if backend is not None else TTLCache(max_size=max_size, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+        self._mapper = sqlalchemy.inspect(entity)
+        # отложенные (deferred) столбцы загружаются только по обращению и в кэш не попадают
+        self._columns = [attr.key for attr in self._mapper.column_attrs if not attr.deferred]
+        self._id_type = self._mapper.primary_key[0].type
+
+        _entity_caches[entity].append(self)
+
+    @property
+    def table_name(self) -> str:
+        return self._mapper.local_table.name
+
+    def key(self, id_: Id) -> str:
+        return f'{self.table_name}:{identity_key(id_)}'
+
+    def get(self, session: AsyncSession, id_: Id) -> Optional[Entity]:
+        """
+        Получение сущности из кэша, присоединённой к сессии ``session``.
+        Уже загруженный в сессию объект возвращается как есть (с его несохранёнными изменениями)
+        """
+        try:
+            identity = self._mapper.identity_key_from_primary_key([normalize_id(self._id_type, id_)])
+        except ValueError:
+            return None
+
+        existing = session.sync_session.identity_map.get(identity)
+        if existing is not None:
+            # объект с истёкшими атрибутами (например, после rollback'а) перечитывается из БД
+            if any(attr not in sqlalchemy.inspect(existing).dict for attr in self._columns):
+                return None
+            return existing
+
+        values = self.backend.get(self.key(id_))
+        if values is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        obj = self._mapper.class_manager.new_instance()
+        for attr_name, value in values.items():
+            setattr(obj, attr_name, value)
+        make_transient_to_detached(obj)
+
+        # merge без загрузки не обращается к БД
+        return session.sync_session.merge(obj, load=False)
+
+    def put(self, obj: Entity):
+        state = sqlalchemy.inspect(obj)
+        # в кэш попадают только полностью загруженные объекты без несохранённых изменений
+        if state.identity is None or state.modified or any(attr not in state.dict for attr in self._columns):
+            return
+
+        # записанное в незавершённой транзакции может быть откачено
+        session = object_session(obj)
+        if session is not None and (type(obj), state.identity[0]) in session.info.get(SESSION_INVALIDATED_KEY, ()):
+            return
+
+        self.backend.set(self.key(state.identity[0]), {attr: state.dict[attr] for attr in self._columns})
+
+    def invalidate(self, id_: Id):
+        self.backend.delete(self.key(id_))
+
+    def clear(self):
+        self.backend.clear()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def invalidate_entity(entity: type, id_: Id):
+    for cache in _entity_caches.get(entity, ()):
+        cache.invalidate(id_)
+
+
+def invalidate_table(table_name: str, id_: Id):
+    for caches in _entity_caches.values():
+        for cache in caches:
+            if cache.table_name == table_name:
+                cache.invalidate(id_)
+
+
+def clear_all():
+    for caches in _entity_caches.values():
+        for cache in caches:
+            cache.clear()
+
+
+def invalidate_written(session: Session, written: list[tuple[type, Id]]):
+    """
+    Инвалидация записанных в рамках транзакции сессии сущностей.
+
+    Вызывается автоматически после flush'а. Для записей в обход unit of work (``insert``/``update``
+    запросы напрямую) необходимо вызывать явно (через ``AsyncSession.run_sync``)
+    """
+    written = [(entity, id_) for entity, id_ in written if entity in _entity_caches]
+    if not written:
+        return
+
+    invalidated = session.info.setdefault(SESSION_INVALIDATED_KEY, set())
+    for entity, id_ in written:
+        invalidate_entity(entity, id_)
+        invalidated.add((entity, id_))
+
+    for publisher in invalidation_publishers:
+        publisher(session, written)
+
+
+@event.listens_for(Session, 'after_flush')
+def invalidate_flushed(session: Session, flush_context):
+    if not _entity_caches:
+        return
+
+    flushed = []
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        identity = sqlalchemy.inspect(obj).identity
+        if identity is None:
+            continue
+
+        flushed.append((type(obj), identity[0] if len(identity) == 1 else identity))
+
+    invalidate_written(session, flushed)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed(session: Session):
+    for entity, id_ in session.info.pop(SESSION_INVALIDATED_KEY, ()):
+        invalidate_entity(entity, id_)
+
+
+@event.listens_for(Session, 'after_rollback')
+def invalidate_rolled_back(session: Session):
+    # в кэш могло попасть откаченное значение (например, объекта, отсоединённого от сессии до rollback'а)
+    for entity, id_ in session.info.pop(SESSION_INVALIDATED_KEY, ()):
+        invalidate_entity(entity, id_)
@@ -2,20 +2,31 @@
 Функции фильтрации, которые могут использоваться в CRUD фильтрах
 """
 import abc
+import enum
 from abc import ABC
 from contextlib import suppress
 from typing import Any, Tuple, Union, Type
 
-from sqlalchemy import func, select
-from sqlalchemy.sql import Select, Subquery, visitors
+import sqlalchemy
+from sqlalchemy import func, select, bindparam
+from sqlalchemy.sql import Select, Subquery, visitors, ColumnElement
+from sqlalchemy.sql.elements import BindParameter
 
 from core.crud.types import Entity
+from utils.orm_utils.fulltext import FullTextSearchMixin
+from utils.orm_utils.softdelete import SoftDeleteMixin
 
 
 class AbstractFilter(abc.ABC):
     """
     Сигнатура функции фильтрации.
+
+    Фильтр, поддерживающий параметры-заглушки (``bindable``), CRUD строит один раз для каждого набора
+    параметров запроса (см. ``BaseCrud.get_multi``): вместо значений в ``__call__`` передаются ``bindparam``
+    из ``placeholders``, а значения для них на каждый запрос вычисляет ``prepare``
     """
+    # фильтр может быть построен с ``bindparam`` вместо значений параметров
+    bindable: bool = False
 
     def __init__(self, required_fields: str):
         """
@@ -50,11 +61,40 @@ class AbstractFilter(abc.ABC):
         """
         return self.required_fields, self
 
+    def placeholders(self, prefix: str) -> dict[str, BindParameter]:
+        """
+        Параметры-заглушки для построения фильтра без значений
+
+        :param prefix: префикс названий параметров, уникальный для фильтра в рамках CRUD'a
+        """
+        keys = self.required_fields if type(self.required_fields) == tuple else (self.required_fields,)
+        return {key: bindparam(f'{prefix}{key}') for key in keys}
+
+    def prepare(self, **filter_params: Any) -> dict[str, Any]:
+        """
+        Проверка и преобразование значений параметров фильтрации в значения параметров запроса
+        (для ``bindable`` фильтров)
+        """
+        return filter_params
+
+    def _prepared(self, filter_params: dict[str, Any]) -> dict[str, Any]:
+        if any(isinstance(value, BindParameter) for value in filter_params.values()):
+            return filter_params
+        return self.prepare(**filter_params)
+
+    def index_fields(self) -> tuple[str, ...]:
+        """
+        Поля модели, условие по которым может использовать обычный (btree) индекс.
+        Используется для подбора индексов под фильтры CRUD'a (см. ``BaseCrud.index_columns``)
+        """
+        return ()
+
 
 class IlikeFilter(AbstractFilter):
     """
     Фильтр с ``case insensitive`` поиском по указанному полю
     """
+    bindable = True
 
     def __init__(self, field_name: str):
         """
@@ -62,6 +102,9 @@ class IlikeFilter(AbstractFilter):
         """
         super().__init__(field_name)
 
+    def prepare(self, **filter_params: Any) -> dict[str, Any]:
+        return {self.required_fields: f'%{filter_params[self.required_fields].lower()}%'}
+
     def __call__(self, query: Select, model: Entity, **filter_params: Any) -> Select:
         try:
             attr = getattr(model, self.required_fields)
@@ -69,7 +112,7 @@ class IlikeFilter(AbstractFilter):
             raise ValueError(
                 f'specified attribute {self.required_fields} is not exists on model {model}'
             ) from e
-        query = query.where(attr.ilike(f'%{filter_params[self.required_fields].lower()}%'))
+        query = query.where(attr.ilike(self._prepared(filter_params)[self.required_fields]))
 
         return query
 
@@ -80,15 +123,22 @@ class IncludeFilter(AbstractFilter):
 
     Передаваемый параметр должен быть списком
     """
+    bindable = True
 
     def __init__(self, field_name: str, alias: str = None):
         self.field_name = field_name
         super().__init__(alias if alias else field_name)
 
-    def __call__(self, query: Select, model: Entity, **filter_params: Any) -> Select:
-        param = filter_params[self.required_fields]
-        if type(param) != list:
+    def placeholders(self, prefix: str) -> dict[str, BindParameter]:
+        return {self.required_fields: bindparam(f'{prefix}{self.required_fields}', expanding=True)}
+
+    def prepare(self, **filter_params: Any) -> dict[str, Any]:
+        if type(filter_params[self.required_fields]) != list:
             raise TypeError(f"Parameter {self.required_fields} should be a list for IN comparison")
+        return filter_params
+
+    def __call__(self, query: Select, model: Entity, **filter_params: Any) -> Select:
+        param = self._prepared(filter_params)[self.required_fields]
         try:
             attr = getattr(model, self.field_name)
         except AttributeError as e:
@@ -98,6 +148,19 @@ class IncludeFilter(AbstractFilter):
         query = query.where(attr.in_(param))
         return query
 
+    def index_fields(self) -> tuple[str, ...]:
+        return self.field_name,
+
+
+class LevenshteinPrefilter(str, enum.Enum):
+    """
+    Способ предварительного отбора кандидатов для ``LevenshteinFilter``
+    """
+    # оператор ``<%`` (word similarity) ``pg_trgm``, использует GIN индекс по полю
+    trigram = 'trigram'
+    # ``levenshtein_less_equal`` – расчёт прерывается, как только расстояние превысило ``max_distance``
+    bounded = 'bounded'
+
 
 class LevenshteinFilter(AbstractFilter):
     """
@@ -111,14 +174,33 @@ class LevenshteinFilter(AbstractFilter):
 
 
     **Работает для строк не более 255 символов**. Учитывайте это при создании фильтра
-    """
 
-    def __init__(self, field_name: str, model: Entity):
+    Без ``prefilter`` расстояние считается для каждой строки таблицы. С ``prefilter`` поиск двухэтапный:
+    сначала отбирается не более ``limit`` кандидатов (см. ``LevenshteinPrefilter``),
+    и уже они сортируются по точному расстоянию
+    """
+    bindable = True
+
+    def __init__(
+            self,
+            field_name: str,
+            model: Entity,
+            prefilter: LevenshteinPrefilter = None,
+            max_distance: int = 3,
+            limit: int = 100
+    ):
         """
         :param field_name: названия поля модели
+        :param prefilter: способ предварительного отбора кандидатов. По умолчанию расстояние считается
+                          для всех строк таблицы
+        :param max_distance: максимальное расстояние для ``LevenshteinPrefilter.bounded``
+        :param limit: максимальное кол-во кандидатов (а значит и результатов) при предварительном отборе
         """
         super().__init__(field_name)
         self.model = model
+        self.prefilter = prefilter
+        self.max_distance = max_distance
+        self.limit = limit
 
         column_attr = getattr(model, self.required_fields)
         column_length = column_attr.property.columns[0].type.length
@@ -128,12 +210,16 @@ class LevenshteinFilter(AbstractFilter):
                 f" text fields, that have length < 256"
             )
 
-    def __call__(self, query: Select, model: Entity, **filter_params: Any) -> Select:
+    def prepare(self, **filter_params: Any) -> dict[str, Any]:
         value = filter_params[self.required_fields]
-
         if len(value) > 255:
             raise ValueError("Levenshtein filter can't work with string, having more than 255 characters")
 
+        return {self.required_fields: value.lower()}
+
+    def __call__(self, query: Select, model: Entity, **filter_params: Any) -> Select:
+        value = self._prepared(filter_params)[self.required_fields]
+
         source = func.lower(getattr(model, self.required_fields))
         # По-умолчанию левенштейн за каждый символ который необходимо вставить, изменить,
         # или удалить из строки-источника (первый аргумент) увелиичивает расстояние до нее на 1
@@ -142,5 +228,113 @@ class LevenshteinFilter(AbstractFilter):
         # а не 0 как нужно для корректного поиска по подстроке
         # необходимо явно указать что удаление в строке-источнике
         # не приводит к увеличению расстояния
-        levenshtein_call = func.levenshtein(source, value.lower(), 1, 0, 1)
+        levenshtein_call = func.levenshtein(source, value, 1, 0, 1)
+        if self.prefilter is not None:
+            query = query.where(model.id.in_(self._candidates(query, model, source, value)))
+
         return query.order_by(levenshtein_call)
+
+    def _candidates(self, query: Select, model: Entity, source: ColumnElement, value: str | BindParameter) -> Select:
+        """
+        Первый этап поиска: не более ``limit`` кандидатов, отобранных дешёвым условием.
+        Точное расстояние затем считается только для них
+        """
+        if self.prefilter == LevenshteinPrefilter.trigram:
+            # word_similarity – похожесть искомой строки на наиболее похожую часть значения поля,
+            # что соответствует поиску по подстроке без штрафа за удаление
+            condition = sqlalchemy.type_coerce(value, sqlalchemy.String).op('<%')(getattr(model, self.required_fields))
+            rank = func.word_similarity(value, source).desc()
+        else:
+            distance = func.levenshtein_less_equal(source, value, 1, 0, 1, self.max_distance)
+            condition = distance <= self.max_distance
+            rank = distance
+
+        candidates = query.with_only_columns(model.id).where(condition).order_by(None).order_by(rank)
+        # условие мягкого удаления добавляется автоматически только к внешнему запросу,
+        # а без него не используется частичный индекс
+        if issubclass(model, SoftDeleteMixin):
+            candidates = candidates.where(model.deleted_at.is_(None))
+
+        return candidates.limit(self.limit)
+
+
+class TrigramFilter(AbstractFilter):
+    """
+    Поиск подстроки по текстовому полю, использующий GIN индекс ``pg_trgm``
+    (см. ``utils.orm_utils.migrations.create_trigram_indexes``).
+
+    В отличие от ``IlikeFilter`` спецсимволы шаблона (``%``, ``_``) в искомой строке экранируются,
+    а без индекса ``ILIKE '%...%'`` всегда приводит к полному сканированию таблицы.
+
+    В режиме ``ranked`` вместо вхождения подстроки ищутся похожие строки (оператор ``%``, порог задаётся
+    параметром postgres ``pg_trgm.similarity_threshold``, по умолчанию 0.3), а к запросу применяется
+    сортировка по убыванию ``similarity()``. Как и у ``LevenshteinFilter``, эта сортировка становится первичной
+    """
+
+    ESCAPE_CHAR = '\\'
+    bindable = True
+
+    def __init__(self, field_name: str, ranked: bool = False):
+        """
+        :param field_name: названия поля модели
+        :param ranked: искать похожие строки с сортировкой по степени похожести
+        """
+        super().__init__(field_name)
+        self.ranked = ranked
+
+    def __call__(self, query: Select, model: Entity, **filter_params: Any) -> Select:
+        try:
+            attr = getattr(model, self.required_fields)
+        except AttributeError as e:
+            raise ValueError(
+                f'specified attribute {self.required_fields} is not exists on model {model}'
+            ) from e
+        value = self._prepared(filter_params)[self.required_fields]
+
+        if self.ranked:
+            return query.where(attr.op('%')(value)).order_by(func.similarity(attr, value).desc())
+
+        return query.where(attr.ilike(value, escape=self.ESCAPE_CHAR))
+
+    def prepare(self, **filter_params: Any) -> dict[str, Any]:
+        value = filter_params[self.required_fields]
+        if self.ranked:
+            return filter_params
+
+        for char in (self.ESCAPE_CHAR, '%', '_'):
+            value = value.replace(char, self.ESCAPE_CHAR + char)
+        return {self.required_fields: f'%{value}%'}
+
+
+class FullTextFilter(AbstractFilter):
+    """
+    Полнотекстовый поиск по словам через генерируемый столбец ``search_vector`` модели
+    (см. ``FullTextSearchMixin``) и GIN индекс по нему.
+
+    Строка поиска разбирается ``websearch_to_tsquery`` (поддерживает ``"фразы"``, ``or`` и ``-исключение``),
+    поэтому допускается любой пользовательский ввод. В режиме ``ranked`` к запросу применяется сортировка
+    по убыванию ``ts_rank``, которая, как и у ``LevenshteinFilter``, становится первичной
+    """
+    bindable = True
+
+    def __init__(self, field_name: str = 'search', ranked: bool = True):
+        """
+        :param field_name: название параметра фильтрации со строкой поиска
+        :param ranked: сортировать ли результаты по релевантности
+        """
+        super().__init__(field_name)
+        self.ranked = ranked
+
+    def __call__(self, query: Select, model: Entity, **filter_params: Any) -> Select:
+        if not issubclass(model, FullTextSearchMixin):
+            raise ValueError(f'Model {model} does not support full text search')
+
+        ts_query = func.websearch_to_tsquery(
+            sqlalchemy.literal_column(f"'{model.__search_config__}'::regconfig"),
+            filter_params[self.required_fields]
+        )
+        query = query.where(model.search_vector.op('@@')(ts_query))
+        if self.ranked:
+            query = query.order_by(func.ts_rank(model.search_vector, ts_query).desc())
+
+        return query
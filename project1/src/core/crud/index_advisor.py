@@ -0,0 +1,226 @@
+"""
+Подбор индексов под сортировки и фильтры, зарегистрированные в CRUD'ах.
+
+Для каждого CRUD'a наборы столбцов из ``BaseCrud.index_columns()`` сравниваются с уже существующими
+индексами таблицы. Недостающие индексы для таблиц, которые postgres читает последовательным сканированием
+(``pg_stat_user_tables.seq_scan``), записываются в новую миграцию alembic (``CREATE INDEX CONCURRENTLY``).
+
+Запуск (из ``project1``, как и ``alembic``: каталог миграций задан относительно текущего; нужна доступная БД)::
+
+    PYTHONPATH=src python -m core.crud.index_advisor --config alembic.ini
+"""
+import argparse
+import asyncio
+import importlib
+import pkgutil
+from typing import NamedTuple
+
+from alembic import util
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from core.crud.base import crud_instances
+from utils.db_session import db_engine
+from utils.orm_utils.migrations import not_deleted_index_name
+from utils.orm_utils.softdelete import SoftDeleteMixin
+
+EXISTING_INDEXES_QUERY = text('''
+    SELECT t.relname AS table_name,
+           array(
+               SELECT a.attname
+               FROM unnest(ix.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+                        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+               ORDER BY k.ord
+           ) AS columns,
+           pg_get_expr(ix.indpred, ix.indrelid) AS predicate
+    FROM pg_index ix
+             JOIN pg_class t ON t.oid = ix.indrelid
+             JOIN pg_namespace n ON n.oid = t.relnamespace
+    WHERE n.nspname = current_schema()
+      AND t.relname = ANY(:tables)
+      -- индексы по выражениям не подходят для сравнения по столбцам
+      AND NOT 0 = ANY(ix.indkey::int2[])
+''')
+
+TABLE_STATS_QUERY = text('''
+    SELECT relname AS table_name, seq_scan, seq_tup_read, coalesce(idx_scan, 0) AS idx_scan, n_live_tup
+    FROM pg_stat_user_tables
+    WHERE schemaname = current_schema() AND relname = ANY(:tables)
+''')
+
+
+class ExistingIndex(NamedTuple):
+    columns: tuple[str, ...]
+    predicate: str | None
+
+
+class TableStats(NamedTuple):
+    seq_scan: int = 0
+    seq_tup_read: int = 0
+    idx_scan: int = 0
+    n_live_tup: int = 0
+
+
+class TableAdvice(NamedTuple):
+    table_name: str
+    soft_delete: bool
+    stats: TableStats
+    missing: list[tuple[str, ...]]
+
+    def index_name(self, columns: tuple[str, ...]) -> str:
+        if self.soft_delete:
+            return not_deleted_index_name(self.table_name, columns)
+        return f'ix_{self.table_name}_{"_".join(columns)}'
+
+
+def is_covered(columns: tuple[str, ...], existing: list[ExistingIndex], soft_delete: bool) -> bool:
+    """
+    Покрывает ли один из существующих индексов выборку по ``columns``: индекс должен начинаться с этих
+    столбцов, а частичный индекс подходит только с условием мягкого удаления, которое есть в каждом запросе
+    """
+    for index in existing:
+        if index.columns[:len(columns)] != columns:
+            continue
+        if index.predicate is None:
+            return True
+        if soft_delete and index.predicate.strip('()').lower() == 'deleted_at is null':
+            return True
+
+    return False
+
+
+def collect_index_columns() -> dict[str, tuple[bool, list[tuple[str, ...]]]]:
+    """
+    Наборы столбцов под сортировки и фильтры всех CRUD'ов, по таблицам
+    """
+    tables: dict[str, tuple[bool, list[tuple[str, ...]]]] = dict()
+    for crud in crud_instances:
+        table_name = crud.entity.__table__.name
+        soft_delete = issubclass(crud.entity, SoftDeleteMixin)
+        _, columns = tables.setdefault(table_name, (soft_delete, list()))
+        columns.extend(index for index in crud.index_columns() if index not in columns)
+
+    return tables
+
+
+async def advise(connection: AsyncConnection, min_seq_scan: int = 1) -> list[TableAdvice]:
+    """
+    Поиск недостающих индексов
+
+    :param min_seq_scan: минимальное кол-во последовательных сканирований таблицы, при котором
+                         для неё предлагаются индексы (индексы на таблицах, которые и так читаются
+                         по индексам, только замедлят запись)
+    """
+    tables = collect_index_columns()
+    table_names = list(tables)
+
+    existing: dict[str, list[ExistingIndex]] = {name: list() for name in table_names}
+    for row in await connection.execute(EXISTING_INDEXES_QUERY, {'tables': table_names}):
+        existing[row.table_name].append(ExistingIndex(tuple(row.columns), row.predicate))
+
+    stats = {
+        row.table_name: TableStats(row.seq_scan, row.seq_tup_read, row.idx_scan, row.n_live_tup)
+        for row in await connection.execute(TABLE_STATS_QUERY, {'tables': table_names})
+    }
+
+    advices = list()
+    for table_name, (soft_delete, index_columns) in tables.items():
+        table_stats = stats.get(table_name, TableStats())
+        if table_stats.seq_scan < min_seq_scan:
+            continue
+
+        missing = [
+            columns for columns in index_columns if not is_covered(columns, existing[table_name], soft_delete)
+        ]
+        if missing:
+            advices.append(TableAdvice(table_name, soft_delete, table_stats, missing))
+
+    # сначала таблицы, на последовательное чтение которых уходит больше всего
+    return sorted(advices, key=lambda a: a.stats.seq_tup_read, reverse=True)
+
+
+def render_migration(advices: list[TableAdvice]) -> tuple[str, str]:
+    """
+    Тела функций ``upgrade``/``downgrade`` миграции с недостающими индексами
+    """
+    upgrades, downgrades = list(), list()
+    for advice in advices:
+        stats = advice.stats
+        upgrades.append(
+            f'# {advice.table_name}: seq_scan={stats.seq_scan}, seq_tup_read={stats.seq_tup_read}, '
+            f'idx_scan={stats.idx_scan}, n_live_tup={stats.n_live_tup}'
+        )
+        for columns in advice.missing:
+            where = ', postgresql_where=sa.text(NOT_DELETED_CONDITION)' if advice.soft_delete else ''
+            upgrades.append(
+                f'op.create_index({advice.index_name(columns)!r}, {advice.table_name!r}, {list(columns)!r}'
+                f'{where}, postgresql_concurrently=True)'
+            )
+            downgrades.append(
+                f'op.drop_index({advice.index_name(columns)!r}, table_name={advice.table_name!r}, '
+                f'postgresql_concurrently=True)'
+            )
+
+    def in_autocommit_block(lines: list[str]) -> str:
+        # CREATE/DROP INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+        return '\n    '.join(['with op.get_context().autocommit_block():', *(f'    {line}' for line in lines)])
+
+    return in_autocommit_block(upgrades), in_autocommit_block(downgrades)
+
+
+def write_migration(alembic_config: str, message: str, advices: list[TableAdvice]) -> str:
+    script_directory = ScriptDirectory.from_config(Config(alembic_config))
+    upgrades, downgrades = render_migration(advices)
+
+    script = script_directory.generate_revision(
+        util.rev_id(),
+        message,
+        head='head',
+        upgrades=upgrades,
+        downgrades=downgrades,
+        imports='\nfrom utils.orm_utils.softdelete import NOT_DELETED_CONDITION'
+    )
+    return script.path
+
+
+def import_cruds(packages: list[str]):
+    """
+    Импорт модулей, в которых создаются CRUD'ы (CRUD регистрируется при создании)
+    """
+    for package_name in packages:
+        package = importlib.import_module(package_name)
+        for module in pkgutil.walk_packages(getattr(package, '__path__', []), prefix=f'{package_name}.'):
+            importlib.import_module(module.name)
+
+
+async def main(args: argparse.Namespace):
+    import_cruds(args.packages)
+
+    async with db_engine.connect() as connection:
+        advices = await advise(connection, min_seq_scan=args.min_seq_scan)
+    await db_engine.dispose()
+
+    if not advices:
+        print('All registered sorting and filtering keys are covered by indexes')
+        return
+
+    for advice in advices:
+        for columns in advice.missing:
+            print(f'{advice.table_name}: missing index on ({", ".join(columns)}) '
+                  f'[seq_scan={advice.stats.seq_scan}, seq_tup_read={advice.stats.seq_tup_read}]')
+
+    if not args.dry_run:
+        print(f'Migration created: {write_migration(args.config, args.message, advices)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create migration with indexes for registered CRUD sorting/filtering')
+    parser.add_argument('-c', '--config', default='alembic.ini', help='path to alembic.ini')
+    parser.add_argument('-m', '--message', default='crud indexes', help='migration message')
+    parser.add_argument('--min-seq-scan', type=int, default=1, help='skip tables with fewer sequential scans')
+    parser.add_argument('--packages', nargs='+', default=['internals'], help='packages where CRUDs are created')
+    parser.add_argument('--dry-run', action='store_true', help='only print missing indexes')
+
+    asyncio.run(main(parser.parse_args()))
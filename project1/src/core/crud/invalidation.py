@@ -0,0 +1,138 @@
+"""
+Инвалидация кэша сущностей между процессами через postgres ``LISTEN/NOTIFY``.
+
+Каждый flush, затрагивающий кэшируемые сущности, отправляет ``pg_notify`` в той же транзакции, поэтому
+оповещение доставляется другим процессам только после commit'а (и не доставляется при rollback'е).
+Каждый процесс держит отдельное соединение, слушающее канал, и сбрасывает у себя указанные записи.
+
+Отправка включается явно вызовом ``setup_invalidation`` при запуске процесса.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from core.config import config
+from core.crud.cache import invalidation_publishers, invalidate_table, clear_all
+from core.crud.loader import identity_key
+from core.crud.types import Id
+
+# лимит postgres на payload – 8000 байт
+MAX_PAYLOAD_LENGTH = 7900
+
+logger = logging.getLogger('invalidation_bus')
+
+
+def _encode_payloads(table_name: str, ids: list[Id]) -> list[str]:
+    payloads, chunk, length = [], [], len(table_name) + 1
+    for id_ in ids:
+        id_ = identity_key(id_)
+        if chunk and length + len(id_) + 1 > MAX_PAYLOAD_LENGTH:
+            payloads.append(f'{table_name}:{",".join(chunk)}')
+            chunk, length = [], len(table_name) + 1
+        chunk.append(id_)
+        length += len(id_) + 1
+
+    if chunk:
+        payloads.append(f'{table_name}:{",".join(chunk)}')
+    return payloads
+
+
+def publish_invalidations(session: Session, flushed: list[tuple[type, Id]]):
+    """
+    Отправка оповещений об изменённых сущностях в рамках текущей транзакции сессии
+    """
+    connection = session.connection()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    by_table: dict[str, list[Id]] = dict()
+    for entity, id_ in flushed:
+        by_table.setdefault(entity.__table__.name, []).append(id_)
+
+    for table_name, ids in by_table.items():
+        for payload in _encode_payloads(table_name, ids):
+            connection.execute(select(func.pg_notify(config.cache_invalidation_channel, payload)))
+
+
+def setup_invalidation():
+    """
+    Включение оповещения других процессов об изменениях сущностей, записанных текущим процессом.
+    Вызывается при запуске каждого процесса, пишущего в БД: сервиса и консольных команд (``internals.*``)
+    """
+    if publish_invalidations not in invalidation_publishers:
+        invalidation_publishers.append(publish_invalidations)
+
+
+class InvalidationBus:
+    """
+    Слушатель оповещений об изменённых сущностях. Запускается один на процесс
+    """
+
+    def __init__(self, dsn: str, channel: str, reconnect_interval: float = 1):
+        """
+        :param dsn: строка подключения к postgres в формате asyncpg
+        :param channel: канал ``LISTEN/NOTIFY``
+        :param reconnect_interval: пауза между попытками переподключения
+        """
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_interval = reconnect_interval
+
+        self._connection: Optional[asyncpg.Connection] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._stopped = True
+
+    async def start(self):
+        self._stopped = False
+        await self._connect()
+
+    async def stop(self):
+        self._stopped = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+    async def _connect(self):
+        connection = await asyncpg.connect(self.dsn)
+        await connection.add_listener(self.channel, self._on_notification)
+        connection.add_termination_listener(self._on_termination)
+        self._connection = connection
+
+        # пока соединения не было, оповещения могли быть пропущены
+        clear_all()
+
+    def _on_notification(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str):
+        table_name, _, ids = payload.partition(':')
+        for id_ in ids.split(','):
+            invalidate_table(table_name, id_)
+
+    def _on_termination(self, connection: asyncpg.Connection):
+        if self._stopped:
+            return
+
+        logger.warning('Invalidation bus connection lost, reconnecting')
+        clear_all()
+        self._connection = None
+        self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while not self._stopped:
+            try:
+                await self._connect()
+                return
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning(f'Unable to reconnect invalidation bus: "{e}"')
+                await asyncio.sleep(self.reconnect_interval)
+
+
+invalidation_bus = InvalidationBus(
+    config.async_db_conn_str.replace('postgresql+asyncpg://', 'postgresql://', 1),
+    config.cache_invalidation_channel
+)
@@ -0,0 +1,187 @@
+"""
+Курсорная (keyset/seek) пагинация.
+
+Вместо ``OFFSET`` следующая страница выбирается условием "строго после последнего увиденного элемента"
+по ключу сортировки, поэтому стоимость любой страницы одинакова и не зависит от её номера.
+"""
+import base64
+import binascii
+import datetime
+import decimal
+import json
+import uuid
+from typing import Any
+
+import sqlalchemy
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.sql import Select, ColumnElement
+
+CURSOR_COLUMN_PREFIX = '_cursor_'
+
+
+def _dump_value(value: Any) -> list:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return ['', value]
+    elif isinstance(value, datetime.datetime):
+        return ['dt', value.isoformat()]
+    elif isinstance(value, datetime.date):
+        return ['d', value.isoformat()]
+    elif isinstance(value, uuid.UUID):
+        return ['u', str(value)]
+    elif isinstance(value, decimal.Decimal):
+        return ['dec', str(value)]
+
+    raise TypeError(f'Unable to store value of type "{type(value)}" in cursor')
+
+
+def _load_value(dumped: list) -> Any:
+    type_tag, value = dumped
+    if type_tag == '':
+        return value
+    elif type_tag == 'dt':
+        return datetime.datetime.fromisoformat(value)
+    elif type_tag == 'd':
+        return datetime.date.fromisoformat(value)
+    elif type_tag == 'u':
+        return uuid.UUID(value)
+    elif type_tag == 'dec':
+        return decimal.Decimal(value)
+
+    raise ValueError(f'Unknown cursor value type "{type_tag}"')
+
+
+def _is_nullable(column: ColumnElement) -> bool:
+    expression = getattr(column, 'expression', column)
+    return getattr(expression, 'nullable', True)
+
+
+class Keyset:
+    """
+    Ключ сортировки для курсорной пагинации: упорядоченный набор выражений с направлением сортировки.
+
+    Последним элементом всегда должен идти уникальный столбец (как правило ``id``), иначе порядок
+    элементов с одинаковым значением ключа не определён и элементы будут теряться между страницами.
+    """
+
+    def __init__(self, columns: list[tuple[ColumnElement, bool]], signature: str):
+        """
+        :param columns: пары (выражение сортировки, сортировать ли по убыванию)
+        :param signature: строковое описание сортировки. Сохраняется в курсоре, чтобы курсор, полученный
+                          при одной сортировке, нельзя было применить к другой
+        """
+        self.columns = columns
+        self.signature = signature
+
+    def encode(self, values: tuple[Any, ...]) -> str:
+        """
+        Формирование непрозрачного курсора из значений ключа сортировки последнего элемента страницы
+        """
+        payload = {'s': self.signature, 'v': [_dump_value(value) for value in values]}
+        raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode(self, cursor: str) -> list[Any]:
+        """
+        Разбор курсора, полученного от клиента
+
+        :raises ValueError: если курсор повреждён или был сформирован для другой сортировки
+        """
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            signature, dumped_values = payload['s'], payload['v']
+            values = [_load_value(value) for value in dumped_values]
+        except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, KeyError, TypeError) as e:
+            raise ValueError('Malformed cursor') from e
+
+        if signature != self.signature or len(values) != len(self.columns):
+            raise ValueError('Cursor does not match requested sorting')
+
+        return values
+
+    def order(self, query: Select) -> Select:
+        """
+        Применение сортировки по ключу к запросу
+        """
+        return query.order_by(*[
+            sqlalchemy.desc(column) if descending else sqlalchemy.asc(column)
+            for column, descending in self.columns
+        ])
+
+    def with_values(self, query: Select) -> Select:
+        """
+        Добавление значений ключа в выборку, чтобы по последней строке страницы можно было собрать курсор
+        (в т.ч. для вычисляемых функциями сортировки выражений, которых нет среди полей модели)
+        """
+        return query.add_columns(*[
+            column.label(f'{CURSOR_COLUMN_PREFIX}{i}') for i, (column, _) in enumerate(self.columns)
+        ])
+
+    def seek(self, query: Select, values: list[Any]) -> Select:
+        """
+        Ограничение выборки элементами, идущими строго после элемента с указанными значениями ключа
+        """
+        return query.where(self._after(0, values))
+
+    def _comparable_run(self, position: int, values: list[Any]) -> int:
+        """
+        Конец серии столбцов ключа, начиная с ``position``, которые можно сравнить одним сравнением кортежей:
+        с одинаковым направлением сортировки и без NULL в значениях курсора
+        """
+        _, descending = self.columns[position]
+        end = position
+        while end < len(self.columns):
+            _, column_descending = self.columns[end]
+            if column_descending != descending or values[end] is None:
+                break
+            end += 1
+
+        return end
+
+    def _after(self, position: int, values: list[Any]) -> ColumnElement:
+        column, descending = self.columns[position]
+        value = values[position]
+
+        run_end = self._comparable_run(position, values)
+        if run_end - position > 1:
+            # сравнение кортежей ``(a, b) > (:a, :b)`` целиком обслуживается одним составным индексом
+            run = list(zip(self.columns[position:run_end], values[position:run_end]))
+            columns = tuple_(*[run_column for (run_column, _), _ in run])
+            bound = tuple_(*[
+                sqlalchemy.literal(run_value, type_=run_column.type) for (run_column, _), run_value in run
+            ])
+            following = columns < bound if descending else columns > bound
+            if not descending:
+                # сравнение кортежей даёт NULL на первом NULL среди различающихся столбцов. При сортировке
+                # по убыванию такие строки идут раньше курсора и так не попадают в выборку, а при сортировке
+                # по возрастанию NULL идут последними – строки с равным началом и NULL в следующем столбце
+                # добавляются отдельными условиями
+                following = or_(following, *[
+                    and_(*[prefix_column == prefix_value for (prefix_column, _), prefix_value in run[:i]],
+                         run_column.is_(None))
+                    for i, ((run_column, _), _) in enumerate(run) if _is_nullable(run_column)
+                ])
+            if run_end == len(self.columns):
+                return following
+
+            equal = and_(*[run_column == run_value for (run_column, _), run_value in run])
+            return or_(following, and_(equal, self._after(run_end, values)))
+
+        is_last = position == len(self.columns) - 1
+
+        # postgres при сортировке по возрастанию ставит NULL в конец, а при сортировке по убыванию – в начало
+        if value is None:
+            if is_last:
+                return sqlalchemy.false()
+            same = and_(column.is_(None), self._after(position + 1, values))
+            return or_(same, column.is_not(None)) if descending else same
+
+        following = column < value if descending else column > value
+        if not descending and _is_nullable(column):
+            following = or_(following, column.is_(None))
+
+        if is_last:
+            return following
+
+        return or_(following, and_(column == value, self._after(position + 1, values)))
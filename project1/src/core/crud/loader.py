@@ -0,0 +1,159 @@
+"""
+Группировка одиночных запросов сущностей по идентификатору в один ``IN (...)`` запрос (DataLoader).
+
+Все вызовы ``load`` одного загрузчика, сделанные в рамках одной итерации event loop'а
+(например, через ``asyncio.gather``), выполняются одним запросом к БД. Идентификаторы приводятся к типу
+первичного ключа до попадания в запрос: некорректный идентификатор приводит к ошибке только того вызова,
+в котором он передан, а не всех вызовов, объединённых в запрос.
+"""
+import asyncio
+import uuid
+from contextlib import suppress
+from typing import Any, Generic, Hashable, Type
+
+import sqlalchemy
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import TypeEngine
+
+from core.crud.exceptions import ObjectNotExists
+from core.crud.retrieve import retrieve_batch
+from core.crud.types import Entity, Id
+
+SESSION_LOADERS_KEY = 'crud_loaders'
+
+
+def identity_key(value: Id) -> str:
+    """
+    Приведение идентификатора к единому виду: postgres сравнивает uuid без учёта регистра,
+    поэтому и сопоставлять запрошенные идентификаторы с полученными нужно так же
+    """
+    with suppress(ValueError, TypeError, AttributeError):
+        return str(uuid.UUID(str(value)))
+    return str(value)
+
+
+def normalize_id(column_type: TypeEngine, value: Id) -> Id:
+    """
+    Приведение идентификатора к python типу столбца первичного ключа
+
+    :raise ValueError: если значение нельзя привести к типу столбца
+    """
+    if isinstance(column_type, postgresql.UUID):
+        try:
+            normalized = uuid.UUID(str(value))
+        except (ValueError, AttributeError) as e:
+            raise ValueError(f'Invalid uuid "{value}"') from e
+        return normalized if column_type.as_uuid else str(normalized)
+
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        return value
+
+    if isinstance(value, python_type):
+        return value
+    try:
+        return python_type(value)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'Invalid identifier "{value}"') from e
+
+
+class BatchLoader(Generic[Entity]):
+    """
+    Загрузчик сущностей одного типа в рамках одной сессии (т.е. одного запроса к API)
+    """
+
+    def __init__(self, session: AsyncSession, entity: Type[Entity], options: list[Any] = None):
+        self.session = session
+        self.entity = entity
+        self.options = options or []
+        self._id_type = sqlalchemy.inspect(entity).primary_key[0].type
+
+        self._pending: dict[str, tuple[Id, list[asyncio.Future]]] = dict()
+        self._scheduled = False
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self, id_: Id) -> Entity:
+        """
+        Получение сущности по идентификатору
+
+        :raise ObjectNotExists: если сущность не найдена или идентификатор некорректен
+        """
+        try:
+            id_ = normalize_id(self._id_type, id_)
+        except ValueError:
+            raise ObjectNotExists(f'Object {self.entity.__name__} not found in database', id_)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        key = identity_key(id_)
+        if key in self._pending:
+            self._pending[key][1].append(future)
+        else:
+            self._pending[key] = (id_, [future])
+
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self._dispatch)
+
+        return await future
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, dict()
+        self._scheduled = False
+        task = asyncio.create_task(self._resolve(pending))
+        # event loop хранит только слабые ссылки на задачи
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, pending: dict[str, tuple[Id, list[asyncio.Future]]]):
+        try:
+            objects = await retrieve_batch(
+                self.session,
+                self.entity,
+                [id_ for id_, _ in pending.values()],
+                query=select(self.entity).options(*self.options),
+                ensure_exists=False
+            )
+        except Exception as e:
+            for _, futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        found = {identity_key(id_): obj for id_, obj in objects.items()}
+        for key, (id_, futures) in pending.items():
+            obj = found.get(key)
+            for future in futures:
+                if future.done():
+                    continue
+                if obj is None:
+                    future.set_exception(
+                        ObjectNotExists(f'Object {self.entity.__name__} not found in database', id_)
+                    )
+                else:
+                    future.set_result(obj)
+
+
+def get_loader(
+        session: AsyncSession,
+        owner: Hashable,
+        entity: Type[Entity],
+        options: list[Any] = None
+) -> BatchLoader[Entity]:
+    """
+    Получение загрузчика, привязанного к сессии. Сессия живёт в рамках одного запроса к API,
+    поэтому и загрузчик (вместе с набранными идентификаторами) не переживает запрос
+
+    :param owner: владелец загрузчика (как правило CRUD), у разных CRUD'ов могут отличаться ``options``
+    """
+    loaders: dict[Hashable, BatchLoader] = session.info.setdefault(SESSION_LOADERS_KEY, dict())
+
+    if (loader := loaders.get(owner)) is None:
+        loader = loaders[owner] = BatchLoader(session, entity, options)
+
+    return loader
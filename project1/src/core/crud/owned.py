@@ -1,4 +1,5 @@
 from contextvars import ContextVar
+from typing import Iterable
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -14,6 +15,7 @@ class CreatedByCrud(BaseCrud):
     """
 
     user_id: ContextVar[int] = ContextVar('user_id', default=None)
+    upsert_immutable_fields = {'created_by'}
 
     async def _after_values_extracted(
             self,
@@ -37,3 +39,39 @@ class CreatedByCrud(BaseCrud):
     ) -> Entity:
         self.user_id.set(created_by.id)
         return await super().create(session, data, exclude=exclude, **kwargs)
+
+    # noinspection PyMethodOverriding
+    async def create_many(
+            self,
+            session: AsyncSession,
+            data: Iterable[Model],
+            created_by: UserJWTInfo,
+            *,
+            exclude: set[str] = None,
+            batch_size: int = None,
+            **kwargs
+    ) -> list[Entity]:
+        self.user_id.set(created_by.id)
+        return await super().create_many(session, data, exclude=exclude, batch_size=batch_size, **kwargs)
+
+    # noinspection PyMethodOverriding
+    async def upsert_many(
+            self,
+            session: AsyncSession,
+            data: Iterable[Model],
+            created_by: UserJWTInfo,
+            **kwargs
+    ) -> list[Entity]:
+        self.user_id.set(created_by.id)
+        return await super().upsert_many(session, data, **kwargs)
+
+    # noinspection PyMethodOverriding
+    async def upsert(
+            self,
+            session: AsyncSession,
+            data: Model,
+            created_by: UserJWTInfo,
+            **kwargs
+    ) -> Entity:
+        self.user_id.set(created_by.id)
+        return await super().upsert(session, data, **kwargs)
@@ -1,4 +1,5 @@
-from typing import Type, List, Any, Collection, Iterable, Callable, TypeVar
+import json
+from typing import Type, List, Any, Collection, Iterable, Callable, TypeVar, Hashable, AsyncIterator, NamedTuple
 
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -6,9 +7,16 @@ from sqlalchemy.orm import Session
 from sqlalchemy.sql import Select
 
 from core.crud.exceptions import ObjectNotExists
-from core.crud.types import Entity, Id, Count
+from core.crud.keyset import Keyset
+from core.crud.types import Entity, Id, Page, Count, CountStrategy
 from models import Base
 from schemas.base import Model
+from utils.cache import TTLCache
+from utils.orm_utils.softdelete import SoftDeleteMixin
+
+ESTIMATE_EXACT_THRESHOLD = 1000
+WINDOW_TOTAL_COLUMN = '_total'
+DEFAULT_YIELD_PER = 500
 
 
 async def retrieve_object(
@@ -40,6 +48,75 @@ async def retrieve_object(
     return obj
 
 
+async def exact_count(session: AsyncSession, query: Select, params: dict[str, Any] = None) -> Count:
+    return (await session.execute(select(func.count('*')).select_from(query), params)).scalar_one()
+
+
+async def estimate_count(
+        session: AsyncSession,
+        ModelClass: Type[Entity],
+        query: Select,
+        with_deleted: bool = False,
+        params: dict[str, Any] = None
+) -> Count:
+    """
+    Оценка кол-ва строк запроса по статистике планировщика postgres (``EXPLAIN``) без выполнения самого запроса
+
+    Для таблицы без условий оценка планировщика совпадает с ``pg_class.reltuples``
+    """
+    if not with_deleted and issubclass(ModelClass, SoftDeleteMixin):
+        # EXPLAIN выполняется в обход ORM, поэтому условие soft delete необходимо добавить явно
+        query = query.where(ModelClass.deleted_at.is_(None))
+    if params:
+        # значения нужны при компиляции: списки ``IN`` раскрываются в отдельные параметры
+        query = query.params(params)
+
+    connection = await session.connection()
+    compiled = query.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    plan = (await connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}', params)).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return Count(int(plan[0]['Plan']['Plan Rows']))
+
+
+async def count_rows(
+        session: AsyncSession,
+        ModelClass: Type[Entity],
+        query: Select,
+        strategy: CountStrategy = CountStrategy.exact,
+        with_deleted: bool = False,
+        cache: TTLCache = None,
+        cache_key: Hashable = None,
+        estimate_threshold: int = ESTIMATE_EXACT_THRESHOLD,
+        params: dict[str, Any] = None
+) -> tuple[Count, bool]:
+    """
+    Подсчёт общего кол-ва строк запроса выбранным способом
+
+    :return: кол-во строк и признак того, что значение точное (а не оценка или значение из кэша)
+    """
+    if strategy == CountStrategy.cached and cache is not None:
+        if (cached := cache.get(cache_key)) is not None:
+            return cached, False
+
+        count = await exact_count(session, query, params)
+        cache.set(cache_key, count)
+        return count, True
+
+    if strategy == CountStrategy.estimate:
+        estimated = await estimate_count(session, ModelClass, query, with_deleted, params)
+        # на небольших выборках точный подсчёт дёшев, а погрешность оценки заметна
+        if estimated >= estimate_threshold:
+            return estimated, False
+
+    return await exact_count(session, query, params), True
+
+
 async def pagination(
         session: AsyncSession,
         ModelClass: Type[Entity],
@@ -47,18 +124,40 @@ async def pagination(
         rows_per_page: int | None = 25,
         with_count: bool = True,
         with_deleted: bool = False,
-        query: Select = None
-) -> tuple[list[Entity], Count]:
+        query: Select = None,
+        keyset: Keyset = None,
+        cursor: list[Any] = None,
+        count_strategy: CountStrategy = CountStrategy.exact,
+        count_cache: TTLCache = None,
+        count_cache_key: Hashable = None,
+        estimate_threshold: int = ESTIMATE_EXACT_THRESHOLD,
+        params: dict[str, Any] = None
+) -> Page:
     """
     Выполняет запрос с пагинацией.
 
+    Если передан ``keyset``, то вместо ``OFFSET`` используется курсорная пагинация: запрос упорядочивается
+    по ключу ``keyset``, а ``page`` игнорируется. Страница начинается сразу после элемента, значения ключа
+    которого переданы в ``cursor`` (без курсора – с начала выборки).
+
+    При ``CountStrategy.window`` общее кол-во запрашивается тем же запросом, что и страница, через
+    ``count(*) OVER ()``. Отдельный ``COUNT(*)`` выполняется только для пустой страницы за пределами выборки
+    и для страниц курсорной пагинации после первой.
+
     Явно указывать запрос им
     :param query: запрос по которому будет выполнен запрос
     :param page: страница
     :param rows_per_page: кол-во элементов на 1 странице выдачи
     :param with_deleted: игнорирования удалённых записей использующих SoftDeleteMixin
     :param ModelClass: класс для возвращаемых значений. Нужен для typehints
-    :return: Список значений и предельное их кол-во
+    :param keyset: ключ сортировки для курсорной пагинации
+    :param cursor: разобранные значения ключа последнего элемента предыдущей страницы
+    :param count_strategy: способ подсчёта общего кол-ва элементов
+    :param count_cache: кэш для ``CountStrategy.cached``
+    :param count_cache_key: ключ в кэше кол-ва элементов, однозначно описывающий набор фильтров запроса
+    :param estimate_threshold: при оценке кол-ва меньше данного порога выполняется точный подсчёт
+    :param params: значения параметров (``bindparam``) запроса
+    :return: Список значений, предельное их кол-во и курсор следующей страницы
     """
     if query is None:
         query = select(ModelClass)
@@ -66,89 +165,143 @@ async def pagination(
     if with_deleted:
         query = query.execution_options(include_deleted=True)
 
-    if with_count:
-        rows_number = (await session.execute(select(func.count('*')).select_from(query))).scalar_one()
+    # при курсорной пагинации оконная функция посчитала бы только элементы после курсора
+    window_count = with_count and count_strategy == CountStrategy.window and cursor is None
+
+    rows_number, is_exact = None, True
+    if with_count and not window_count:
+        rows_number, is_exact = await count_rows(
+            session,
+            ModelClass,
+            query,
+            count_strategy,
+            with_deleted,
+            count_cache,
+            count_cache_key,
+            estimate_threshold,
+            params
+        )
+
+    if keyset is not None:
+        page_query = keyset.with_values(keyset.order(query))
+        if cursor is not None:
+            page_query = keyset.seek(page_query, cursor)
+        if rows_per_page:
+            # лишний элемент запрашивается только для того, чтобы понять, есть ли следующая страница
+            page_query = page_query.limit(rows_per_page + 1)
     else:
-        rows_number = None
+        page_query = query.limit(rows_per_page) if rows_per_page else query
+        page_query = page_query.offset((page - 1) * (rows_per_page or 0))
 
-    if rows_per_page:
-        query = query.limit(rows_per_page)
+    if window_count:
+        page_query = page_query.add_columns(func.count().over().label(WINDOW_TOTAL_COLUMN))
 
-    final_query = query.offset((page - 1) * (rows_per_page or 0))
+    rows = (await session.execute(page_query, params)).unique().all()
 
-    values = (await session.execute(final_query)).scalars().unique().all()
-    return values, rows_number
+    if window_count:
+        if rows:
+            rows_number = rows[0][-1]
+        elif page > 1 and keyset is None:
+            # за пределами выборки оконной функции не по чему считать, кол-во запрашивается отдельно
+            rows_number = await exact_count(session, query, params)
+        else:
+            rows_number = 0
 
+    next_cursor = None
+    if keyset is not None and rows_per_page and len(rows) > rows_per_page:
+        rows = rows[:rows_per_page]
+        next_cursor = keyset.encode(tuple(rows[-1])[1:len(keyset.columns) + 1])
 
-Existing = TypeVar('Existing', bound=Base)
-Arrived = TypeVar('Arrived', bound=Model)
+    return Page([row[0] for row in rows], rows_number, next_cursor, is_exact)
 
 
-async def refresh_collection(
+async def stream(
         session: AsyncSession,
-        existing_objects: Iterable[Existing],
-        arrived_objects: Iterable[Arrived],
-        creation_class: Type[Existing],
-        secondary_relation_base_obj_name: str,
-        exclude_on_creation: set[str] = None,
-        equal_by: str | Callable[[Existing, Arrived], bool] = 'id',
-        creation_func: Callable = None,
+        ModelClass: Type[Entity],
+        query: Select = None,
+        with_deleted: bool = False,
+        yield_per: int = DEFAULT_YIELD_PER,
+        params: dict[str, Any] = None
+) -> AsyncIterator[Entity]:
+    """
+    Потоковое выполнение запроса через server-side курсор.
 
-        **creation_params: Any,
+    В памяти одновременно находится не более ``yield_per`` строк. Загруженные объекты не удерживаются
+    сессией (identity map хранит слабые ссылки), пока они не были изменены.
 
-) -> List[Existing]:
+    :param query: запрос по которому будет выполнен запрос
+    :param with_deleted: игнорирования удалённых записей использующих SoftDeleteMixin
+    :param yield_per: кол-во строк, запрашиваемых у БД за раз
+    :param params: значения параметров (``bindparam``) запроса
+    :param ModelClass: класс для возвращаемых значений. Нужен для typehints
     """
-    Актуализация списка значений исходя из прибывших
+    if query is None:
+        query = select(ModelClass)
+
+    if with_deleted:
+        query = query.execution_options(include_deleted=True)
 
-    **Обязательно наличие поля** `id`
+    result = await session.stream(query.execution_options(yield_per=yield_per), params)
+    async for obj in result.scalars():
+        yield obj
 
-    :param session:
-    :param existing_objects:
-    :param arrived_objects:
-    :param equal_by:
-    :param creation_class:
-    :param exclude_on_creation:
-    :param creation_params:
-    :param secondary_relation_base_obj_name: имя настоящей сущности у secondary объекта
-    :return:
+
+Existing = TypeVar('Existing', bound=Base)
+Arrived = TypeVar('Arrived', bound=Model)
+
+
+class CollectionDiff(NamedTuple):
     """
-    if exclude_on_creation is None:
-        exclude_on_creation = set()
+    Разница между текущим и прибывшим набором элементов коллекции
+    """
+    # прибывшие элементы, которых нет среди существующих
+    added: list[Arrived]
+    # существующие элементы, которые есть среди прибывших
+    kept: list[Existing]
+    # существующие элементы, которых нет среди прибывших
+    removed: list[Existing]
 
-    if type(equal_by) == str:
-        equal_by_arg = equal_by
-        equal_by = lambda e, a: getattr(e, equal_by_arg) == getattr(a, equal_by_arg, None)
-    new_values = []
 
-    matched_objects = []
+def diff_collection(
+        existing_objects: Iterable[Existing],
+        arrived_objects: Iterable[Arrived],
+        equal_by: str | Callable[[Existing, Arrived], bool] = 'id'
+) -> CollectionDiff:
+    """
+    Вычисление добавленных, оставшихся и удалённых элементов коллекции.
+
+    При сравнении по полю (``equal_by`` – строка) существующие элементы индексируются по значению поля,
+    поэтому сравнение выполняется за линейное время. Функция сравнения допускает только попарную
+    проверку и работает за O(n·m) – её стоит использовать только для небольших коллекций
 
-    for arrived in arrived_objects:
-        matched = list(filter(lambda existing: equal_by(existing, arrived), existing_objects))
-        if matched:
-            matched_objects.append(matched[0])
-        else:
-            new_values.append(arrived)
+    :param equal_by: поле, по которому сравниваются элементы, или функция сравнения
+    """
+    existing_objects = list(existing_objects)
 
-    if creation_func is None:
-        values = [
-            creation_class(**new.dict(exclude=exclude_on_creation), **creation_params)
-            for new in new_values
-        ]
+    if type(equal_by) == str:
+        existing_by_key = {getattr(existing, equal_by): existing for existing in existing_objects}
+        match = lambda arrived: existing_by_key.get(getattr(arrived, equal_by, None))
     else:
-        values = [
-            creation_func(**new.dict(exclude=exclude_on_creation), **creation_params) for new in
-            new_values
-        ]
+        match = lambda arrived: next((e for e in existing_objects if equal_by(e, arrived)), None)
 
-    session.add_all(values)
-    await session.flush()
-
-    def _new_files(session):
-        return [getattr(i, secondary_relation_base_obj_name) for i in values]
+    added, added_keys, kept, kept_ids = [], set(), [], set()
+    for arrived in arrived_objects:
+        matched = match(arrived)
+        if matched is None:
+            # повторно прибывший новый элемент добавляется один раз (иначе, например, нарушится первичный ключ связи)
+            if type(equal_by) == str:
+                key = getattr(arrived, equal_by, None)
+                if key in added_keys:
+                    continue
+                added_keys.add(key)
+            added.append(arrived)
+        elif id(matched) not in kept_ids:
+            kept.append(matched)
+            kept_ids.add(id(matched))
 
-    entity_values = await session.run_sync(_new_files)
+    removed = [existing for existing in existing_objects if id(existing) not in kept_ids]
 
-    return [*matched_objects, *entity_values]
+    return CollectionDiff(added, kept, removed)
 
 
 RetrieveType = TypeVar('RetrieveType', bound=Base)
@@ -177,7 +330,8 @@ async def retrieve_batch(
         model: Type[RetrieveType],
         ids: Collection[int | str],
         query: Select = None,
-        attr_name: str = 'id'
+        attr_name: str = 'id',
+        ensure_exists: bool = True
 ) -> dict[int | str, RetrieveType]:
     """
     Запрашивает набор объектов по идентификатором из базы данных
@@ -186,7 +340,8 @@ async def retrieve_batch(
     :param model: запрашиваемая модель
     :param ids: список идентификаторов объектов для данной модели
     :param attr_name: поле, по которому будут запрашиваться сущности. Подразумевается уникальность по данному полю
-    :raises ObjectNotExists при отсутствии одной из запрашиваемых записей
+    :param ensure_exists: проверять ли, что найдены все запрашиваемые записи
+    :raises ObjectNotExists при отсутствии одной из запрашиваемых записей (если указан ``ensure_exists``)
     :return: словарь из пар идентификатор:объект
     """
 
@@ -194,6 +349,7 @@ async def retrieve_batch(
 
     objects = (await session.execute(query)).scalars().all()
 
-    check_missing_entities(ids, objects, model)
+    if ensure_exists:
+        check_missing_entities(ids, objects, model)
 
     return {getattr(obj, attr_name): obj for obj in objects}
@@ -1,7 +1,37 @@
-from typing import TypeVar, NewType
+import enum
+from typing import TypeVar, NewType, NamedTuple, Any
 
 Entity = TypeVar('Entity')
 
 Id = int | str
 
 Count = NewType('Count', int)
+
+
+class PaginationMode(str, enum.Enum):
+    offset = 'offset'
+    cursor = 'cursor'
+
+
+class CountStrategy(str, enum.Enum):
+    """
+    Способ подсчёта общего кол-ва элементов выборки
+    """
+    # честный ``COUNT(*)`` на каждый запрос
+    exact = 'exact'
+    # ``COUNT(*)``, результат которого кэшируется на время ``count_cache_ttl`` по набору фильтров
+    cached = 'cached'
+    # оценка планировщика postgres (``EXPLAIN``), без сканирования таблицы
+    estimate = 'estimate'
+    # ``count(*) OVER ()`` в запросе самой страницы – страница и кол-во за один запрос к БД
+    window = 'window'
+
+
+class Page(NamedTuple):
+    """
+    Результат постраничной выборки
+    """
+    objects: list[Any]
+    total: Count | None = None
+    next_cursor: str | None = None
+    total_is_exact: bool = True
@@ -0,0 +1,175 @@
+"""
+Перенос давно удалённых (soft delete) записей в архивные таблицы.
+
+Запускается отдельным процессом, например по расписанию: ``python -m internals.archive``.
+Записи переносятся небольшими пачками, каждая в своей короткой транзакции
+(``WITH moved AS (DELETE ... RETURNING *) INSERT INTO <archive> SELECT ...``), поэтому таблица не блокируется
+надолго, а строки, заблокированные другими транзакциями, пропускаются (``SKIP LOCKED``) до следующего прохода.
+
+Перенос в архив – окончательное удаление файла: в той же транзакции освобождаются ссылки на содержимое,
+хранящееся по хэшу (``file_blobs``), после чего удаляются blob'ы, на которые больше не ссылается ни один файл
+(в т.ч. освобождённые при замене содержимого файла). Содержимое, сохранённое не по хэшу (``FileStorageMode.unique``
+и файлы, загруженные до появления blob'ов), удаляется после фиксации транзакции пачки.
+"""
+import asyncio
+import contextlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, AsyncContextManager, Awaitable, NamedTuple, Optional, Sequence
+
+import aiofiles.os
+
+import sqlalchemy as sa
+from sqlalchemy import select, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from core.config import config
+from core.crud.exceptions import ObjectNotExists
+from core.crud.invalidation import setup_invalidation
+from internals.files import FileHandler
+from internals.storage import get_full_path
+from models import File
+from utils.db_session import db_session_manager
+from utils.orm_utils.softdelete import archive_tables, archived_columns
+
+logger = logging.getLogger('archive')
+
+
+class ArchiveHook(NamedTuple):
+    """
+    Действие над перенесёнными в архив записями в транзакции переноса пачки
+    """
+    # столбцы перенесённых записей, передаваемые в callback
+    columns: tuple[str, ...]
+    callback: Callable[[AsyncSession, Sequence[sa.engine.Row]], Awaitable[Any]]
+    # действие после фиксации транзакции пачки, получает результат callback'а
+    committed: Optional[Callable[[Any], Awaitable[None]]] = None
+
+
+async def release_archived_files(session: AsyncSession, rows: Sequence[sa.engine.Row]) -> set[tuple[str, str]]:
+    """
+    Освобождение ссылок на blob'ы перенесённых в архив файлов
+
+    :return: каталоги хранилища и пути файлов, сохранённых не по хэшу, для удаления после фиксации транзакции
+    """
+    await FileHandler.release_blobs(session, [(row.digest, row.path) for row in rows if row.digest is not None])
+
+    paths = {
+        (row.storage_root, row.path) for row in rows
+        if row.path and not row.path.startswith(f'{FileHandler.BLOB_DIRECTORY}/')
+    }
+    if paths:
+        # путь, указанный вручную при изменении файла, может быть и у другой записи
+        used = (await session.execute(
+            select(File.storage_root, File.path).where(sa.tuple_(File.storage_root, File.path).in_(paths)),
+            execution_options={'include_deleted': True}
+        )).all()
+        paths.difference_update(tuple(row) for row in used)
+    return paths
+
+
+async def remove_archived_files(paths: set[tuple[str, str]]):
+    for root, path in paths:
+        with contextlib.suppress(FileNotFoundError, ObjectNotExists):
+            await aiofiles.os.remove(get_full_path(root, path))
+
+
+# таблица -> действие над перенесёнными записями
+archive_hooks: dict[sa.Table, ArchiveHook] = {
+    File.__table__: ArchiveHook(('digest', 'path', 'storage_root'), release_archived_files, remove_archived_files)
+}
+
+
+def archive_statement(
+        table: sa.Table,
+        archive: sa.Table,
+        deleted_before: datetime,
+        batch_size: int,
+        returning: Sequence[str] = ()
+) -> sa.sql.Insert:
+    """
+    Запрос переноса одной пачки удалённых до ``deleted_before`` записей из ``table`` в ``archive``
+
+    :param returning: столбцы перенесённых записей, которые возвращает запрос
+    """
+    batch = (
+        select(*table.primary_key.columns)
+        .where(table.c.deleted_at < deleted_before)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    moved = (
+        delete(table)
+        .where(sa.tuple_(*table.primary_key.columns).in_(batch))
+        .returning(*archived_columns(table))
+        .cte('moved')
+    )
+    columns = [column.name for column in archived_columns(table)]
+
+    statement = insert(archive).from_select(columns, select(*(moved.c[name] for name in columns)))
+    if returning:
+        statement = statement.returning(*(archive.c[name] for name in returning))
+    return statement
+
+
+async def archive_deleted(
+        table: sa.Table,
+        archive: sa.Table,
+        retention: timedelta,
+        batch_size: int = 1000,
+        pause: float = 0.1,
+        session_manager: Callable[[], AsyncContextManager[AsyncSession]] = db_session_manager,
+        hook: ArchiveHook = None
+) -> int:
+    """
+    Перенос в архив всех записей, удалённых раньше, чем ``retention`` назад
+
+    :param table: таблица с мягким удалением
+    :param archive: архивная таблица (см. ``archive_table``)
+    :param retention: сколько удалённые записи хранятся в исходной таблице
+    :param batch_size: кол-во записей, переносимых одной транзакцией
+    :param pause: пауза между пачками, чтобы не создавать постоянную нагрузку на БД
+    :param session_manager: фабрика сессий, каждая пачка выполняется в отдельной сессии (транзакции)
+    :param hook: действие над перенесёнными записями каждой пачки (в той же транзакции и после её фиксации)
+    :return: общее кол-во перенесённых записей
+    """
+    statement = archive_statement(
+        table, archive, datetime.now() - retention, batch_size, returning=hook.columns if hook else ()
+    )
+
+    total = 0
+    while True:
+        async with session_manager() as session:
+            result = await session.execute(statement, execution_options={'include_deleted': True})
+            if hook is None:
+                moved = result.rowcount
+            else:
+                rows = result.all()
+                moved = len(rows)
+                hook_result = await hook.callback(session, rows)
+
+        if hook is not None and hook.committed is not None and moved:
+            await hook.committed(hook_result)
+
+        total += moved
+        if moved < batch_size:
+            return total
+
+        await asyncio.sleep(pause)
+
+
+async def archive_all(retention: timedelta, batch_size: int):
+    for table, archive in archive_tables.items():
+        moved = await archive_deleted(table, archive, retention, batch_size, hook=archive_hooks.get(table))
+        logger.info(f'Moved {moved} deleted rows from "{table.name}" to "{archive.name}"')
+
+    async with db_session_manager() as session:
+        removed = await FileHandler.remove_unreferenced_blobs(session)
+    logger.info(f'Removed {removed} unreferenced blobs')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    setup_invalidation()
+    asyncio.run(archive_all(timedelta(days=config.archive_retention_days), config.archive_batch_size))
@@ -0,0 +1,225 @@
+"""
+Перенос существующих файлов в раскладку каталогов ``config.file_layout`` без остановки сервиса.
+
+Запускается отдельным процессом после смены раскладки: ``python -m internals.file_layout``.
+Файлы обрабатываются пачками, каждая в своей короткой транзакции (заблокированные строки пропускаются
+до следующего запуска):
+
+1. на каждый файл пачки создаётся жёсткая ссылка по новому пути (копия, если другая файловая система)
+2. ``path`` пачки переписывается одним запросом, кэш сущностей инвалидируется, транзакция фиксируется
+3. старые пути удаляются после паузы (``grace``, не меньше времени жизни кэша сущностей ``config.entity_cache_ttl``).
+   Пауза не задерживает следующие пачки: старые пути ждут её истечения в очереди, после последней пачки
+   оставшиеся удаляются по истечении паузы
+
+До удаления старых путей файл доступен по обоим, поэтому запросы, успевшие прочитать старый путь
+(или получившие его из кэша до инвалидации), отдают файл без ошибок. Повторный запуск безопасен:
+уже перенесённые файлы пропускаются. Файлы переносятся в пределах своего каталога хранилища.
+"""
+import argparse
+import asyncio
+import contextlib
+import errno
+import logging
+import os
+import pathlib
+import shutil
+from collections import deque
+from typing import Callable, AsyncContextManager, Optional
+
+import sqlalchemy as sa
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import config
+from core.crud.cache import invalidate_written
+from core.crud.invalidation import setup_invalidation
+from internals.files import FileHandler
+from internals.storage import get_roots
+from internals.uploads import UPLOAD_DIRECTORY
+from models import File
+from utils.db_session import db_session_manager
+from utils.orm_utils.softdelete import archive_tables
+
+logger = logging.getLogger('file_layout')
+
+# каталоги хранилища, не относящиеся к каталогам пользователей
+SERVICE_DIRECTORIES = {FileHandler.BLOB_DIRECTORY, FileHandler.TMP_DIRECTORY, UPLOAD_DIRECTORY}
+
+
+def target_path(path: str) -> Optional[str]:
+    """
+    Путь файла (относительно каталога хранилища) в текущей раскладке.
+    ``None`` для файлов вне каталогов пользователей (blob'ы хранилища по хэшу)
+    """
+    parts = pathlib.PurePosixPath(path).parts
+    if len(parts) < 2 or parts[0] in SERVICE_DIRECTORIES:
+        return None
+
+    return str(FileHandler.get_layout_path(pathlib.PurePosixPath(parts[0]), parts[-1]))
+
+
+def _link(source: pathlib.Path, target: pathlib.Path) -> bool:
+    """
+    :return: ``False``, если исходного файла нет
+    """
+    if not source.exists():
+        return False
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        return False
+    except FileExistsError:
+        # остался от прерванного запуска
+        pass
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.copy2(source, target)
+
+    return True
+
+
+def _unlink(path: pathlib.Path, user_dir: pathlib.Path):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+    # опустевшие подкаталоги прежней раскладки (до каталога пользователя)
+    parent = path.parent
+    while parent != user_dir and user_dir in parent.parents:
+        try:
+            parent.rmdir()
+        except OSError:
+            break
+        parent = parent.parent
+
+
+async def _remove_old_paths(pending: deque, until: float):
+    """
+    Удаление старых путей пачек, пауза которых истекла к ``until``
+
+    :param pending: очередь пачек ``(срок удаления, [(каталог хранилища, старый путь)])`` в порядке сроков
+    """
+    loop = asyncio.get_running_loop()
+    while pending and pending[0][0] <= until:
+        _, paths = pending.popleft()
+        for root_path, path in paths:
+            user_dir = root_path / pathlib.PurePosixPath(path).parts[0]
+            await loop.run_in_executor(None, _unlink, root_path / path, user_dir)
+
+
+async def relayout_table(
+        table: sa.Table,
+        entity: Optional[type] = None,
+        batch_size: int = 500,
+        grace: float = None,
+        dry_run: bool = False,
+        session_manager: Callable[[], AsyncContextManager[AsyncSession]] = db_session_manager
+) -> int:
+    """
+    Перенос файлов, на которые ссылаются строки ``table``
+
+    :param entity: ORM класс таблицы, для инвалидации кэша сущностей (``None`` для архивных таблиц)
+    :param batch_size: кол-во строк, обрабатываемых одной транзакцией
+    :param grace: пауза между фиксацией новых путей и удалением старых, не меньше ``config.entity_cache_ttl``
+                  (по умолчанию): столько же старый путь может оставаться в кэше сущностей другого процесса
+    :param dry_run: только подсчитать файлы, требующие переноса
+    :return: кол-во перенесённых файлов
+    """
+    if grace is None or grace < config.entity_cache_ttl:
+        if grace is not None:
+            logger.warning(f'Grace period {grace}s is shorter than entity cache TTL, {config.entity_cache_ttl}s used')
+        grace = config.entity_cache_ttl
+    # остальные процессы узнают о новых путях из оповещений, отправляемых при инвалидации
+    setup_invalidation()
+
+    loop = asyncio.get_running_loop()
+    roots = get_roots()
+    update_paths = (
+        update(table)
+        .where(table.c.id == bindparam('_id'))
+        .values(path=bindparam('_path'))
+        .execution_options(synchronize_session=False)
+    )
+
+    pending = deque()
+    total, last_id = 0, None
+    while True:
+        async with session_manager() as session:
+            query = select(table.c.id, table.c.path, table.c.storage_root).order_by(table.c.id).limit(batch_size)
+            if last_id is not None:
+                query = query.where(table.c.id > last_id)
+            if not dry_run:
+                query = query.with_for_update(skip_locked=True)
+
+            rows = (await session.execute(query, execution_options={'include_deleted': True})).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            moves = []
+            for row in rows:
+                if not row.path or (target := target_path(row.path)) is None or target == row.path:
+                    continue
+                if row.storage_root not in roots:
+                    logger.warning(f'Storage root "{row.storage_root}" of {table.name} {row.id} not configured, skipped')
+                    continue
+                moves.append((row.id, roots[row.storage_root].path, row.path, target))
+
+            if dry_run:
+                total += len(moves)
+                continue
+
+            moved = []
+            for id_, root_path, path, target in moves:
+                if await loop.run_in_executor(None, _link, root_path / path, root_path / target):
+                    moved.append((id_, root_path, path, target))
+                else:
+                    logger.warning(f'File "{path}" of {table.name} {id_} not found, skipped')
+
+            if moved:
+                await session.execute(
+                    update_paths,
+                    [{'_id': id_, '_path': target} for id_, _, _, target in moved],
+                    execution_options={'include_deleted': True}
+                )
+                if entity is not None:
+                    await session.run_sync(invalidate_written, [(entity, id_) for id_, *_ in moved])
+
+        if moved:
+            # отсчёт паузы – с фиксации транзакции
+            pending.append((loop.time() + grace, [(root_path, path) for _, root_path, path, _ in moved]))
+            total += len(moved)
+            logger.info(f'{table.name}: moved {total} files')
+
+        await _remove_old_paths(pending, loop.time())
+
+    if pending:
+        await asyncio.sleep(max(pending[-1][0] - loop.time(), 0))
+        await _remove_old_paths(pending, pending[-1][0])
+
+    return total
+
+
+async def relayout_all(batch_size: int, grace: Optional[float], dry_run: bool):
+    tables = [(File.__table__, File), *((archive, None) for archive in archive_tables.values())]
+    for table, entity in tables:
+        moved = await relayout_table(table, entity, batch_size=batch_size, grace=grace, dry_run=dry_run)
+        action = 'to move' if dry_run else 'moved'
+        logger.info(f'{table.name}: {moved} files {action} to "{config.file_layout.value}" layout')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move stored files to the configured directory layout')
+    parser.add_argument('--batch-size', type=int, default=500, help='rows per transaction')
+    parser.add_argument(
+        '--grace', type=float, default=None,
+        help='seconds to keep old paths after commit (at least and by default the entity cache TTL)'
+    )
+    parser.add_argument('--dry-run', action='store_true', help='only count files to move')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    setup_invalidation()
+    asyncio.run(relayout_all(args.batch_size, args.grace, args.dry_run))
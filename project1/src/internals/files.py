@@ -1,51 +1,143 @@
+import contextlib
+import datetime
 import hashlib
+import os
 import pathlib
+import stat
 import uuid
+from collections import Counter
+from typing import NamedTuple, Optional, Iterable
 
-import aiofiles
 import aiofiles.os
 from fastapi import UploadFile
+from starlette.requests import Request
+from sqlalchemy import literal_column, update, delete, bindparam
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.config import config
+from core.config import config, FileStorageMode, FileLayout, StorageRoot, DEFAULT_STORAGE_ROOT
+from core.crud.cache import EntityCache
 from core.crud.exceptions import ObjectNotExists
 from core.crud.owned import CreatedByCrud
-from models import File
+from internals.storage import get_root, choose_root, candidate_paths, get_full_path
+from internals.uploads import receive_file, file_digest, upload_data_path, StreamingFileWriter
+from models import File, FileBlob, UploadSession
 from schemas.auth import UserJWTInfo
+from schemas.base import Model
+from schemas.files import FileCreate
+from utils.http_utils import FileValidators
+from utils.time_utils import now
+
+
+class SavedFile(NamedTuple):
+    path: pathlib.Path
+    orig_name: str
+    size: int
+    digest: str
+    extension: str
+    # имя каталога хранилища, в котором сохранён файл
+    root: str
+
+
+class FileLocation(NamedTuple):
+    # каталог хранилища, в котором файл найден (может отличаться от записанного в ``storage_root``)
+    root: StorageRoot
+    path: pathlib.Path
+    stat: os.stat_result
 
 
 class FileHandler:
     DEFAULT_EXTENSION = 'txt'
-    CHUNK_SIZE = 4096
+    # служебные каталоги внутри каждого каталога хранилища
+    BLOB_DIRECTORY = 'blobs'
+    TMP_DIRECTORY = '.tmp'
 
     @classmethod
-    def get_user_directory(cls, user: UserJWTInfo) -> pathlib.Path:
+    def get_user_directory(cls, user: UserJWTInfo) -> pathlib.PurePath:
+        """
+        Каталог пользователя относительно каталога хранилища
+        """
         dir_name = hashlib.md5(str(user.id).encode('utf-8')).hexdigest()
-        user_dir = config.file_path / dir_name
+        return pathlib.PurePath(dir_name)
 
-        return user_dir
+    @classmethod
+    def get_layout_path(cls, user_dir: pathlib.PurePath, filename: str) -> pathlib.PurePath:
+        """
+        Путь файла в каталоге пользователя согласно ``config.file_layout``
+        """
+        if config.file_layout == FileLayout.flat:
+            return user_dir / filename
+
+        digest = hashlib.md5(filename.encode('utf-8')).hexdigest()
+        width = config.file_shard_width
+        shards = [digest[i * width:(i + 1) * width] for i in range(config.file_shard_levels)]
+        return user_dir.joinpath(*shards, filename)
 
     @classmethod
-    async def get_file_path(cls, relative_path: str):
-        full_path = config.file_path / relative_path
+    def new_file_path(cls, user: UserJWTInfo, extension: str, root: StorageRoot) -> pathlib.Path:
+        return root.path / cls.get_layout_path(cls.get_user_directory(user), f'{uuid.uuid4()}.{extension}')
+
+    @classmethod
+    def get_tmp_path(cls, root: StorageRoot) -> pathlib.Path:
+        # в том же каталоге хранилища, что и итоговый файл: перенос на место – переименование
+        return root.path / cls.TMP_DIRECTORY / str(uuid.uuid4())
+
+    @classmethod
+    async def get_file_path(cls, relative_path: str, root: str = DEFAULT_STORAGE_ROOT) -> pathlib.Path:
+        location = await cls.locate_file(relative_path, root)
+        return location.path
+
+    @classmethod
+    async def locate_file(cls, relative_path: str, root: str = DEFAULT_STORAGE_ROOT) -> FileLocation:
+        """
+        Расположение файла и его ``stat`` (результат передаётся в ответ, чтобы он не проверял файл повторно).
+        Файл ищется в каталоге хранилища ``root``, затем в остальных каталогах
+
+        :param root: имя каталога хранилища из записи о файле
+        """
+        for storage_root, full_path in candidate_paths(root, relative_path):
+            try:
+                stat_result = await aiofiles.os.stat(full_path)
+            except FileNotFoundError:
+                continue
+            if stat.S_ISREG(stat_result.st_mode):
+                return FileLocation(storage_root, full_path, stat_result)
 
-        if not (await aiofiles.os.path.exists(full_path)):
-            raise ObjectNotExists(f'Unable to found file')
+        raise ObjectNotExists(f'Unable to found file')
 
-        return full_path
+    @classmethod
+    def get_validators(cls, file: File) -> Optional[FileValidators]:
+        """
+        Валидаторы содержимого из метаданных файла (без обращения к диску).
+        Для файлов, загруженных до появления метаданных – ``None``
+        """
+        if file.size is None or file.digest is None:
+            return None
+
+        # содержимое файла не меняется после загрузки
+        last_modified = file.created_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+        return FileValidators(file.size, f'"{file.digest}"', last_modified)
 
     @classmethod
-    def parse_filename(cls, data: UploadFile, user: UserJWTInfo) -> tuple[pathlib.Path, str]:
-        user_dir = cls.get_user_directory(user)
+    def get_download_name(cls, file: File) -> str:
+        extension = file.extension or file.path.split('.')[-1]
+        return f'{file.name}.{extension}'
 
-        filename_parts = data.filename.split('.')
+    @classmethod
+    def split_filename(cls, filename: str) -> tuple[str, str]:
+        """
+        Имя без расширения и расширение исходного имени файла
+        """
+        filename_parts = filename.split('.')
         if (not filename_parts) or len(filename_parts) == 1:
             filename_parts = filename_parts + [cls.DEFAULT_EXTENSION]
 
-        ext = filename_parts[-1]
-        orig_name = '.'.join(filename_parts[:-1])
-        filename = f'{uuid.uuid4()}.{ext}'
+        return '.'.join(filename_parts[:-1]), filename_parts[-1]
 
-        filepath = user_dir / filename
+    @classmethod
+    def parse_filename(cls, data: UploadFile, user: UserJWTInfo, root: StorageRoot) -> tuple[pathlib.Path, str]:
+        orig_name, ext = cls.split_filename(data.filename)
+        filepath = cls.new_file_path(user, ext, root)
 
         return filepath, orig_name
 
@@ -55,22 +147,215 @@ class FileHandler:
             data: UploadFile,
             user: UserJWTInfo,
             path=None,
-            orig_name=None
-    ) -> tuple[pathlib.Path, str]:
+            orig_name=None,
+            root: StorageRoot = None
+    ) -> SavedFile:
+        """
+        Сохранение загруженного через ``UploadFile`` файла. Размер и sha256 содержимого считаются по ходу записи
+        (``StreamingFileWriter``)
+
+        :param root: каталог хранилища, по умолчанию выбирается ``internals.storage.choose_root``
+        """
+        root = root or await choose_root()
         if not path and not orig_name:
-            path, orig_name = cls.parse_filename(data, user)
-        if not (await aiofiles.os.path.exists(path.parent)):
-            await aiofiles.os.mkdir(path.parent)
+            path, orig_name = cls.parse_filename(data, user, root)
+
+        writer = StreamingFileWriter(path)
+        await writer.open()
+        try:
+            while chunk := await data.read(StreamingFileWriter.MIN_BUFFER_SIZE):
+                await writer.write(chunk)
+        except BaseException:
+            await writer.abort()
+            raise
+
+        digest = await writer.close()
+        return SavedFile(path, orig_name, writer.size, digest, path.suffix.removeprefix('.'), root.name)
+
+    @classmethod
+    async def receive_file(cls, session: AsyncSession, request: Request, user: UserJWTInfo) -> SavedFile:
+        """
+        Потоковый приём загрузки из тела запроса: содержимое пишется сразу по итоговому пути
+        (или во временный файл для хранения по хэшу) без промежуточного ``UploadFile``
+        """
+        content_addressed = config.file_storage_mode == FileStorageMode.content_addressed
+        # размер тела чуть больше размера файла (границы и заголовки multipart)
+        root = await choose_root(int(request.headers.get('content-length', 0)))
+
+        def destination(filename: str) -> pathlib.Path:
+            if content_addressed:
+                return cls.get_tmp_path(root)
+            return cls.new_file_path(user, cls.split_filename(filename)[1], root)
+
+        received = await receive_file(request, destination)
+        orig_name, ext = cls.split_filename(received.filename)
+
+        root_name, path = root.name, received.path
+        if content_addressed:
+            root_name, path = await cls._store_blob(session, root, received.path, received.size, received.digest)
+
+        return SavedFile(path, orig_name, received.size, received.digest, ext, root_name)
 
-        async with aiofiles.open(path.absolute(), 'wb') as result_file:
-            while chunk := await data.read(cls.CHUNK_SIZE):
-                await result_file.write(chunk)
+    @classmethod
+    async def complete_upload(cls, session: AsyncSession, upload: UploadSession, user: UserJWTInfo) -> SavedFile:
+        """
+        Перенос содержимого загрузки частями в хранилище. Части уже записаны на свои места в итоговый файл,
+        поэтому он только переименовывается в пределах каталога хранилища загрузки
+        (один раз читается для подсчёта sha256)
+        """
+        root = get_root(upload.storage_root)
+        data_path = upload_data_path(upload)
+        digest = await file_digest(data_path)
+        orig_name, ext = cls.split_filename(upload.filename)
+
+        root_name = root.name
+        if config.file_storage_mode == FileStorageMode.content_addressed:
+            root_name, path = await cls._store_blob(session, root, data_path, upload.size, digest)
+        else:
+            path = cls.new_file_path(user, ext, root)
+            await aiofiles.os.makedirs(path.parent, exist_ok=True)
+            await aiofiles.os.replace(data_path, path)
+
+        return SavedFile(path, orig_name, upload.size, digest, ext, root_name)
+
+    @classmethod
+    async def _store_blob(
+            cls,
+            session: AsyncSession,
+            root: StorageRoot,
+            tmp_path: pathlib.Path,
+            size: int,
+            digest: str
+    ) -> tuple[str, pathlib.Path]:
+        """
+        Перенос записанного во временный файл (в каталоге хранилища ``root``) содержимого на место нового blob'а
+        или удаление временного файла, если такое содержимое уже хранится (возможно, в другом каталоге)
+
+        :return: имя каталога хранилища blob'а и полный путь к нему
+        """
+        created = False
+        try:
+            blob_root, blob_path, created = await cls.acquire_blob(session, digest, size, root)
+            if created:
+                full_path = root.path / blob_path
+                await aiofiles.os.makedirs(full_path.parent, exist_ok=True)
+                await aiofiles.os.replace(tmp_path, full_path)
+        finally:
+            if not created:
+                await aiofiles.os.remove(tmp_path)
+
+        return blob_root, get_full_path(blob_root, blob_path)
+
+    @classmethod
+    def get_blob_path(cls, digest: str) -> str:
+        return f'{cls.BLOB_DIRECTORY}/{digest[:2]}/{digest[2:4]}/{digest}'
+
+    @classmethod
+    async def acquire_blob(
+            cls,
+            session: AsyncSession,
+            digest: str,
+            size: int,
+            root: StorageRoot
+    ) -> tuple[str, str, bool]:
+        """
+        Добавление ссылки на blob (с созданием записи, если его ещё нет) одним запросом.
+        Параллельная загрузка того же содержимого ждёт фиксации транзакции, создавшей запись
 
-        return path, orig_name
+        :param root: каталог хранилища для нового blob'а
+        :return: имя каталога хранилища blob'а, путь к blob'у относительно него и был ли он создан этим вызовом
+        """
+        query = postgresql.insert(FileBlob).values(
+            digest=digest, path=cls.get_blob_path(digest), storage_root=root.name, size=size, ref_count=1,
+            created_at=now()
+        ).on_conflict_do_update(
+            index_elements=[FileBlob.digest],
+            set_={'ref_count': FileBlob.ref_count + 1}
+        ).returning(FileBlob.storage_root, FileBlob.path, literal_column('xmax = 0').label('created'))
+
+        row = (await session.execute(query)).one()
+        return row.storage_root, row.path, row.created
+
+    @classmethod
+    async def release_blobs(cls, session: AsyncSession, blobs: Iterable[tuple[str, str]]):
+        """
+        Удаление ссылок на blob'ы (по одной на каждую пару) одним запросом на каждый blob.
+        Blob'ы без ссылок удаляет ``remove_unreferenced_blobs``
+
+        :param blobs: пары (sha256, путь относительно каталога хранилища) содержимого удаляемых файлов.
+                      Файлы, сохранённые не по хэшу, не совпадают по пути ни с одним blob'ом и пропускаются
+        """
+        released = Counter(blobs)
+        if not released:
+            return
+
+        await session.execute(
+            update(FileBlob.__table__)
+            .where(FileBlob.digest == bindparam('_digest'), FileBlob.path == bindparam('_path'))
+            .values(ref_count=FileBlob.ref_count - bindparam('_count')),
+            [{'_digest': digest, '_path': path, '_count': count} for (digest, path), count in released.items()]
+        )
+
+    @classmethod
+    async def remove_unreferenced_blobs(cls, session: AsyncSession) -> int:
+        """
+        Удаление blob'ов, на которые не ссылается ни один файл. Файлы удаляются до фиксации транзакции:
+        параллельная загрузка того же содержимого дождётся её и создаст blob заново
+
+        :return: кол-во удалённых blob'ов
+        """
+        blobs = (await session.execute(
+            delete(FileBlob).where(FileBlob.ref_count <= 0).returning(FileBlob.storage_root, FileBlob.path)
+        )).all()
+
+        for root, path in blobs:
+            with contextlib.suppress(FileNotFoundError, ObjectNotExists):
+                await aiofiles.os.remove(get_full_path(root, path))
+
+        return len(blobs)
 
 
 class FileCrud(CreatedByCrud):
-    pass
+    async def create_saved(self, session: AsyncSession, saved: SavedFile, created_by: UserJWTInfo) -> File:
+        """
+        Создание записи о сохранённом в хранилище файле
+        """
+        return await self.create(
+            session,
+            FileCreate(name=saved.orig_name, path=str(saved.path.relative_to(get_root(saved.root).path))),
+            created_by=created_by,
+            storage_root=saved.root,
+            created_at=now(),
+            size=saved.size,
+            digest=saved.digest,
+            extension=saved.extension
+        )
+
+    async def update(
+            self,
+            session: AsyncSession,
+            obj: File,
+            data: Model,
+            exclude: set[str] = None
+    ) -> File:
+        path = obj.path
+        updated = await super().update(session, obj, data, exclude=exclude)
+
+        # метаданные описывали прежнее содержимое
+        if updated.path != path:
+            if updated.digest is not None:
+                await FileHandler.release_blobs(session, [(updated.digest, path)])
+            updated.size = updated.digest = None
+            await session.flush()
+
+        return updated
 
 
-file_crud = FileCrud(File)
+file_crud = FileCrud(
+    File,
+    sorting_by=['id', 'name', 'created_at', 'created_by', 'size'],
+    filtering_by=['created_by'],
+    # файлы пользователя по дате загрузки
+    indexed_sortings=['created_by,created_at'],
+    cache=EntityCache(File, ttl=config.entity_cache_ttl)
+)
@@ -0,0 +1,116 @@
+"""
+Несколько каталогов хранилища файлов (например, на разных дисках).
+
+Путь файла хранится относительно каталога, имя каталога – в столбце ``storage_root``. Новые файлы
+распределяются между каталогами пропорционально весам, каталоги с недостатком свободного места пропускаются.
+Каталог добавляется в ``config.file_roots`` без переноса существующих файлов
+"""
+import asyncio
+import logging
+import pathlib
+import random
+import shutil
+import time
+from typing import Iterator
+
+from core.config import config, StorageRoot, DEFAULT_STORAGE_ROOT
+from core.crud.exceptions import ObjectNotExists, LogicException
+
+logger = logging.getLogger('storage')
+
+# время, в течение которого используется ранее полученный объём свободного места каталога, секунд
+FREE_SPACE_TTL = 5
+
+# имя каталога -> (время получения, свободное место)
+_free_space: dict[str, tuple[float, int]] = {}
+
+
+def get_roots() -> dict[str, StorageRoot]:
+    roots = {root.name: root for root in config.file_roots}
+    roots.setdefault(DEFAULT_STORAGE_ROOT, StorageRoot(
+        name=DEFAULT_STORAGE_ROOT,
+        path=config.file_path,
+        accel_redirect_prefix=config.file_accel_redirect_prefix
+    ))
+    return roots
+
+
+def get_root(name: str) -> StorageRoot:
+    """
+    :raise ObjectNotExists: если каталог не описан в конфигурации
+    """
+    root = get_roots().get(name)
+    if root is None:
+        raise ObjectNotExists(f'Storage root "{name}" is not configured')
+    return root
+
+
+def get_full_path(name: str, relative_path: str | pathlib.PurePath) -> pathlib.Path:
+    return get_root(name).path / relative_path
+
+
+def candidate_paths(name: str, relative_path: str) -> Iterator[tuple[StorageRoot, pathlib.Path]]:
+    """
+    Возможные расположения файла (каталог и полный путь): сначала в его каталоге, затем в остальных
+    (файл мог быть перенесён на другой диск без обновления записи)
+    """
+    roots = get_roots()
+    if name in roots:
+        yield roots[name], roots[name].path / relative_path
+
+    for root in roots.values():
+        if root.name != name:
+            yield root, root.path / relative_path
+
+
+def get_accel_redirect_prefix(root: StorageRoot) -> str:
+    if root.accel_redirect_prefix is not None:
+        return root.accel_redirect_prefix
+    return f'{config.file_accel_redirect_prefix.rstrip("/")}-{root.name}/'
+
+
+def _disk_free(path: pathlib.Path) -> int:
+    try:
+        return shutil.disk_usage(path).free
+    except OSError as e:
+        # каталог не создан или диск не смонтирован: новые файлы туда не пишутся
+        logger.warning(f'Unable to get free space of storage root "{path}": {e}')
+        return 0
+
+
+async def get_free_space(root: StorageRoot) -> int:
+    """
+    Свободное место в каталоге. Обновляется не чаще раза в ``FREE_SPACE_TTL`` секунд
+    (statvfs сетевого диска может надолго заблокировать поток, поэтому вызывается в пуле потоков)
+    """
+    cached = _free_space.get(root.name)
+    if cached is not None and time.monotonic() - cached[0] < FREE_SPACE_TTL:
+        return cached[1]
+
+    free = await asyncio.get_running_loop().run_in_executor(None, _disk_free, root.path)
+    _free_space[root.name] = (time.monotonic(), free)
+    return free
+
+
+async def choose_root(size: int = 0) -> StorageRoot:
+    """
+    Каталог для нового файла: случайный с учётом весов среди каталогов,
+    в которых после записи ``size`` байт останется не меньше ``reserved_bytes`` свободного места
+
+    :param size: ожидаемый размер файла (если известен)
+    :raise LogicException: если места нет ни в одном каталоге
+    """
+    candidates = []
+    for root in get_roots().values():
+        if root.weight > 0 and await get_free_space(root) - root.reserved_bytes >= size:
+            candidates.append(root)
+
+    if not candidates:
+        raise LogicException('Not enough free space in file storage')
+
+    root, = random.choices(candidates, weights=[root.weight for root in candidates])
+    # до следующего обновления учитываем место, занятое выбранными файлами
+    checked_at, free = _free_space[root.name]
+    _free_space[root.name] = (checked_at, free - size)
+
+    return root
@@ -0,0 +1,482 @@
+"""
+Потоковый приём загрузок: multipart тело запроса разбирается по мере получения, и содержимое файла пишется
+сразу в итоговый файл, без временного файла starlette (``UploadFile``) и повторного копирования из него.
+
+Запись идёт блоками растущего размера, по одному обращению к пулу потоков на блок: пока один блок пишется
+(и хэшируется) в потоке, следующий накапливается в event loop'е.
+
+Загрузка частями (``UploadSession``): при создании сессии заводится файл итогового размера, каждая часть
+пишется в него по своему смещению (в любом порядке и параллельно), а при завершении файл переносится
+в хранилище переименованием, без склейки частей.
+
+Части не пишутся в файл, пока загрузка завершается: запись части учитывается в ``writing_parts``
+(транзакция и соединение с БД на время приёма тела не удерживаются), завершение начинается только без записываемых
+частей и выставляет ``completing``, после чего новые части отклоняются. Загрузка, процесс которой упал во время
+записи части или завершения, остаётся в этом состоянии до удаления по истечении срока.
+
+Брошенные загрузки (старше ``config.upload_session_ttl_hours``) вместе с их файлами удаляет отдельный процесс,
+запускаемый по расписанию: ``python -m internals.uploads``.
+"""
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import logging
+import os
+import pathlib
+from typing import Callable, NamedTuple, Optional, BinaryIO
+
+import aiofiles.os
+from multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy import select, update, delete, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from starlette.requests import Request
+
+from core.config import config
+from core.crud.exceptions import LogicException, ObjectNotExists
+from core.crud.invalidation import setup_invalidation
+from core.crud.owned import CreatedByCrud
+from internals.storage import choose_root, get_full_path
+from models import UploadSession
+from schemas.auth import UserJWTInfo
+from schemas.files import UploadSessionCreate
+from utils.db_session import db_session_manager
+from utils.time_utils import now
+
+logger = logging.getLogger('uploads')
+
+UPLOAD_FIELD_NAME = 'file'
+# каталог внутри каталога хранилища для содержимого незавершённых загрузок частями
+UPLOAD_DIRECTORY = '.uploads'
+DIGEST_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+class ReceivedFile(NamedTuple):
+    filename: str
+    path: pathlib.Path
+    size: int
+    digest: str
+
+
+class StreamingFileWriter:
+    """
+    Запись потока в файл с подсчётом размера и sha256 содержимого.
+
+    Хэш считается в том же обращении к пулу потоков, что и запись (hashlib отпускает GIL на больших блоках),
+    поэтому не нагружает event loop. Размер блока удваивается после каждой записи: небольшие файлы
+    пишутся одним-двумя обращениями, большие – крупными блоками
+    """
+    MIN_BUFFER_SIZE = 256 * 1024
+    MAX_BUFFER_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, path: pathlib.Path, offset: int = None):
+        """
+        :param offset: смещение для записи в существующий файл (по умолчанию файл создаётся заново)
+        """
+        self.path = path
+        self.offset = offset
+        self.size = 0
+
+        self._digest = hashlib.sha256()
+        self._buffer = bytearray()
+        self._buffer_size = self.MIN_BUFFER_SIZE
+        self._file: Optional[BinaryIO] = None
+        self._pending: Optional[asyncio.Future] = None
+
+    async def open(self):
+        self._file = await self._run(self._open)
+
+    async def write(self, data: bytes):
+        self._buffer += data
+        self.size += len(data)
+        if len(self._buffer) >= self._buffer_size:
+            await self._wait_pending()
+            buffer, self._buffer = self._buffer, bytearray()
+            self._pending = asyncio.get_running_loop().run_in_executor(None, self._write_buffer, buffer)
+            self._buffer_size = min(self._buffer_size * 2, self.MAX_BUFFER_SIZE)
+
+    async def close(self) -> str:
+        """
+        Запись остатка и закрытие файла (одним обращением к пулу потоков)
+
+        :return: sha256 содержимого
+        """
+        await self._wait_pending()
+        buffer, self._buffer = self._buffer, bytearray()
+        await self._run(self._finish, buffer)
+        return self._digest.hexdigest()
+
+    async def abort(self):
+        """
+        Закрытие и удаление недописанного файла
+        """
+        try:
+            await self._wait_pending()
+        finally:
+            await self._run(self._remove)
+
+    def _open(self) -> BinaryIO:
+        if self.offset is not None:
+            file = open(self.path, 'r+b')
+            file.seek(self.offset)
+            return file
+
+        os.makedirs(self.path.parent, exist_ok=True)
+        return open(self.path, 'wb')
+
+    def _write_buffer(self, buffer: bytearray):
+        self._digest.update(buffer)
+        self._file.write(buffer)
+
+    def _finish(self, buffer: bytearray):
+        if buffer:
+            self._write_buffer(buffer)
+        self._file.close()
+
+    def _remove(self):
+        if self._file is not None:
+            self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def _wait_pending(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            await pending
+
+    @staticmethod
+    async def _run(func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class _MultipartCollector:
+    """
+    Callback'и ``MultipartParser``: события разбора накапливаются и обрабатываются асинхронно
+    после каждого полученного блока тела
+    """
+
+    def __init__(self):
+        self.events: list[tuple[str, bytes]] = []
+
+    def callbacks(self) -> dict[str, Callable]:
+        def event(name: str):
+            return lambda: self.events.append((name, b''))
+
+        def data_event(name: str):
+            return lambda data, start, end: self.events.append((name, data[start:end]))
+
+        return {
+            'on_part_begin': event('part_begin'),
+            'on_part_data': data_event('part_data'),
+            'on_part_end': event('part_end'),
+            'on_header_field': data_event('header_field'),
+            'on_header_value': data_event('header_value'),
+            'on_header_end': event('header_end'),
+            'on_headers_finished': event('headers_finished'),
+        }
+
+
+async def receive_file(
+        request: Request,
+        destination: Callable[[str], pathlib.Path],
+        field_name: str = UPLOAD_FIELD_NAME
+) -> ReceivedFile:
+    """
+    Приём файла из ``multipart/form-data`` тела запроса с записью сразу по итоговому пути.
+    Остальные поля формы пропускаются
+
+    :param destination: путь для записи файла по его исходному имени
+    :param field_name: поле формы с файлом
+    """
+    content_type, params = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in params:
+        raise LogicException('Expected multipart/form-data body')
+    charset = params.get(b'charset', b'utf-8').decode('latin-1')
+
+    collector = _MultipartCollector()
+    parser = MultipartParser(params[b'boundary'], collector.callbacks())
+
+    writer: Optional[StreamingFileWriter] = None
+    received: Optional[ReceivedFile] = None
+    filename, header_field, header_value, disposition = None, b'', b'', b''
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            events, collector.events = collector.events, []
+
+            for event, data in events:
+                if event == 'part_data':
+                    if writer is not None:
+                        await writer.write(data)
+                elif event == 'part_begin':
+                    header_field, header_value, disposition = b'', b'', b''
+                elif event == 'header_field':
+                    header_field += data
+                elif event == 'header_value':
+                    header_value += data
+                elif event == 'header_end':
+                    if header_field.lower() == b'content-disposition':
+                        disposition = header_value
+                    header_field, header_value = b'', b''
+                elif event == 'headers_finished':
+                    _, options = parse_options_header(disposition)
+                    name = options.get(b'name', b'').decode(charset, errors='replace')
+                    if name == field_name and b'filename' in options and received is None:
+                        filename = options[b'filename'].decode(charset, errors='replace')
+                        writer = StreamingFileWriter(destination(filename))
+                        await writer.open()
+                elif event == 'part_end' and writer is not None:
+                    received = ReceivedFile(filename, writer.path, writer.size, await writer.close())
+                    writer = None
+
+        parser.finalize()
+    except BaseException:
+        if writer is not None:
+            await writer.abort()
+        raise
+
+    if writer is not None:
+        # тело оборвалось до конца части с файлом
+        await writer.abort()
+        raise LogicException('Unexpected end of multipart body')
+    if received is None:
+        raise LogicException(f'Field "{field_name}" with file is required')
+
+    return received
+
+
+async def receive_part(request: Request, path: pathlib.Path, offset: int, length: int) -> str:
+    """
+    Запись тела запроса в существующий файл по смещению ``offset``.
+    Тело должно быть ровно ``length`` байт: записать больше (в соседнюю часть) не получится
+
+    :return: sha256 записанной части
+    """
+    writer = StreamingFileWriter(path, offset=offset)
+    await writer.open()
+    try:
+        async for chunk in request.stream():
+            if writer.size + len(chunk) > length:
+                raise LogicException(f'Part must be {length} bytes')
+            await writer.write(chunk)
+    finally:
+        digest = await writer.close()
+
+    if writer.size != length:
+        raise LogicException(f'Part must be {length} bytes')
+    return digest
+
+
+def _file_digest(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while block := file.read(DIGEST_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def file_digest(path: pathlib.Path) -> str:
+    """
+    sha256 файла, одним обращением к пулу потоков
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, _file_digest, path)
+
+
+def upload_data_path(upload: UploadSession) -> pathlib.Path:
+    return get_full_path(upload.storage_root, pathlib.PurePath(UPLOAD_DIRECTORY, str(upload.id)))
+
+
+def parts_count(upload: UploadSession) -> int:
+    return -(-upload.size // upload.part_size)
+
+
+def part_range(upload: UploadSession, index: int) -> tuple[int, int]:
+    """
+    Смещение и размер части
+
+    :raise LogicException: если такой части нет
+    """
+    if not 0 <= index < parts_count(upload):
+        raise LogicException(f'Part index must be in range [0, {parts_count(upload)})')
+
+    offset = index * upload.part_size
+    return offset, min(upload.part_size, upload.size - offset)
+
+
+def received_offset(upload: UploadSession) -> int:
+    """
+    Кол-во байт, полученных без пропусков с начала файла (с этого места можно продолжить
+    последовательную загрузку)
+    """
+    received, index = set(upload.received_parts), 0
+    while index in received:
+        index += 1
+    return min(index * upload.part_size, upload.size)
+
+
+class UploadSessionCrud(CreatedByCrud):
+    async def create_session(self, session: AsyncSession, data: UploadSessionCreate, user: UserJWTInfo) -> UploadSession:
+        """
+        Создание сессии и файла итогового размера (разреженного: место занимают только записанные части)
+        в выбранном для него каталоге хранилища
+        """
+        root = await choose_root(data.size)
+        upload = await self.create(
+            session, data, created_by=user, part_size=config.upload_part_size, created_at=now(), storage_root=root.name
+        )
+        await asyncio.get_running_loop().run_in_executor(None, _allocate, upload_data_path(upload), upload.size)
+
+        return upload
+
+    async def get_owned(
+            self,
+            session: AsyncSession,
+            id: str,
+            user: UserJWTInfo,
+            for_update: bool = False
+    ) -> UploadSession:
+        """
+        Сессия загрузки пользователя
+
+        :param for_update: заблокировать сессию до конца транзакции (для изменения её состояния)
+        :raise ObjectNotExists: если сессии нет или она принадлежит другому пользователю
+        """
+        query = select(UploadSession).where(UploadSession.id == id, UploadSession.created_by == user.id)
+        if for_update:
+            query = query.with_for_update()
+
+        upload = (await session.execute(query)).scalar_one_or_none()
+        if upload is None:
+            raise ObjectNotExists('Upload session not found', ids=[id])
+        return upload
+
+    async def start_part(
+            self,
+            session: AsyncSession,
+            id: str,
+            user: UserJWTInfo,
+            index: int
+    ) -> tuple[UploadSession, int, int]:
+        """
+        Начало записи части: часть учитывается в ``writing_parts``, пока запись не закончится (``finish_part``),
+        и до этого загрузку нельзя завершить
+
+        :return: сессия загрузки, смещение и размер части
+        :raise LogicException: если такой части нет или загрузка уже завершается
+        """
+        upload = await self.get_owned(session, id, user, for_update=True)
+        if upload.completing:
+            raise LogicException('Upload is being completed')
+        offset, length = part_range(upload, index)
+
+        upload.writing_parts += 1
+        await session.flush()
+        return upload, offset, length
+
+    async def finish_part(self, session: AsyncSession, upload: UploadSession, index: Optional[int]) -> UploadSession:
+        """
+        Окончание записи части с отметкой о её получении. Параллельные отметки разных частей не теряют друг друга
+
+        :param index: полученная часть; ``None``, если записать её не удалось
+        :raise ObjectNotExists: если загрузку отменили во время записи
+        """
+        values = {'writing_parts': UploadSession.writing_parts - 1}
+        if index is not None:
+            values['received_parts'] = case(
+                (UploadSession.received_parts.any(index), UploadSession.received_parts),
+                else_=func.array_append(UploadSession.received_parts, index)
+            )
+
+        row = (await session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload.id)
+            .values(values)
+            .returning(UploadSession.received_parts, UploadSession.writing_parts)
+            .execution_options(synchronize_session=False)
+        )).one_or_none()
+        if row is None:
+            raise ObjectNotExists('Upload session not found', ids=[upload.id])
+
+        # без пометки об изменении, иначе при flush'е значения перезапишут параллельные отметки
+        set_committed_value(upload, 'received_parts', row.received_parts)
+        set_committed_value(upload, 'writing_parts', row.writing_parts)
+        return upload
+
+    async def start_completion(self, session: AsyncSession, id: str, user: UserJWTInfo) -> UploadSession:
+        """
+        Начало завершения загрузки. Флаг ``completing`` фиксируется сразу: новые части после этого отклоняются,
+        поэтому файл загрузки не меняется, пока он хэшируется и переносится в хранилище
+
+        :raise LogicException: если получены не все части, часть ещё записывается или загрузка уже завершается
+        """
+        upload = await self.get_owned(session, id, user, for_update=True)
+        if upload.completing:
+            raise LogicException('Upload is already being completed')
+        if upload.writing_parts:
+            raise LogicException(f'Upload has {upload.writing_parts} parts being written')
+        if (received := len(upload.received_parts)) < parts_count(upload):
+            raise LogicException(f'Upload is incomplete: {received} of {parts_count(upload)} parts received')
+
+        upload.completing = True
+        await session.commit()
+        return upload
+
+    async def cancel_completion(self, session: AsyncSession, upload: UploadSession):
+        """
+        Отмена неудавшегося завершения: загрузка снова принимает части
+        """
+        await session.rollback()
+        await session.execute(
+            update(UploadSession).where(UploadSession.id == upload.id).values(completing=False)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+    async def remove(self, session: AsyncSession, upload: UploadSession):
+        await session.delete(upload)
+        await session.flush()
+
+        with contextlib.suppress(FileNotFoundError, ObjectNotExists):
+            await aiofiles.os.remove(upload_data_path(upload))
+
+    async def remove_expired(self, session: AsyncSession, ttl: datetime.timedelta = None) -> int:
+        """
+        Удаление незавершённых загрузок старше ``ttl`` (по умолчанию ``config.upload_session_ttl_hours``)
+
+        :return: кол-во удалённых загрузок
+        """
+        ttl = ttl or datetime.timedelta(hours=config.upload_session_ttl_hours)
+        uploads = (await session.execute(
+            delete(UploadSession).where(UploadSession.created_at < now() - ttl)
+            .returning(UploadSession.id, UploadSession.storage_root)
+        )).all()
+
+        for id_, root in uploads:
+            with contextlib.suppress(FileNotFoundError, ObjectNotExists):
+                await aiofiles.os.remove(get_full_path(root, pathlib.PurePath(UPLOAD_DIRECTORY, str(id_))))
+
+        return len(uploads)
+
+
+def _allocate(path: pathlib.Path, size: int):
+    os.makedirs(path.parent, exist_ok=True)
+    with open(path, 'wb') as file:
+        file.truncate(size)
+
+
+upload_session_crud = UploadSessionCrud(UploadSession)
+
+
+async def remove_expired_uploads():
+    async with db_session_manager() as session:
+        removed = await upload_session_crud.remove_expired(session)
+    logger.info(f'Removed {removed} expired upload sessions')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    setup_invalidation()
+    asyncio.run(remove_expired_uploads())
@@ -3,9 +3,11 @@ import uvicorn
 from starlette.middleware.cors import CORSMiddleware
 
 from core.config import config
+from core.crud.invalidation import invalidation_bus, setup_invalidation
 from routes.exceptions import apply_exception_handlers
 from routes.files import file_router
 from routes.middlewares import LimitUploadSize
+from routes.uploads import upload_router
 
 from utils.db_session import db_session_manager
 
@@ -22,9 +24,16 @@ if not config.cors_policy_enabled:
         expose_headers=["Content-Disposition"],
         allow_credentials=True,
     )
+app.include_router(upload_router, prefix='/files/uploads')
 app.include_router(file_router, prefix='/files')
 
 
 @app.on_event('startup')
 async def startup():
-    pass
+    setup_invalidation()
+    await invalidation_bus.start()
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    await invalidation_bus.stop()
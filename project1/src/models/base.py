@@ -5,6 +5,9 @@ from sqlalchemy.orm import class_mapper
 
 class BaseModelClass:
     __hidden_fields__ = {'password'}
+    # серверные значения по умолчанию (uuid_generate_v4() и т.п.) запрашиваются через RETURNING
+    # в том же INSERT/UPDATE, а не отдельным SELECT'ом при первом обращении
+    __mapper_args__ = {'eager_defaults': True}
 
     def __repr__(self):
         order = [i for i in self.__class__.__dict__.keys() if not i.startswith('_')]
@@ -1,16 +1,21 @@
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
 
-from utils.orm_utils.softdelete import SoftDeleteMixin
-from sqlalchemy import Column, Integer, text, Float, Text, String, DateTime, ForeignKey, Boolean
+from utils.orm_utils.fulltext import FullTextSearchMixin
+from utils.orm_utils.softdelete import SoftDeleteMixin, archive_table
+from sqlalchemy import Column, Integer, text, Float, Text, String, DateTime, ForeignKey, Boolean, BigInteger
 
+from core.config import DEFAULT_STORAGE_ROOT
 from models.base import Base
 from utils.time_utils import now
 
 MAX_FILENAME_LENGTH = 512
+# sha256 в hex
+DIGEST_LENGTH = 64
 
 
-class File(Base, SoftDeleteMixin):
+class File(Base, SoftDeleteMixin, FullTextSearchMixin):
     __tablename__ = 'files'
+    __search_fields__ = ('name',)
 
     id = Column(UUID, primary_key=True, server_default=text("uuid_generate_v4()"))
     name = Column(String(MAX_FILENAME_LENGTH))
@@ -18,3 +23,51 @@ class File(Base, SoftDeleteMixin):
     is_public = Column(Boolean, server_default='false', nullable=False)
     created_by = Column(Integer)
     created_at = Column(DateTime, default=now)
+    # метаданные содержимого, считаются при загрузке (валидаторы для HTTP кэширования без обращения к диску)
+    size = Column(BigInteger)
+    digest = Column(String(DIGEST_LENGTH))
+    # расширение исходного имени (в режиме хранения по хэшу его нет в path)
+    extension = Column(Text)
+    # каталог хранилища, относительно которого задан path (см. internals.storage)
+    storage_root = Column(Text, nullable=False, server_default=DEFAULT_STORAGE_ROOT)
+
+
+files_archive = archive_table(File.__table__)
+
+
+class FileBlob(Base):
+    """
+    Содержимое файла в режиме хранения по хэшу: хранится один раз на каждый sha256,
+    ``ref_count`` – кол-во строк ``files``, ссылающихся на него
+    """
+    __tablename__ = 'file_blobs'
+
+    digest = Column(String(DIGEST_LENGTH), primary_key=True)
+    path = Column(Text, nullable=False)
+    storage_root = Column(Text, nullable=False, server_default=DEFAULT_STORAGE_ROOT)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, server_default='0')
+    created_at = Column(DateTime, default=now)
+
+
+class UploadSession(Base):
+    """
+    Загрузка файла частями. Содержимое пишется в заранее созданный файл размера ``size``,
+    часть ``i`` занимает байты ``[i * part_size, (i + 1) * part_size)``
+    """
+    __tablename__ = 'upload_sessions'
+
+    id = Column(UUID, primary_key=True, server_default=text("uuid_generate_v4()"))
+    # исходное имя файла вместе с расширением
+    filename = Column(Text, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    part_size = Column(Integer, nullable=False)
+    received_parts = Column(ARRAY(Integer), nullable=False, server_default='{}')
+    # кол-во частей, записываемых в файл в данный момент (пока есть такие, загрузку нельзя завершить)
+    writing_parts = Column(Integer, nullable=False, server_default='0')
+    # загрузка завершается: файл переносится в хранилище, новые части не принимаются
+    completing = Column(Boolean, nullable=False, server_default='false')
+    # каталог хранилища, в котором создан файл загрузки (и будет итоговый файл)
+    storage_root = Column(Text, nullable=False, server_default=DEFAULT_STORAGE_ROOT)
+    created_by = Column(Integer)
+    created_at = Column(DateTime, default=now)
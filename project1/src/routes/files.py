@@ -1,50 +1,140 @@
 import uuid
+from urllib.parse import quote
 
 import aiofiles.os
 import fastapi
-from fastapi import UploadFile
 from starlette.background import BackgroundTask, BackgroundTasks
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import StreamingResponse, Response
 
-from core.config import config
+from core.config import config, DownloadMode
 from core.crud.exceptions import ObjectNotExists
+from core.crud.types import PaginationMode
 from dependecies import db_session
 from dependecies.user import user_info
 from internals.files import file_crud, FileHandler
+from internals.storage import get_accel_redirect_prefix
+from internals.uploads import UPLOAD_FIELD_NAME
+from models import File
+from routes.responses import (
+    ZeroCopyFileResponse, OffloadFileResponse, RangeFileResponse, NotModifiedResponse, RangeNotSatisfiableResponse
+)
 from schemas.files import FileOut, FileCreate, FileList
-from utils.time_utils import now
+from utils.http_utils import FileValidators, is_not_modified, if_range_matches, parse_ranges, RangeNotSatisfiable
 
 file_router = fastapi.APIRouter(tags=['files'])
 
+ACCEL_REDIRECT_HEADER = 'X-Accel-Redirect'
+SENDFILE_HEADER = 'X-Sendfile'
+
+# тело запроса загрузки разбирается вручную, поэтому описывается для документации отдельно
+UPLOAD_OPENAPI = {
+    'requestBody': {
+        'required': True,
+        'content': {
+            'multipart/form-data': {
+                'schema': {
+                    'type': 'object',
+                    'required': [UPLOAD_FIELD_NAME],
+                    'properties': {UPLOAD_FIELD_NAME: {'type': 'string', 'format': 'binary'}}
+                }
+            }
+        }
+    }
+}
+
+SORT_BY_DESCRIPTION = 'comma separated sorting keys, "-" prefix for descending order (e.g. "-createdAt,name")'
+
 if config.is_testing:
     @file_router.get('', name='get multi', response_model=FileList)
     async def get_files_list(
             page: int = fastapi.Query(1, description='page'),
             per_page: int | None = fastapi.Query(None, description='elements per page'),
+            pagination_mode: PaginationMode = fastapi.Query(PaginationMode.offset, description='pagination mode'),
+            cursor: str | None = fastapi.Query(None, description='next page cursor (for cursor pagination)'),
+            sort_by: str = fastapi.Query('id', description=SORT_BY_DESCRIPTION),
+            descending: bool = fastapi.Query(False, description='descending sort order'),
             session=db_session,
             author=user_info
     ) -> FileList:
-        books, count = await file_crud.get_multi(session, page, per_page)
+        files = await file_crud.get_multi(
+            session, page, per_page, sort_by=sort_by, descending=descending,
+            pagination_mode=pagination_mode, cursor=cursor
+        )
 
         # noinspection PyUnusedLocal
         def _create_list_model(session):
-            return FileList(data=books, page=page, per_page=per_page, total=count)
+            return FileList(
+                data=files.objects, page=page, per_page=per_page, total=files.total,
+                total_is_exact=files.total_is_exact, next_cursor=files.next_cursor
+            )
 
         serialized = await session.run_sync(_create_list_model)
         return serialized
 
 
+    @file_router.get('/export', name='export multi', response_class=StreamingResponse)
+    async def export_files_list(
+            sort_by: str = fastapi.Query('id', description=SORT_BY_DESCRIPTION),
+            descending: bool = fastapi.Query(False, description='descending sort order'),
+            session=db_session,
+            author=user_info
+    ) -> StreamingResponse:
+        """
+        Выгрузка всех файлов в формате NDJSON (по объекту на строку) без загрузки выборки в память
+        """
+
+        async def _serialize():
+            async for file in file_crud.stream_multi(session, sort_by=sort_by, descending=descending):
+                yield FileOut.from_orm(file).json(by_alias=True) + '\n'
+
+        return StreamingResponse(_serialize(), media_type='application/x-ndjson')
+
+
 @file_router.get('/{id}')
 async def get_file(
+        request: Request,
         id: str = fastapi.Path(..., example=str(uuid.uuid4())),
         session=db_session,
         author=user_info
 ):
     file = await file_crud.get(session, id)
-
-    file_path = await FileHandler.get_file_path(file.path)
-
-    extension = file.path.split('.')[-1]
-    return fastapi.responses.FileResponse(file_path, filename=f'{file.name}.{extension}')
+    return await download_response(file, request.headers)
+
+
+async def download_response(file: File, headers: Headers) -> Response:
+    """
+    Ответ с содержимым файла согласно ``config.file_download_mode`` с учётом условных заголовков
+    и ``Range`` запроса
+    """
+    filename = FileHandler.get_download_name(file)
+    # файл мог быть перенесён в другой каталог хранилища без обновления записи, поэтому ищется на диске
+    # и при известных валидаторах (для x-accel-redirect нужен префикс каталога, в котором файл лежит)
+    location = await FileHandler.locate_file(file.path, file.storage_root)
+    validators = FileHandler.get_validators(file)
+    if validators is None:
+        validators = FileValidators.from_stat(location.stat)
+
+    if is_not_modified(headers, validators):
+        return NotModifiedResponse(validators)
+
+    # файл отдаёт фронтовой веб-сервер, воркер только проверяет его наличие
+    if config.file_download_mode == DownloadMode.x_accel_redirect:
+        location_header = get_accel_redirect_prefix(location.root) + quote(file.path)
+        return OffloadFileResponse(ACCEL_REDIRECT_HEADER, location_header, filename)
+    if config.file_download_mode == DownloadMode.x_sendfile:
+        return OffloadFileResponse(SENDFILE_HEADER, str(location.path.absolute()), filename)
+
+    ranges = []
+    if 'range' in headers and if_range_matches(headers, validators):
+        try:
+            ranges = parse_ranges(headers['range'], validators.size)
+        except RangeNotSatisfiable:
+            return RangeNotSatisfiableResponse(validators.size)
+
+    response_class = ZeroCopyFileResponse if config.file_download_mode == DownloadMode.sendfile else RangeFileResponse
+    return response_class(location.path, validators, ranges, filename=filename)
 
 
 @file_router.get('/{id}/info', response_model=FileOut)
@@ -57,16 +147,14 @@ async def get_file_info(
     return await FileOut.from_orm_async(session, file)
 
 
-@file_router.post('/upload', response_model=FileOut)
-async def upload_file(file: UploadFile, session=db_session, author=user_info) -> FileOut:
-    filepath, orig_name = await FileHandler.save_file(file, author)
-
-    res = await file_crud.create(
-        session,
-        FileCreate(name=orig_name, path=str(filepath.relative_to(config.file_path))),
-        created_by=author,
-        created_at=now()
-    )
+@file_router.post('/upload', response_model=FileOut, openapi_extra=UPLOAD_OPENAPI)
+async def upload_file(request: Request, session=db_session, author=user_info) -> FileOut:
+    """
+    Загрузка файла (поле ``file`` формы ``multipart/form-data``). Тело запроса разбирается потоком,
+    содержимое пишется сразу в хранилище
+    """
+    saved = await FileHandler.receive_file(session, request, author)
+    res = await file_crud.create_saved(session, saved, author)
 
     return FileOut.from_orm(res)
 
@@ -96,6 +184,7 @@ async def delete_file(
     file = await file_crud.get(session, id)
     data = await FileOut.from_orm_async(session, file)
 
-    file.delete()
-    await session.flush()
+    # файл можно восстановить, поэтому содержимое удаляется из хранилища только при переносе записи в архив
+    # (internals.archive)
+    await file_crud.delete(session, file)
     return data
@@ -1,20 +1,31 @@
 from starlette import status
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.requests import Request
+from starlette.datastructures import Headers
 from starlette.responses import Response
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Scope, Receive, Send
 
 
-class LimitUploadSize(BaseHTTPMiddleware):
+class LimitUploadSize:
+    """
+    Ограничение размера загружаемых данных по заголовку ``Content-Length``.
+
+    Реализован как чистый ASGI middleware: ``BaseHTTPMiddleware`` пропускает каждый блок тела ответа через
+    промежуточную очередь и не пропускает сообщения расширений ASGI (отдача файлов через ``os.sendfile``)
+    """
+
     def __init__(self, app: ASGIApp, max_upload_size: int) -> None:
-        super().__init__(app)
+        self.app = app
         self.max_upload_size = max_upload_size
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        if request.method == 'POST':
-            if 'content-length' not in request.headers:
-                return Response(status_code=status.HTTP_411_LENGTH_REQUIRED)
-            content_length = int(request.headers['content-length'])
-            if content_length > self.max_upload_size:
-                return Response(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
-        return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] == 'http' and scope['method'] == 'POST':
+            headers = Headers(scope=scope)
+            response = None
+            if 'content-length' not in headers:
+                response = Response(status_code=status.HTTP_411_LENGTH_REQUIRED)
+            elif int(headers['content-length']) > self.max_upload_size:
+                response = Response(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+            if response is not None:
+                return await response(scope, receive, send)
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,185 @@
+"""
+Ответы для отдачи содержимого файлов: диапазоны (``Range``), условные запросы и отдача без прокачки байтов
+через event loop воркера
+"""
+import secrets
+import typing
+from mimetypes import guess_type
+from urllib.parse import quote
+
+import anyio
+from anyio import AsyncFile
+from starlette import status
+from starlette.background import BackgroundTask
+from starlette.responses import FileResponse, Response
+from starlette.types import Scope, Receive, Send
+
+from core.crud.exceptions import ObjectNotExists
+from utils.http_utils import FileValidators
+
+ZERO_COPY_EXTENSION = 'http.response.zerocopysend'
+
+DEFAULT_MEDIA_TYPE = 'application/octet-stream'
+
+
+def content_disposition(filename: str, disposition_type: str = 'attachment') -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition_type}; filename*=utf-8''{quoted}"
+    return f'{disposition_type}; filename="{filename}"'
+
+
+class NotModifiedResponse(Response):
+    def __init__(self, validators: FileValidators):
+        super().__init__(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators.headers)
+
+
+class RangeNotSatisfiableResponse(Response):
+    def __init__(self, size: int):
+        super().__init__(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={'content-range': f'bytes */{size}'}
+        )
+
+
+class RangeFileResponse(FileResponse):
+    """
+    Отдача файла с заранее известными размером и валидаторами (файл не stat'ится) и поддержкой ``Range``:
+    один диапазон отдаётся как ``206`` с ``Content-Range``, несколько – как ``206 multipart/byteranges``
+    """
+    chunk_size = 256 * 1024
+
+    def __init__(
+            self,
+            path: str,
+            validators: FileValidators,
+            ranges: typing.Sequence[tuple[int, int]] = (),
+            filename: str = None,
+            media_type: str = None,
+            headers: typing.Mapping[str, str] = None,
+            background: BackgroundTask = None,
+            method: str = None
+    ):
+        """
+        :param validators: размер и валидаторы содержимого файла
+        :param ranges: диапазоны байт (включительно, см. ``utils.http_utils.parse_ranges``)
+        """
+        super().__init__(
+            path, headers=headers, media_type=media_type, background=background, filename=filename, method=method
+        )
+        self.validators = validators
+        self.headers.update(validators.headers)
+        self.headers['accept-ranges'] = 'bytes'
+
+        size = validators.size
+        # (префикс части, смещение, кол-во байт) и завершение тела
+        self.segments: list[tuple[bytes, int, int]] = [(b'', 0, size)]
+        self.trailer = b''
+
+        if len(ranges) == 1:
+            (start, end), = ranges
+            self.status_code = status.HTTP_206_PARTIAL_CONTENT
+            self.headers['content-range'] = f'bytes {start}-{end}/{size}'
+            self.segments = [(b'', start, end - start + 1)]
+        elif ranges:
+            boundary = secrets.token_hex(16)
+            self.status_code = status.HTTP_206_PARTIAL_CONTENT
+            self.headers['content-type'] = f'multipart/byteranges; boundary={boundary}'
+            self.segments = [
+                (
+                    f'\r\n--{boundary}\r\n'
+                    f'Content-Type: {self.media_type}\r\n'
+                    f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'.encode('latin-1'),
+                    start,
+                    end - start + 1
+                )
+                for start, end in ranges
+            ]
+            self.trailer = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+
+        self.headers['content-length'] = str(
+            sum(len(prefix) + count for prefix, _, count in self.segments) + len(self.trailer)
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.send_header_only:
+            await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        else:
+            try:
+                file = await anyio.open_file(self.path, mode='rb')
+            except FileNotFoundError:
+                raise ObjectNotExists(f'Unable to found file')
+
+            async with file:
+                await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+                for prefix, offset, count in self.segments:
+                    if prefix:
+                        await send({'type': 'http.response.body', 'body': prefix, 'more_body': True})
+                    await self.send_segment(scope, send, file, offset, count)
+                await send({'type': 'http.response.body', 'body': self.trailer, 'more_body': False})
+
+        if self.background is not None:
+            await self.background()
+
+    async def send_segment(self, scope: Scope, send: Send, file: AsyncFile, offset: int, count: int):
+        await file.seek(offset)
+        while count > 0:
+            chunk = await file.read(min(self.chunk_size, count))
+            if not chunk:
+                # файл на диске короче, чем в метаданных
+                break
+            count -= len(chunk)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+
+class ZeroCopyFileResponse(RangeFileResponse):
+    """
+    Отдача файла через ``os.sendfile``: ASGI сервер с расширением ``http.response.zerocopysend`` сам копирует
+    файл в сокет средствами ядра, без чтения содержимого в память процесса.
+
+    Если сервер расширение не поддерживает (например, uvicorn), файл отдаётся как у ``RangeFileResponse``,
+    но крупными блоками, чтобы реже переключаться между потоком чтения и event loop'ом
+    """
+    chunk_size = 1024 * 1024
+
+    async def send_segment(self, scope: Scope, send: Send, file: AsyncFile, offset: int, count: int):
+        if ZERO_COPY_EXTENSION not in scope.get('extensions', {}):
+            return await super().send_segment(scope, send, file, offset, count)
+
+        await send({'type': ZERO_COPY_EXTENSION, 'file': file.wrapped, 'offset': offset, 'count': count,
+                    'more_body': True})
+
+
+class OffloadFileResponse(Response):
+    """
+    Пустой ответ, по заголовку которого файл отдаёт фронтовой веб-сервер:
+    ``X-Accel-Redirect`` (nginx, internal location) или ``X-Sendfile`` (apache mod_xsendfile, lighttpd).
+
+    Заголовки ``Content-Type`` и ``Content-Disposition`` веб-сервер сохраняет из этого ответа,
+    диапазоны и условные запросы он обрабатывает сам
+    """
+
+    def __init__(
+            self,
+            header: str,
+            location: str,
+            filename: str,
+            media_type: str = None,
+            headers: typing.Mapping[str, str] = None,
+            background: BackgroundTask = None
+    ):
+        """
+        :param header: заголовок для веб-сервера (``X-Accel-Redirect``/``X-Sendfile``)
+        :param location: uri internal location'a (nginx) или абсолютный путь к файлу
+        :param filename: имя файла для скачивания
+        """
+        super().__init__(
+            headers=headers,
+            media_type=media_type or guess_type(filename)[0] or DEFAULT_MEDIA_TYPE,
+            background=background
+        )
+        # размер содержимого определит веб-сервер
+        del self.headers['content-length']
+        self.headers[header] = location
+        self.headers.setdefault('content-disposition', content_disposition(filename))
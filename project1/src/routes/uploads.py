@@ -0,0 +1,122 @@
+import uuid
+
+import fastapi
+from starlette.requests import Request
+
+from core.config import config
+from core.crud.exceptions import LogicException
+from dependecies import db_session
+from dependecies.user import user_info
+from internals.files import file_crud, FileHandler
+from internals.uploads import (
+    upload_session_crud, upload_data_path, receive_part, parts_count, received_offset
+)
+from models import UploadSession
+from schemas.base import StatusResponse
+from schemas.files import FileOut, UploadSessionCreate, UploadSessionOut, UploadPartOut
+from utils.db_session import db_session_manager
+
+upload_router = fastapi.APIRouter(tags=['uploads'])
+
+PART_OPENAPI = {
+    'requestBody': {
+        'required': True,
+        'content': {'application/octet-stream': {'schema': {'type': 'string', 'format': 'binary'}}}
+    }
+}
+
+
+def _session_out(upload: UploadSession) -> UploadSessionOut:
+    return UploadSessionOut(
+        id=upload.id,
+        filename=upload.filename,
+        size=upload.size,
+        part_size=upload.part_size,
+        parts_count=parts_count(upload),
+        received_parts=sorted(upload.received_parts),
+        offset=received_offset(upload)
+    )
+
+
+@upload_router.post('', response_model=UploadSessionOut)
+async def create_upload(data: UploadSessionCreate, session=db_session, author=user_info) -> UploadSessionOut:
+    """
+    Начало загрузки файла частями. Части размера ``partSize`` загружаются в любом порядке и параллельно
+    """
+    if data.size > config.max_file_size:
+        raise LogicException(f'File size must not exceed {config.max_file_size} bytes')
+
+    upload = await upload_session_crud.create_session(session, data, author)
+    return _session_out(upload)
+
+
+@upload_router.get('/{id}', response_model=UploadSessionOut)
+async def get_upload(
+        id: str = fastapi.Path(..., example=str(uuid.uuid4())),
+        session=db_session,
+        author=user_info
+) -> UploadSessionOut:
+    """
+    Состояние загрузки: полученные части и смещение, с которого можно продолжить последовательную загрузку
+    """
+    upload = await upload_session_crud.get_owned(session, id, author)
+    return _session_out(upload)
+
+
+@upload_router.put('/{id}/parts/{index}', response_model=UploadPartOut, openapi_extra=PART_OPENAPI)
+async def upload_part(
+        request: Request,
+        id: str = fastapi.Path(..., example=str(uuid.uuid4())),
+        index: int = fastapi.Path(..., ge=0),
+        author=user_info
+) -> UploadPartOut:
+    """
+    Загрузка части ``index`` (тело запроса – содержимое части). Повторная загрузка части перезаписывает её
+    """
+    # пока принимается тело части, транзакция и соединение с БД не удерживаются
+    async with db_session_manager() as session:
+        upload, offset, length = await upload_session_crud.start_part(session, id, author, index)
+
+    digest = None
+    try:
+        digest = await receive_part(request, upload_data_path(upload), offset, length)
+    finally:
+        async with db_session_manager() as session:
+            await upload_session_crud.finish_part(session, upload, index if digest is not None else None)
+
+    return UploadPartOut(index=index, size=length, digest=digest)
+
+
+@upload_router.post('/{id}/complete', response_model=FileOut)
+async def complete_upload(
+        id: str = fastapi.Path(..., example=str(uuid.uuid4())),
+        session=db_session,
+        author=user_info
+) -> FileOut:
+    """
+    Завершение загрузки: файл переносится в хранилище и создаётся запись о нём
+    """
+    upload = await upload_session_crud.start_completion(session, id, author)
+    try:
+        saved = await FileHandler.complete_upload(session, upload, author)
+    except BaseException:
+        await upload_session_crud.cancel_completion(session, upload)
+        raise
+    file = await file_crud.create_saved(session, saved, author)
+    await upload_session_crud.remove(session, upload)
+
+    return FileOut.from_orm(file)
+
+
+@upload_router.delete('/{id}', response_model=StatusResponse)
+async def abort_upload(
+        id: str = fastapi.Path(..., example=str(uuid.uuid4())),
+        session=db_session,
+        author=user_info
+) -> StatusResponse:
+    upload = await upload_session_crud.get_owned(session, id, author, for_update=True)
+    if upload.completing:
+        raise LogicException('Upload is being completed')
+    await upload_session_crud.remove(session, upload)
+
+    return StatusResponse()
@@ -41,6 +41,8 @@ class ListModel(Model):
     page: int
     per_page: int | None
     total: int = pydantic.Field(None, description='total count of objects with specified filters/params')
+    total_is_exact: bool = pydantic.Field(True, description='false if total is an estimate, not an exact count')
+    next_cursor: str | None = pydantic.Field(None, description='cursor of the next page (for cursor pagination)')
 
 
 class StatusResponse(Model):
@@ -24,7 +24,28 @@ class FileCreateInner(FileCreate, UidMixin):
 class FileOut(UidMixin):
     name: str
     created_at: datetime.datetime
+    size: int | None
 
 
 class FileList(ListModel):
     data: list[UidMixin]
+
+
+class UploadSessionCreate(Model):
+    filename: str = pydantic.Field(..., max_length=MAX_FILENAME_LENGTH, description='original file name with extension')
+    size: int = pydantic.Field(..., gt=0, description='total file size in bytes')
+
+
+class UploadSessionOut(UidMixin):
+    filename: str
+    size: int
+    part_size: int
+    parts_count: int
+    received_parts: list[int]
+    offset: int = pydantic.Field(..., description='bytes received without gaps from the start of the file')
+
+
+class UploadPartOut(Model):
+    index: int
+    size: int
+    digest: str = pydantic.Field(..., description='sha256 of the received part')
@@ -0,0 +1,73 @@
+import abc
+import time
+from collections import OrderedDict
+from typing import TypeVar, Generic, Hashable, Optional
+
+Key = TypeVar('Key', bound=Hashable)
+Value = TypeVar('Value')
+
+
+class CacheBackend(abc.ABC, Generic[Key, Value]):
+    """
+    Хранилище для кэша. Позволяет подменить in-process хранилище на внешнее (например, redis)
+    """
+
+    @abc.abstractmethod
+    def get(self, key: Key, default: Optional[Value] = None) -> Optional[Value]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def set(self, key: Key, value: Value):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def delete(self, key: Key):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def clear(self):
+        raise NotImplementedError()
+
+
+class TTLCache(CacheBackend[Key, Value]):
+    """
+    Простой in-process LRU кэш с ограничением времени жизни записей
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        """
+        :param max_size: максимальное кол-во записей, при превышении вытесняются давно не использованные
+        :param ttl: время жизни записи в секундах
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[Key, tuple[float, Value]] = OrderedDict()
+
+    def get(self, key: Key, default: Optional[Value] = None) -> Optional[Value]:
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Key, value: Value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
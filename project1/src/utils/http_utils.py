@@ -0,0 +1,135 @@
+"""
+Разбор заголовков условных запросов (``If-None-Match``/``If-Modified-Since``/``If-Range``) и ``Range``
+"""
+import datetime
+import email.utils
+import hashlib
+import os
+import re
+from typing import NamedTuple, Mapping, Optional
+
+RANGE_SPEC = re.compile(r'^(\d*)-(\d*)$')
+
+# при большем кол-ве диапазонов заголовок Range игнорируется (защита от запросов из тысяч мелких кусков)
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileValidators(NamedTuple):
+    """
+    Валидаторы содержимого файла для HTTP кэширования
+    """
+    size: int
+    etag: str
+    # unix timestamp
+    last_modified: float
+
+    @classmethod
+    def from_stat(cls, stat_result: os.stat_result) -> 'FileValidators':
+        etag = hashlib.md5(f'{stat_result.st_mtime}-{stat_result.st_size}'.encode()).hexdigest()
+        return cls(stat_result.st_size, f'"{etag}"', stat_result.st_mtime)
+
+    @property
+    def last_modified_header(self) -> str:
+        return email.utils.formatdate(self.last_modified, usegmt=True)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {'etag': self.etag, 'last-modified': self.last_modified_header}
+
+
+def parse_http_date(value: str) -> Optional[int]:
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return int(date.timestamp())
+
+
+def _etags(value: str) -> list[str]:
+    # слабое сравнение: префикс W/ не учитывается
+    return [tag.strip().removeprefix('W/') for tag in value.split(',')]
+
+
+def is_not_modified(headers: Mapping[str, str], validators: FileValidators) -> bool:
+    """
+    Можно ли ответить ``304 Not Modified``. ``If-None-Match`` приоритетнее ``If-Modified-Since`` (RFC 7232)
+    """
+    if (if_none_match := headers.get('if-none-match')) is not None:
+        tags = _etags(if_none_match)
+        return '*' in tags or validators.etag in tags
+
+    if (if_modified_since := headers.get('if-modified-since')) is not None:
+        since = parse_http_date(if_modified_since)
+        # в HTTP датах нет долей секунды
+        return since is not None and int(validators.last_modified) <= since
+
+    return False
+
+
+def if_range_matches(headers: Mapping[str, str], validators: FileValidators) -> bool:
+    """
+    Применим ли ``Range`` с учётом ``If-Range``: при несовпадении отдаётся весь файл
+    """
+    if_range = headers.get('if-range')
+    if if_range is None:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        # только строгое сравнение, слабый ETag никогда не совпадает
+        return if_range == validators.etag
+
+    return parse_http_date(if_range) == int(validators.last_modified)
+
+
+def parse_ranges(value: str, size: int) -> list[tuple[int, int]]:
+    """
+    Диапазоны байт из заголовка ``Range``: отсортированные, с объединёнными пересечениями,
+    границы включительно. Некорректный заголовок игнорируется (пустой список – отдаётся весь файл)
+
+    :raises RangeNotSatisfiable: ни один диапазон не попадает в файл
+    """
+    unit, _, specs = value.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return []
+
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_SPEC.match(spec.strip())
+        if match is None:
+            return []
+
+        start, end = match.groups()
+        if not start:
+            if not end:
+                return []
+            # последние end байт файла
+            length = int(end)
+            if length and size:
+                ranges.append((max(size - length, 0), size - 1))
+            continue
+
+        start, end = int(start), int(end) if end else None
+        if end is not None and end < start:
+            return []
+        if start < size:
+            ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged if len(merged) <= MAX_RANGES else []
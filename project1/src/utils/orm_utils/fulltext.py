@@ -0,0 +1,31 @@
+from typing import Iterable
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import declared_attr, deferred
+
+SEARCH_VECTOR_COLUMN = 'search_vector'
+DEFAULT_SEARCH_CONFIG = 'simple'
+
+
+def search_vector_expression(fields: Iterable[str], config: str = DEFAULT_SEARCH_CONFIG) -> str:
+    document = " || ' ' || ".join(f"coalesce({field}, '')" for field in fields)
+    return f"to_tsvector('{config}'::regconfig, {document})"
+
+
+class FullTextSearchMixin:
+    """
+    Хранимый генерируемый столбец ``search_vector`` (``tsvector``) по полям ``__search_fields__``
+    для полнотекстового поиска (см. ``FullTextFilter``).
+
+    Столбец вычисляется самим postgres при вставке и обновлении и по умолчанию не загружается вместе с сущностью.
+    Столбец и GIN индекс создаются миграцией (``utils.orm_utils.migrations.add_search_vector``)
+    """
+    __search_fields__: tuple[str, ...] = ()
+    # конфигурация текстового поиска postgres, ``simple`` – без стемминга и стоп-слов
+    __search_config__: str = DEFAULT_SEARCH_CONFIG
+
+    @declared_attr
+    def search_vector(cls):
+        expression = search_vector_expression(cls.__search_fields__, cls.__search_config__)
+        return deferred(sa.Column(SEARCH_VECTOR_COLUMN, TSVECTOR, sa.Computed(expression, persisted=True)))
@@ -0,0 +1,175 @@
+"""
+Вспомогательные функции для миграций alembic
+"""
+from typing import Iterable
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from utils.orm_utils.fulltext import SEARCH_VECTOR_COLUMN, DEFAULT_SEARCH_CONFIG, search_vector_expression
+from utils.orm_utils.softdelete import NOT_DELETED_CONDITION, ARCHIVED_AT_COLUMN
+
+IndexColumns = str | tuple[str, ...]
+
+
+def not_deleted_index_name(table_name: str, columns: tuple[str, ...]) -> str:
+    return f'ix_{table_name}_{"_".join(columns)}_not_deleted'
+
+
+def _as_tuple(columns: IndexColumns) -> tuple[str, ...]:
+    return (columns,) if type(columns) == str else tuple(columns)
+
+
+def create_not_deleted_indexes(table_name: str, indexes: Iterable[IndexColumns], concurrently: bool = False):
+    """
+    Создание частичных индексов ``WHERE deleted_at IS NULL`` для таблицы с мягким удалением.
+
+    Все ORM запросы к таким таблицам получают условие ``deleted_at IS NULL`` (см. ``SoftDeleteMixin``),
+    поэтому частичный индекс подходит под них и не содержит удалённых записей.
+    Наборы столбцов под сортировки и фильтры CRUD'a можно получить через ``BaseCrud.index_columns()``
+
+    :param table_name: название таблицы
+    :param indexes: столбцы индексов (название столбца или кортеж для составного индекса)
+    :param concurrently: создавать индексы без блокировки записи в таблицу (``CREATE INDEX CONCURRENTLY``).
+                         Должно выполняться вне транзакции – внутри ``op.get_context().autocommit_block()``
+    """
+    for columns in map(_as_tuple, indexes):
+        op.create_index(
+            not_deleted_index_name(table_name, columns),
+            table_name,
+            list(columns),
+            postgresql_where=sa.text(NOT_DELETED_CONDITION),
+            postgresql_concurrently=concurrently
+        )
+
+
+def drop_not_deleted_indexes(table_name: str, indexes: Iterable[IndexColumns], concurrently: bool = False):
+    for columns in map(_as_tuple, indexes):
+        op.drop_index(
+            not_deleted_index_name(table_name, columns),
+            table_name=table_name,
+            postgresql_concurrently=concurrently
+        )
+
+
+def create_archive_table(table_name: str, primary_key: Iterable[str] = ('id',)):
+    """
+    Создание архивной таблицы ``<table>_archive`` с теми же столбцами, что и у исходной (см. ``archive_table``).
+    Индекс для выборки записей, подлежащих переносу в архив, создаётся отдельно (``create_deleted_index``)
+    """
+    op.execute(
+        f'CREATE TABLE {table_name}_archive (LIKE {table_name}, '
+        f'{ARCHIVED_AT_COLUMN} timestamp without time zone NOT NULL DEFAULT now(), '
+        f'CONSTRAINT pk_{table_name}_archive PRIMARY KEY ({", ".join(primary_key)}))'
+    )
+
+
+def drop_archive_table(table_name: str):
+    op.drop_table(f'{table_name}_archive')
+
+
+def create_deleted_index(table_name: str, concurrently: bool = False):
+    """
+    Частичный индекс по ``deleted_at`` удалённых записей для выборки записей, подлежащих переносу в архив
+
+    :param concurrently: создавать индекс без блокировки записи в таблицу (внутри ``autocommit_block``)
+    """
+    op.create_index(
+        f'ix_{table_name}_deleted_at_deleted',
+        table_name,
+        ['deleted_at'],
+        postgresql_where=sa.text('deleted_at IS NOT NULL'),
+        postgresql_concurrently=concurrently
+    )
+
+
+def drop_deleted_index(table_name: str, concurrently: bool = False):
+    op.drop_index(
+        f'ix_{table_name}_deleted_at_deleted',
+        table_name=table_name,
+        postgresql_concurrently=concurrently
+    )
+
+
+def trigram_index_name(table_name: str, column: str) -> str:
+    return f'ix_{table_name}_{column}_trgm'
+
+
+def create_trigram_indexes(
+        table_name: str,
+        columns: Iterable[str],
+        not_deleted: bool = True,
+        concurrently: bool = False
+):
+    """
+    Создание GIN индексов ``pg_trgm`` для поиска подстроки (``ILIKE '%...%'``) и похожих строк (``%``)
+    по текстовым столбцам (см. ``TrigramFilter``)
+
+    :param table_name: название таблицы
+    :param columns: текстовые столбцы
+    :param not_deleted: частичный индекс ``WHERE deleted_at IS NULL`` для таблицы с мягким удалением
+    :param concurrently: создавать индексы без блокировки записи в таблицу (внутри ``autocommit_block``)
+    """
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in columns:
+        op.create_index(
+            trigram_index_name(table_name, column),
+            table_name,
+            [column],
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'},
+            postgresql_where=sa.text(NOT_DELETED_CONDITION) if not_deleted else None,
+            postgresql_concurrently=concurrently
+        )
+
+
+def drop_trigram_indexes(table_name: str, columns: Iterable[str], concurrently: bool = False):
+    for column in columns:
+        op.drop_index(
+            trigram_index_name(table_name, column),
+            table_name=table_name,
+            postgresql_concurrently=concurrently
+        )
+
+
+def add_search_vector(table_name: str, fields: Iterable[str], config: str = DEFAULT_SEARCH_CONFIG):
+    """
+    Добавление хранимого генерируемого столбца ``search_vector`` (см. ``FullTextSearchMixin``).
+    Поля и конфигурация должны совпадать с ``__search_fields__``/``__search_config__`` модели.
+
+    Добавление генерируемого столбца перезаписывает всю таблицу под эксклюзивной блокировкой
+    """
+    op.add_column(
+        table_name,
+        sa.Column(SEARCH_VECTOR_COLUMN, TSVECTOR(), sa.Computed(search_vector_expression(fields, config), persisted=True))
+    )
+
+
+def drop_search_vector(table_name: str):
+    op.drop_column(table_name, SEARCH_VECTOR_COLUMN)
+
+
+def create_search_index(table_name: str, not_deleted: bool = True, concurrently: bool = False):
+    """
+    GIN индекс по ``search_vector`` для ``FullTextFilter``
+
+    :param not_deleted: частичный индекс ``WHERE deleted_at IS NULL`` для таблицы с мягким удалением
+    :param concurrently: создавать индекс без блокировки записи в таблицу (внутри ``autocommit_block``)
+    """
+    op.create_index(
+        f'ix_{table_name}_{SEARCH_VECTOR_COLUMN}',
+        table_name,
+        [SEARCH_VECTOR_COLUMN],
+        postgresql_using='gin',
+        postgresql_where=sa.text(NOT_DELETED_CONDITION) if not_deleted else None,
+        postgresql_concurrently=concurrently
+    )
+
+
+def drop_search_index(table_name: str, concurrently: bool = False):
+    op.drop_index(
+        f'ix_{table_name}_{SEARCH_VECTOR_COLUMN}',
+        table_name=table_name,
+        postgresql_concurrently=concurrently
+    )
@@ -34,3 +34,34 @@ def before_compile(execute_state: ORMExecuteState):
                 include_aliases=True
             )
         )
+
+
+NOT_DELETED_CONDITION = 'deleted_at IS NULL'
+ARCHIVED_AT_COLUMN = 'archived_at'
+
+# таблица с мягким удалением -> архивная таблица для давно удалённых записей
+archive_tables: dict[sa.Table, sa.Table] = dict()
+
+
+def archived_columns(table: sa.Table) -> list[sa.Column]:
+    # генерируемые столбцы (например, ``search_vector``) вычисляются из остальных и в архив не переносятся
+    return [column for column in table.columns if column.computed is None]
+
+
+def archive_table(table: sa.Table) -> sa.Table:
+    """
+    Описание архивной таблицы ``<table>_archive`` для таблицы с мягким удалением:
+    те же столбцы (без генерируемых, значений по умолчанию и внешних ключей) и время переноса в архив.
+
+    Сама таблица создаётся миграцией (см. ``utils.orm_utils.migrations.create_archive_table``)
+    """
+    archive = sa.Table(
+        f'{table.name}_archive',
+        table.metadata,
+        *(sa.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+          for column in archived_columns(table)),
+        sa.Column(ARCHIVED_AT_COLUMN, sa.DateTime(timezone=False), server_default=sa.func.now(), nullable=False)
+    )
+    archive_tables[table] = archive
+
+    return archive
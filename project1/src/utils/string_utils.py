@@ -1,3 +1,4 @@
+import functools
 import re
 
 
@@ -5,6 +6,8 @@ def to_camel(val: str):
     return ''.join([part.lower() if i == 0 else part.capitalize() for i, part in enumerate(val.split('_'))])
 
 
+# вызывается для каждого ключа фильтрации и сортировки на каждый запрос, а набор ключей ограничен
+@functools.lru_cache(maxsize=4096)
 def to_snake(string: str) -> str:
     """
     Из CamelCase в snake_case
@@ -1,6 +1,7 @@
-from typing import TypeVar, Optional, Any
+from typing import TypeVar, Optional, Any, Iterable, Iterator
 
 SetType = TypeVar('SetType', bound=set)
+ItemType = TypeVar('ItemType')
 
 
 def add_to_set(set_: Optional[SetType], value: Any) -> SetType:
@@ -9,3 +10,18 @@ def add_to_set(set_: Optional[SetType], value: Any) -> SetType:
     set_.add(value)
 
     return set_
+
+
+def chunked(items: Iterable[ItemType], size: int) -> Iterator[list[ItemType]]:
+    """
+    Разбиение последовательности на части не более ``size`` элементов
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
@@ -0,0 +1,99 @@
+"""
+Запуск из каталога ``project1``: ``python -m pytest tests``.
+
+Тестам, работающим с БД (фикстуры ``session``/``clean_database``), нужен postgres из переменных
+``PROJECT1_DB_*``: схема пересоздаётся по моделям при запуске, поэтому указывать следует отдельную тестовую БД.
+Без доступной БД эти тесты пропускаются
+"""
+import asyncio
+import os
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / 'src'))
+
+os.environ.setdefault('PROJECT1_DB_NAME', 'async_arch_test')
+os.environ.setdefault('PROJECT1_DB_USER', 'postgres')
+os.environ.setdefault('PROJECT1_DB_PASSWORD', 'postgres')
+os.environ.setdefault('PROJECT1_DB_HOST', '127.0.0.1')
+os.environ.setdefault('PROJECT1_DB_PORT', '5432')
+os.environ.setdefault('PROJECT1_PORT', '8000')
+os.environ.setdefault('PROJECT1_IS_TESTING', 'true')
+
+import asyncpg  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+import models  # noqa: E402, F401
+from core.config import config  # noqa: E402
+from core.crud.cache import clear_all, invalidation_publishers  # noqa: E402
+from models.base import metadata  # noqa: E402
+from utils.db_session import db_engine, db_session_manager  # noqa: E402
+
+# uuid_generate_v4() из uuid-ossp используется в server_default моделей
+UUID_FUNCTION = "CREATE OR REPLACE FUNCTION uuid_generate_v4() RETURNS uuid LANGUAGE sql AS 'SELECT gen_random_uuid()'"
+
+
+async def _create_schema():
+    async with db_engine.begin() as connection:
+        has_uuid_ossp = (await connection.execute(
+            text("SELECT count(*) FROM pg_available_extensions WHERE name = 'uuid-ossp'")
+        )).scalar_one()
+        if has_uuid_ossp:
+            await connection.execute(text('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"'))
+        else:
+            await connection.execute(text(UUID_FUNCTION))
+
+        await connection.run_sync(metadata.drop_all)
+        await connection.run_sync(metadata.create_all)
+    await db_engine.dispose()
+
+
+async def _truncate():
+    async with db_engine.begin() as connection:
+        await connection.execute(text(f'TRUNCATE {", ".join(metadata.tables)}'))
+
+
+@pytest.fixture(scope='session')
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture(scope='session')
+def database():
+    try:
+        asyncio.run(_create_schema())
+    except (OSError, asyncpg.PostgresError) as e:
+        pytest.skip(f'postgres is not available: {e}')
+
+
+@pytest.fixture
+def file_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'file_path', tmp_path)
+    monkeypatch.setattr(config, 'file_roots', [])
+    return tmp_path
+
+
+@pytest.fixture
+def publishers():
+    """
+    Обработчики инвалидации, зарегистрированные в тесте (по окончании восстанавливаются)
+    """
+    registered = list(invalidation_publishers)
+    invalidation_publishers.clear()
+    yield invalidation_publishers
+    invalidation_publishers[:] = registered
+
+
+@pytest.fixture
+def clean_database(database):
+    asyncio.run(_truncate())
+    clear_all()
+
+
+@pytest.fixture
+async def session(clean_database):
+    async with db_session_manager() as session:
+        yield session
+
@@ -0,0 +1,113 @@
+import datetime
+import hashlib
+import io
+
+import pytest
+from sqlalchemy import select, update
+from starlette.datastructures import UploadFile
+
+from core.config import DEFAULT_STORAGE_ROOT
+from internals.archive import archive_deleted, archive_hooks
+from internals.files import FileHandler, SavedFile, file_crud
+from internals.storage import get_root
+from models import File, FileBlob
+from schemas.auth import UserJWTInfo
+from schemas.files import FileCreate
+from utils.orm_utils.softdelete import archive_tables
+
+USER = UserJWTInfo(id=1)
+
+
+async def _store(session, content: bytes) -> SavedFile:
+    root = get_root(DEFAULT_STORAGE_ROOT)
+    tmp_path = FileHandler.get_tmp_path(root)
+    tmp_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path.write_bytes(content)
+
+    digest = hashlib.sha256(content).hexdigest()
+    root_name, path = await FileHandler._store_blob(session, root, tmp_path, len(content), digest)
+    return SavedFile(path, 'file', len(content), digest, 'txt', root_name)
+
+
+async def _ref_count(session, digest: str) -> int | None:
+    return (await session.execute(select(FileBlob.ref_count).where(FileBlob.digest == digest))).scalar()
+
+
+async def _archive(session):
+    await session.commit()
+    table = File.__table__
+    return await archive_deleted(
+        table, archive_tables[table], datetime.timedelta(days=1), hook=archive_hooks[table]
+    )
+
+
+@pytest.mark.anyio
+async def test_same_content_stored_once(session, file_storage):
+    first = await _store(session, b'content')
+    second = await _store(session, b'content')
+
+    assert first.path == second.path and first.path.read_bytes() == b'content'
+    assert await _ref_count(session, first.digest) == 2
+    # временный файл повторной загрузки удалён
+    assert list((file_storage / FileHandler.TMP_DIRECTORY).iterdir()) == []
+
+
+@pytest.mark.anyio
+async def test_archived_files_release_blob(session, file_storage):
+    saved = [await _store(session, b'content') for _ in range(3)]
+    files = [await file_crud.create_saved(session, item, USER) for item in saved]
+
+    deleted_at = datetime.datetime.now() - datetime.timedelta(days=2)
+    for file in files[:2]:
+        file.delete(deleted_at)
+
+    assert await _archive(session) == 2
+    assert await _ref_count(session, saved[0].digest) == 1
+    assert await FileHandler.remove_unreferenced_blobs(session) == 0
+    assert saved[0].path.exists()
+
+    files[2].delete(deleted_at)
+    assert await _archive(session) == 1
+    assert await _ref_count(session, saved[0].digest) == 0
+
+    assert await FileHandler.remove_unreferenced_blobs(session) == 1
+    assert await _ref_count(session, saved[0].digest) is None
+    assert not saved[0].path.exists()
+
+
+@pytest.mark.anyio
+async def test_path_change_releases_blob(session, file_storage):
+    saved = await _store(session, b'content')
+    file = await file_crud.create_saved(session, saved, USER)
+
+    await file_crud.update(session, file, FileCreate(name='renamed', path='1/other.txt'))
+
+    assert await _ref_count(session, saved.digest) == 0
+    assert file.digest is None and file.size is None
+
+
+@pytest.mark.anyio
+async def test_unique_files_do_not_release_blobs(session, file_storage):
+    saved = await _store(session, b'content')
+    await session.execute(update(FileBlob).values(ref_count=1))
+
+    # файл с тем же содержимым, сохранённый не по хэшу
+    await FileHandler.release_blobs(session, [(saved.digest, '1/file.txt')])
+
+    assert await _ref_count(session, saved.digest) == 1
+
+
+@pytest.mark.anyio
+async def test_archived_unique_files_removed(session, file_storage):
+    saved = [await FileHandler.save_file(UploadFile('a.txt', io.BytesIO(b'content')), USER) for _ in range(2)]
+    files = [await file_crud.create_saved(session, item, USER) for item in saved]
+    # другая запись с тем же путём
+    shared = await file_crud.create_saved(session, saved[1], USER)
+
+    deleted_at = datetime.datetime.now() - datetime.timedelta(days=2)
+    for file in files:
+        file.delete(deleted_at)
+
+    assert await _archive(session) == 2
+    assert not saved[0].path.exists()
+    assert saved[1].path.exists() and shared.path == files[1].path
@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy import insert
+
+from internals.files import file_crud
+from models import File
+from utils.db_session import db_session_manager
+
+
+async def _insert_file(session) -> str:
+    file_id = (await session.execute(insert(File).values(name='orig', path='a.txt').returning(File.id))).scalar_one()
+    await session.commit()
+    return file_id
+
+
+@pytest.mark.anyio
+async def test_loaded_object_keeps_unflushed_changes(session):
+    file_id = await _insert_file(session)
+    await file_crud.get(session, file_id)
+    file = await file_crud.get(session, file_id)
+
+    file.name = 'changed'
+
+    assert await file_crud.get(session, file_id) is file
+    assert file.name == 'changed'
+
+
+@pytest.mark.anyio
+async def test_rolled_back_values_not_cached(session):
+    file_id = await _insert_file(session)
+    file = await file_crud.get(session, file_id)
+
+    file.name = 'uncommitted'
+    await session.flush()
+    await file_crud.get(session, file_id)
+    assert file_crud.cache.backend.get(file_crud.cache.key(file_id)) is None
+
+    await session.rollback()
+
+    async with db_session_manager() as other:
+        assert (await file_crud.get(other, file_id)).name == 'orig'
+    assert (await file_crud.get(session, file_id)).name == 'orig'
+
+
+@pytest.mark.anyio
+async def test_rollback_invalidates_written(session):
+    file_id = await _insert_file(session)
+    file = await file_crud.get(session, file_id)
+    key = file_crud.cache.key(file_id)
+
+    file.name = 'uncommitted'
+    await session.flush()
+    # значение, попавшее в кэш в обход проверки сессии
+    file_crud.cache.backend.set(key, {'name': 'uncommitted'})
+
+    await session.rollback()
+
+    assert file_crud.cache.backend.get(key) is None
@@ -0,0 +1,60 @@
+import contextlib
+
+import pytest
+from sqlalchemy import event
+
+from core.crud.base import BaseCrud
+from core.crud.types import CountStrategy
+from internals.files import file_crud
+from models import File
+from schemas.files import FileCreate
+from utils.db_session import db_engine
+
+
+@contextlib.contextmanager
+def _statements():
+    statements = []
+
+    def collect(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db_engine.sync_engine, 'before_cursor_execute', collect)
+    try:
+        yield statements
+    finally:
+        event.remove(db_engine.sync_engine, 'before_cursor_execute', collect)
+
+
+@pytest.mark.anyio
+async def test_create_issues_single_insert(session):
+    crud = BaseCrud(File)
+
+    with _statements() as statements:
+        file = await crud.create(session, FileCreate(name='report.txt', path='1/report.txt'), created_by=1)
+
+    assert len(statements) == 1 and statements[0].startswith('INSERT')
+    # серверные значения из RETURNING, не переданные столбцы без значений по умолчанию – NULL
+    assert file.id is not None and file.created_at is not None
+    assert file.size is None and file.deleted_at is None
+
+
+def test_file_crud_index_columns():
+    assert file_crud.index_columns() == [
+        ('name', 'id'), ('created_at', 'id'), ('created_by', 'id'), ('size', 'id'), ('created_by', 'created_at', 'id')
+    ]
+
+
+@pytest.mark.anyio
+async def test_cached_count_refreshed_after_single_writes(session):
+    crud = BaseCrud(File, filtering_by=['name'], count_strategy=CountStrategy.cached)
+    files = [await crud.create(session, FileCreate(name='a', path=f'{i}.txt')) for i in range(2)]
+
+    async def total() -> int:
+        return (await crud.get_multi(session, 1, 10, name='a')).total
+
+    assert await total() == 2
+    await crud.update(session, files[0], FileCreate(name='b', path='0.txt'))
+    assert await total() == 1
+
+    await crud.delete(session, files[1])
+    assert await total() == 0
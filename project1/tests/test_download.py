@@ -0,0 +1,67 @@
+import asyncio
+import hashlib
+
+import pytest
+from sqlalchemy import insert
+from starlette.testclient import TestClient
+
+from core.config import config, DownloadMode, StorageRoot, DEFAULT_STORAGE_ROOT
+from main import app
+from models import File
+from utils.db_session import db_session_manager
+
+CONTENT = b'0123456789'
+PATH = 'user/report.txt'
+
+
+async def _insert_file() -> str:
+    async with db_session_manager() as session:
+        file_id = (await session.execute(insert(File).values(
+            name='report', path=PATH, extension='txt', storage_root=DEFAULT_STORAGE_ROOT,
+            size=len(CONTENT), digest=hashlib.sha256(CONTENT).hexdigest()
+        ).returning(File.id))).scalar_one()
+        await session.commit()
+    return str(file_id)
+
+
+@pytest.fixture
+def moved_file(clean_database, file_storage, monkeypatch):
+    """
+    Файл с сохранёнными валидаторами, перенесённый из каталога ``default`` в ``disk2`` без обновления записи
+    """
+    disk2 = file_storage / 'disk2'
+    (disk2 / 'user').mkdir(parents=True)
+    (disk2 / PATH).write_bytes(CONTENT)
+    monkeypatch.setattr(config, 'file_path', file_storage / 'default')
+    monkeypatch.setattr(config, 'file_roots', [StorageRoot(name='disk2', path=disk2, weight=0)])
+
+    return asyncio.run(_insert_file())
+
+
+@pytest.mark.parametrize('mode', [DownloadMode.stream, DownloadMode.sendfile])
+def test_moved_file_downloaded(moved_file, mode, monkeypatch):
+    monkeypatch.setattr(config, 'file_download_mode', mode)
+    client = TestClient(app)
+
+    response = client.get(f'/files/{moved_file}', headers={'range': 'bytes=2-5'})
+
+    assert response.status_code == 206 and response.content == CONTENT[2:6]
+
+
+def test_moved_file_offloaded(moved_file, file_storage, monkeypatch):
+    client = TestClient(app)
+
+    monkeypatch.setattr(config, 'file_download_mode', DownloadMode.x_accel_redirect)
+    response = client.get(f'/files/{moved_file}')
+    # location каталога, в котором файл найден
+    assert response.headers['x-accel-redirect'] == f'{config.file_accel_redirect_prefix.rstrip("/")}-disk2/{PATH}'
+
+    monkeypatch.setattr(config, 'file_download_mode', DownloadMode.x_sendfile)
+    response = client.get(f'/files/{moved_file}')
+    assert response.headers['x-sendfile'] == str((file_storage / 'disk2' / PATH).absolute())
+
+
+def test_missing_file(moved_file, file_storage):
+    (file_storage / 'disk2' / PATH).unlink()
+
+    assert TestClient(app).get(f'/files/{moved_file}').status_code == 404
@@ -0,0 +1,51 @@
+import time
+
+import pytest
+from sqlalchemy import insert, select
+
+from core.config import config, FileLayout
+from core.crud.invalidation import publish_invalidations
+from internals.file_layout import relayout_table, target_path
+from models import File
+
+
+@pytest.mark.anyio
+async def test_relayout_moves_files(session, file_storage, publishers, monkeypatch):
+    monkeypatch.setattr(config, 'entity_cache_ttl', 0)
+    (file_storage / 'user').mkdir()
+    (file_storage / 'user' / 'report.txt').write_bytes(b'content')
+    file_id = (await session.execute(
+        insert(File).values(name='report', path='user/report.txt').returning(File.id)
+    )).scalar_one()
+    await session.commit()
+
+    monkeypatch.setattr(config, 'file_layout', FileLayout.sharded)
+    target = target_path('user/report.txt')
+    assert target != 'user/report.txt'
+
+    assert await relayout_table(File.__table__, File) == 1
+
+    assert (await session.execute(select(File.path).where(File.id == file_id))).scalar_one() == target
+    assert (file_storage / target).read_bytes() == b'content'
+    assert not (file_storage / 'user' / 'report.txt').exists()
+    assert publishers == [publish_invalidations]
+    # повторный запуск ничего не переносит
+    assert await relayout_table(File.__table__, File) == 0
+
+
+@pytest.mark.anyio
+async def test_grace_does_not_delay_batches(session, file_storage, publishers, monkeypatch):
+    monkeypatch.setattr(config, 'entity_cache_ttl', 0.5)
+    (file_storage / 'user').mkdir()
+    for i in range(4):
+        (file_storage / 'user' / f'{i}.txt').write_bytes(b'content')
+    await session.execute(insert(File), [{'name': str(i), 'path': f'user/{i}.txt'} for i in range(4)])
+    await session.commit()
+    monkeypatch.setattr(config, 'file_layout', FileLayout.sharded)
+
+    started = time.monotonic()
+    assert await relayout_table(File.__table__, File, batch_size=1) == 4
+
+    # пауза выдерживается один раз после последней пачки, а не после каждой
+    assert 0.5 <= time.monotonic() - started < 1.5
+    assert list((file_storage / 'user').glob('*.txt')) == []
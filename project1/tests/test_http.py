@@ -0,0 +1,131 @@
+import email.utils
+import re
+
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from routes.responses import RangeFileResponse
+from utils.http_utils import FileValidators, RangeNotSatisfiable, parse_ranges, is_not_modified, if_range_matches
+
+CONTENT = bytes(range(256)) * 4
+VALIDATORS = FileValidators(len(CONTENT), '"abc"', 1_760_000_000.5)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('bytes=0-9', [(0, 9)]),
+    ('bytes=1000-', [(1000, 1023)]),
+    ('bytes=-24', [(1000, 1023)]),
+    ('bytes=-5000', [(0, 1023)]),
+    ('bytes=1000-5000', [(1000, 1023)]),
+    # сортировка и объединение пересекающихся и смежных диапазонов
+    ('bytes=20-29, 0-9,5-14,30-39', [(0, 14), (20, 39)]),
+    # некорректный заголовок игнорируется
+    ('items=0-9', []),
+    ('bytes=9-0', []),
+    ('bytes=a-b', []),
+    ('bytes=-', []),
+    ('bytes=' + ','.join(f'{i * 10}-{i * 10}' for i in range(17)), []),
+])
+def test_parse_ranges(value, expected):
+    assert parse_ranges(value, len(CONTENT)) == expected
+
+
+@pytest.mark.parametrize('value', ['bytes=1024-', 'bytes=2000-3000', 'bytes=-0'])
+def test_parse_ranges_not_satisfiable(value):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_ranges(value, len(CONTENT))
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({}, False),
+    ({'if-none-match': '"abc"'}, True),
+    ({'if-none-match': '"other", W/"abc"'}, True),
+    ({'if-none-match': '*'}, True),
+    ({'if-none-match': '"other"'}, False),
+    ({'if-modified-since': VALIDATORS.last_modified_header}, True),
+    ({'if-modified-since': email.utils.formatdate(VALIDATORS.last_modified - 1, usegmt=True)}, False),
+    ({'if-modified-since': 'not a date'}, False),
+    # If-None-Match приоритетнее
+    ({'if-none-match': '"other"', 'if-modified-since': VALIDATORS.last_modified_header}, False),
+])
+def test_is_not_modified(headers, expected):
+    assert is_not_modified(headers, VALIDATORS) is expected
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({}, True),
+    ({'if-range': '"abc"'}, True),
+    ({'if-range': 'W/"abc"'}, False),
+    ({'if-range': '"other"'}, False),
+    ({'if-range': VALIDATORS.last_modified_header}, True),
+    ({'if-range': email.utils.formatdate(VALIDATORS.last_modified + 1, usegmt=True)}, False),
+])
+def test_if_range_matches(headers, expected):
+    assert if_range_matches(headers, VALIDATORS) is expected
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / 'file.bin'
+    path.write_bytes(CONTENT)
+
+    async def download(request: Request):
+        ranges = parse_ranges(request.headers.get('range', ''), VALIDATORS.size) if 'range' in request.headers else []
+        return RangeFileResponse(str(path), VALIDATORS, ranges, filename='file.bin', method=request.method)
+
+    return TestClient(Starlette(routes=[Route('/', download, methods=['GET', 'HEAD'])]))
+
+
+def test_full_file(client):
+    response = client.get('/')
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers['content-length'] == str(len(CONTENT))
+    assert response.headers['etag'] == VALIDATORS.etag
+    assert response.headers['accept-ranges'] == 'bytes'
+
+
+def test_single_range(client):
+    response = client.get('/', headers={'range': 'bytes=10-19'})
+
+    assert response.status_code == 206
+    assert response.headers['content-range'] == f'bytes 10-19/{len(CONTENT)}'
+    assert response.headers['content-length'] == '10'
+    assert response.content == CONTENT[10:20]
+
+
+def test_multiple_ranges(client):
+    response = client.get('/', headers={'range': 'bytes=0-3,100-109'})
+
+    assert response.status_code == 206
+    boundary = re.fullmatch(r'multipart/byteranges; boundary=(\w+)', response.headers['content-type']).group(1)
+    assert response.headers['content-length'] == str(len(response.content))
+
+    parts = response.content.split(f'--{boundary}'.encode())
+    assert parts[0] == b'\r\n' and parts[-1] == b'--\r\n'
+    bodies = []
+    for part in parts[1:-1]:
+        headers, _, body = part.partition(b'\r\n\r\n')
+        assert b'Content-Range: bytes ' in headers
+        bodies.append(body.removesuffix(b'\r\n'))
+    assert bodies == [CONTENT[0:4], CONTENT[100:110]]
+
+
+@pytest.mark.anyio
+async def test_head_sends_no_body(tmp_path):
+    path = tmp_path / 'file.bin'
+    path.write_bytes(CONTENT)
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    response = RangeFileResponse(str(path), VALIDATORS, [(10, 19)], method='HEAD')
+    await response({'type': 'http', 'method': 'HEAD'}, None, send)
+
+    assert messages[0]['status'] == 206 and (b'content-length', b'10') in messages[0]['headers']
+    assert [message['body'] for message in messages[1:]] == [b'']
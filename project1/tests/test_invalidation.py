@@ -0,0 +1,76 @@
+import asyncio
+
+import asyncpg
+import pytest
+from sqlalchemy import insert
+
+from core.config import config
+from core.crud.invalidation import InvalidationBus, invalidation_bus, publish_invalidations, setup_invalidation
+from internals.files import file_crud
+from models import File
+
+
+async def _insert_file(session) -> int:
+    result = await session.execute(insert(File).values(name='a', path='a.txt', created_by=1).returning(File.id))
+    await session.commit()
+    return result.scalar_one()
+
+
+async def _wait_for(condition, timeout: float = 5):
+    async def wait():
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(wait(), timeout)
+
+
+def test_setup_invalidation_registers_publisher_once(publishers):
+    setup_invalidation()
+    setup_invalidation()
+
+    assert publishers == [publish_invalidations]
+
+
+@pytest.mark.anyio
+async def test_flush_publishes_written_ids(session, publishers):
+    setup_invalidation()
+    file_id = await _insert_file(session)
+
+    payloads = asyncio.Queue()
+    listener = await asyncpg.connect(invalidation_bus.dsn)
+    try:
+        await listener.add_listener(
+            config.cache_invalidation_channel, lambda *args: payloads.put_nowait(args[-1])
+        )
+        file = await file_crud.get(session, file_id)
+        file.name = 'b'
+        await session.flush()
+        # до commit'а оповещение не доставляется
+        await asyncio.sleep(0.1)
+        assert payloads.empty()
+
+        await session.commit()
+
+        assert await asyncio.wait_for(payloads.get(), 5) == f'files:{file_id}'
+    finally:
+        await listener.close()
+
+
+@pytest.mark.anyio
+async def test_bus_invalidates_notified_entities(session, publishers):
+    file_id = await _insert_file(session)
+    await file_crud.get(session, file_id)
+    key = file_crud.cache.key(file_id)
+    assert file_crud.cache.backend.get(key) is not None
+
+    bus = InvalidationBus(invalidation_bus.dsn, config.cache_invalidation_channel)
+    await bus.start()
+    try:
+        await file_crud.get(session, file_id)
+        # оповещение от другого процесса: локальный кэш при отправке не сбрасывается
+        await session.run_sync(publish_invalidations, [(File, file_id)])
+        await session.commit()
+
+        await _wait_for(lambda: file_crud.cache.backend.get(key) is None)
+    finally:
+        await bus.stop()
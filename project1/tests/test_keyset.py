@@ -0,0 +1,103 @@
+import datetime
+import decimal
+import uuid
+
+import pytest
+from sqlalchemy import insert, select
+
+from core.crud.base import BaseCrud
+from core.crud.exceptions import LogicException
+from core.crud.filters import FullTextFilter
+from core.crud.keyset import Keyset
+from core.crud.types import PaginationMode
+from models import File
+
+NAMES = ['b', 'a', None, 'b', 'c', None, 'a', 'b', 'd', None, 'c', 'a']
+SORTINGS = [
+    'name', '-name', 'created_by,name', 'name,-created_at', '-created_by,-name', 'created_at,name',
+    'created_by,created_at,name', '-created_at,-created_by'
+]
+
+
+def _keyset(size: int) -> Keyset:
+    return Keyset([(File.id, False)] * size, signature='name:asc')
+
+
+def test_cursor_round_trip():
+    values = (
+        None, 'name', 10, 1.5, True, datetime.datetime(2026, 10, 18, 12, 30), datetime.date(2026, 10, 18),
+        uuid.uuid4(), decimal.Decimal('1.10')
+    )
+    keyset = _keyset(len(values))
+
+    assert tuple(keyset.decode(keyset.encode(values))) == values
+
+
+def test_cursor_for_other_sorting_rejected():
+    cursor = _keyset(2).encode(('a', 1))
+
+    with pytest.raises(ValueError):
+        Keyset([(File.id, False)] * 2, signature='name:desc').decode(cursor)
+    with pytest.raises(ValueError):
+        _keyset(3).decode(cursor)
+
+
+@pytest.mark.parametrize('cursor', ['', 'not a cursor', 'eyJzIjoxfQ'])
+def test_malformed_cursor_rejected(cursor):
+    with pytest.raises(ValueError):
+        _keyset(1).decode(cursor)
+
+
+def test_nullable_ascending_columns_compared_as_row():
+    keyset = Keyset([(File.created_at, False), (File.name, False), (File.id, False)], signature='')
+    query = keyset.seek(select(File.id), [datetime.datetime(2026, 10, 18), 'a', uuid.uuid4()])
+
+    sql = str(query.compile())
+    # один кортеж на весь ключ и отдельные условия для строк с NULL, идущих после курсора
+    assert '(files.created_at, files.name, files.id) > (' in sql
+    assert 'files.created_at IS NULL' in sql and 'files.name IS NULL' in sql
+
+
+@pytest.mark.anyio
+async def test_ranking_filter_rejected_in_cursor_mode():
+    crud = BaseCrud(File, filtering_by=[FullTextFilter().use()])
+
+    with pytest.raises(LogicException):
+        await crud.get_multi(None, 1, 10, pagination_mode=PaginationMode.cursor, search='report')
+
+
+async def _insert_files(session):
+    created_at = datetime.datetime(2026, 10, 18)
+    await session.execute(insert(File), [
+        {
+            'name': name,
+            'path': f'{i}.txt',
+            'created_by': i % 3,
+            # повторяющиеся значения и NULL
+            'created_at': None if i % 4 == 0 else created_at + datetime.timedelta(days=i % 5),
+            'deleted_at': created_at if i == 7 else None
+        }
+        for i, name in enumerate(NAMES)
+    ])
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('sort_by', SORTINGS)
+async def test_cursor_pages_follow_sort_order(session, sort_by):
+    await _insert_files(session)
+    crud = BaseCrud(File, batch_get=False)
+
+    tie_breaker = '-id' if sort_by.split(',')[-1].startswith('-') else 'id'
+    expected = await crud.get_multi(session, 1, None, with_count=False, sort_by=f'{sort_by},{tie_breaker}')
+
+    ids, cursor = [], None
+    while True:
+        page = await crud.get_multi(
+            session, 1, 3, with_count=False, sort_by=sort_by, pagination_mode=PaginationMode.cursor, cursor=cursor
+        )
+        ids.extend(file.id for file in page.objects)
+        if (cursor := page.next_cursor) is None:
+            break
+
+    assert len(expected.objects) == len(NAMES) - 1
+    assert ids == [file.id for file in expected.objects]
@@ -0,0 +1,29 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import insert
+
+from core.crud.base import BaseCrud
+from core.crud.exceptions import ObjectNotExists
+from models import File
+
+
+@pytest.mark.anyio
+async def test_invalid_id_fails_only_its_own_call(session):
+    ids = [
+        (await session.execute(insert(File).values(name=name, path=f'{name}.txt').returning(File.id))).scalar_one()
+        for name in ('a', 'b')
+    ]
+    crud = BaseCrud(File)
+
+    results = await asyncio.gather(
+        crud.get(session, ids[0]),
+        crud.get(session, 'not-a-uuid'),
+        crud.get(session, str(uuid.uuid4())),
+        crud.get(session, ids[1].upper()),
+        return_exceptions=True
+    )
+
+    assert [type(result) for result in results] == [File, ObjectNotExists, ObjectNotExists, File]
+    assert [results[0].id, results[3].id] == ids
@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+from core.crud.retrieve import diff_collection
+from schemas.base import UidMixin
+
+
+def test_diff_collection():
+    existing = [SimpleNamespace(id=str(i)) for i in range(3)]
+    arrived = [UidMixin(id=i) for i in ('1', '3', '2', '4')]
+
+    diff = diff_collection(existing, arrived)
+
+    assert [i.id for i in diff.added] == ['3', '4']
+    assert diff.kept == [existing[1], existing[2]]
+    assert diff.removed == [existing[0]]
+
+
+def test_diff_collection_adds_repeated_items_once():
+    existing = [SimpleNamespace(id='1')]
+    arrived = [UidMixin(id=i) for i in ('2', '1', '2', '1', '3', '2')]
+
+    diff = diff_collection(existing, arrived)
+
+    assert [i.id for i in diff.added] == ['2', '3']
+    assert diff.kept == existing and diff.removed == []
@@ -0,0 +1,219 @@
+import asyncio
+import datetime
+import hashlib
+import io
+
+import asyncpg
+import pytest
+from sqlalchemy import update
+from starlette.datastructures import UploadFile
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from core.config import config, DEFAULT_STORAGE_ROOT
+from core.crud.exceptions import LogicException
+from core.crud.invalidation import invalidation_bus
+from internals.files import FileHandler, file_crud
+from internals.uploads import (
+    UPLOAD_DIRECTORY, upload_session_crud, upload_data_path, parts_count, part_range, received_offset
+)
+from main import app
+from models import UploadSession
+from routes.uploads import upload_part, complete_upload, abort_upload
+from schemas.auth import UserJWTInfo
+from schemas.files import UploadSessionCreate
+from utils.db_session import db_session_manager
+from utils.time_utils import now
+
+USER = UserJWTInfo(id=1)
+CONTENT = b'0123456789' * 100_000
+
+
+@pytest.mark.anyio
+async def test_save_file(file_storage):
+    saved = await FileHandler.save_file(UploadFile('report.txt', io.BytesIO(CONTENT)), USER)
+
+    assert saved.root == DEFAULT_STORAGE_ROOT and saved.orig_name == 'report' and saved.extension == 'txt'
+    assert saved.path.is_relative_to(file_storage) and saved.path.read_bytes() == CONTENT
+    assert saved.size == len(CONTENT) and saved.digest == hashlib.sha256(CONTENT).hexdigest()
+
+
+def _upload(size: int, part_size: int, received_parts=()) -> UploadSession:
+    return UploadSession(size=size, part_size=part_size, received_parts=list(received_parts))
+
+
+def test_part_ranges():
+    upload = _upload(10, 4)
+
+    assert parts_count(upload) == 3
+    assert [part_range(upload, index) for index in range(3)] == [(0, 4), (4, 4), (8, 2)]
+    for index in (-1, 3):
+        with pytest.raises(LogicException):
+            part_range(upload, index)
+
+
+@pytest.mark.parametrize('received_parts, offset', [
+    ((), 0),
+    ((1, 2), 0),
+    ((0, 2), 4),
+    ((1, 0), 8),
+    ((2, 0, 1), 10),
+])
+def test_received_offset(received_parts, offset):
+    assert received_offset(_upload(10, 4, received_parts)) == offset
+
+
+@pytest.fixture
+def client(clean_database, file_storage, monkeypatch):
+    monkeypatch.setattr(config, 'upload_part_size', 4)
+    return TestClient(app)
+
+
+def test_resumable_upload(client, file_storage):
+    upload = client.post('/files/uploads', json={'filename': 'report.txt', 'size': 10}).json()
+    assert (upload['partSize'], upload['partsCount'], upload['offset']) == (4, 3, 0)
+    url = f'/files/uploads/{upload["id"]}'
+
+    # части в произвольном порядке
+    assert client.put(f'{url}/parts/2', data=b'89').json()['digest'] == hashlib.sha256(b'89').hexdigest()
+    assert client.put(f'{url}/parts/0', data=b'0123').status_code == 200
+    upload = client.get(url).json()
+    assert (upload['receivedParts'], upload['offset']) == ([0, 2], 4)
+
+    assert client.post(f'{url}/complete').status_code == 400
+    assert client.put(f'{url}/parts/1', data=b'45').status_code == 400
+    assert client.put(f'{url}/parts/3', data=b'0').status_code == 400
+    assert client.put(f'{url}/parts/1', data=b'4567').status_code == 200
+
+    file = client.post(f'{url}/complete').json()
+    assert file['size'] == 10
+    assert client.get(f'/files/{file["id"]}').content == b'0123456789'
+    # загрузка и её файл удалены
+    assert client.get(url).status_code == 404
+    assert list((file_storage / UPLOAD_DIRECTORY).iterdir()) == []
+
+
+def test_abort_upload(client, file_storage):
+    url = f'/files/uploads/{client.post("/files/uploads", json={"filename": "a.txt", "size": 3}).json()["id"]}'
+
+    assert client.delete(url).status_code == 200
+    assert client.get(url).status_code == 404
+    assert list((file_storage / UPLOAD_DIRECTORY).iterdir()) == []
+
+
+@pytest.mark.anyio
+async def test_remove_expired(session, file_storage):
+    expired, active = [
+        await upload_session_crud.create_session(session, UploadSessionCreate(filename='a.txt', size=3), USER)
+        for _ in range(2)
+    ]
+    expired.created_at = now() - datetime.timedelta(hours=config.upload_session_ttl_hours + 1)
+    await session.flush()
+
+    assert await upload_session_crud.remove_expired(session) == 1
+    assert not upload_data_path(expired).exists() and upload_data_path(active).exists()
+
+
+def _part_request(receive) -> Request:
+    return Request({'type': 'http', 'method': 'PUT', 'headers': []}, receive)
+
+
+async def _body(data: bytes):
+    return {'type': 'http.request', 'body': data, 'more_body': False}
+
+
+async def _database_connections() -> int:
+    connection = await asyncpg.connect(invalidation_bus.dsn)
+    try:
+        return await connection.fetchval(
+            'SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()'
+        )
+    finally:
+        await connection.close()
+
+
+@pytest.mark.anyio
+async def test_part_received_without_database_connection(session, file_storage):
+    upload = await upload_session_crud.create_session(session, UploadSessionCreate(filename='a.txt', size=4), USER)
+    await session.commit()
+    await session.close()
+    connections = []
+
+    async def receive():
+        connections.append(await _database_connections())
+        return await _body(b'0123')
+
+    part = await upload_part(_part_request(receive), upload.id, 0, USER)
+
+    assert part.digest == hashlib.sha256(b'0123').hexdigest()
+    assert connections == [0]
+    assert (await upload_session_crud.get_owned(session, upload.id, USER)).received_parts == [0]
+
+
+async def _get_upload(id_: str) -> UploadSession:
+    async with db_session_manager() as session:
+        return await upload_session_crud.get_owned(session, id_, USER)
+
+
+@pytest.fixture
+async def parts_upload(session, file_storage, monkeypatch) -> UploadSession:
+    monkeypatch.setattr(config, 'upload_part_size', 2)
+    upload = await upload_session_crud.create_session(session, UploadSessionCreate(filename='a.txt', size=4), USER)
+    await session.commit()
+    await upload_part(_part_request(lambda: _body(b'01')), upload.id, 0, USER)
+    return upload
+
+
+@pytest.mark.anyio
+async def test_completion_rejected_while_part_written(parts_upload):
+    await upload_part(_part_request(lambda: _body(b'xx')), parts_upload.id, 1, USER)
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def receive():
+        started.set()
+        await release.wait()
+        return await _body(b'23')
+
+    writing = asyncio.create_task(upload_part(_part_request(receive), parts_upload.id, 1, USER))
+    await started.wait()
+    with pytest.raises(LogicException):
+        async with db_session_manager() as session:
+            await complete_upload(parts_upload.id, session, USER)
+
+    release.set()
+    await writing
+    async with db_session_manager() as session:
+        file = await complete_upload(parts_upload.id, session, USER)
+        stored = await file_crud.get(session, file.id)
+        location = await FileHandler.locate_file(stored.path, stored.storage_root)
+    # содержимое повторно записанной части
+    assert location.path.read_bytes() == b'0123'
+
+
+@pytest.mark.anyio
+async def test_parts_rejected_while_completing(parts_upload):
+    async with db_session_manager() as session:
+        await session.execute(update(UploadSession).values(completing=True))
+
+    with pytest.raises(LogicException):
+        await upload_part(_part_request(lambda: _body(b'23')), parts_upload.id, 1, USER)
+    with pytest.raises(LogicException):
+        async with db_session_manager() as session:
+            await abort_upload(parts_upload.id, session, USER)
+    assert (await _get_upload(parts_upload.id)).writing_parts == 0
+
+
+@pytest.mark.anyio
+async def test_failed_completion_cancelled(parts_upload, monkeypatch):
+    await upload_part(_part_request(lambda: _body(b'23')), parts_upload.id, 1, USER)
+
+    async def fail(*args):
+        raise OSError('disk failure')
+
+    monkeypatch.setattr(FileHandler, 'complete_upload', fail)
+    with pytest.raises(OSError):
+        async with db_session_manager() as session:
+            await complete_upload(parts_upload.id, session, USER)
+
+    upload = await _get_upload(parts_upload.id)
+    assert not upload.completing and upload.received_parts == [0, 1]